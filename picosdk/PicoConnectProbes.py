@@ -7,10 +7,9 @@ file for use with various PicoScope oscilloscopes driver API functions.
 """
 
 from ctypes import *
-from picosdk.constants import make_enum
-from picosdk.library import Library
+from picosdk.constants import make_enum, HeaderNamespace
 
-class PicoConnectProbeslib(Library):
+class PicoConnectProbeslib(HeaderNamespace):
     def __init__(self):
         super(PicoConnectProbeslib, self).__init__("picoConnectProbes")
 
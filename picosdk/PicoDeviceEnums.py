@@ -8,12 +8,15 @@ functions.
 """
 
 from ctypes import *
-from picosdk.constants import make_enum
-from picosdk.library import Library
+from picosdk.constants import make_enum, HeaderNamespace, PICO_INFO, PICO_STATUS, PICO_STATUS_LOOKUP
 
-class PicoEnumlib(Library):
+class PicoEnumlib(HeaderNamespace):
     def __init__(self):
-        super(PicoEnumlib, self).__init__("ps6000a")
+        super(PicoEnumlib, self).__init__("PicoDeviceEnums")
+        # the shared status and info macros, as exposed on every Library.
+        self.PICO_INFO = PICO_INFO
+        self.PICO_STATUS = PICO_STATUS
+        self.PICO_STATUS_LOOKUP = PICO_STATUS_LOOKUP
 
 
 picoEnum  = PicoEnumlib()
@@ -8,11 +8,11 @@ functions.
 """
 
 from ctypes import *
-from picosdk.library import Library
+from picosdk.constants import HeaderNamespace
 
-class PicoStructlib(Library):
+class PicoStructlib(HeaderNamespace):
     def __init__(self):
-        super(PicoStructlib, self).__init__("ps6000a")
+        super(PicoStructlib, self).__init__("PicoDeviceStructs")
 
 
 picoStruct = PicoStructlib()
@@ -0,0 +1,224 @@
+#
+# Copyright (C) 2024 Pico Technology Ltd. See LICENSE file for terms.
+#
+"""
+Continuous block acquisition which overlaps reading out each block with capturing the next.
+
+AsyncBlockAcquisition captures into a ring of memory segments, each with its own preallocated set of buffers. As soon
+as a block is captured, the next block is started in the next free segment, and the finished one is read with
+get_values_async (ps6000a GetValuesAsync) while the device captures. Completed blocks are delivered through a queue,
+and each buffer set is only reused once the consumer has released it.
+"""
+from __future__ import print_function
+import collections
+import threading
+import time
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+import numpy
+from picosdk.errors import FeatureNotSupportedError, InvalidCaptureParameters
+
+
+"""AcquiredBlock: one block captured by an AsyncBlockAcquisition.
+index = the number of blocks captured before this one.
+segment = the memory segment (and buffer set) it was captured into.
+buffers = a dict of int16 arrays of raw ADC counts, by channel name.
+overflow = a dict of the channels which overflowed (by name.)
+no_of_samples = the number of samples read into each buffer.
+timestamp = the time (from time.time()) at which the driver signalled that the block was captured."""
+AcquiredBlock = collections.namedtuple('AcquiredBlock', ['index', 'segment', 'buffers', 'overflow', 'no_of_samples',
+                                                         'timestamp'])
+
+
+class _QueueEvent(object):
+    """Looks like the threading.Event passed to Library.run_block, but puts a message on a queue when set."""
+    def __init__(self, events, message):
+        self._events = events
+        self._message = message
+
+    def set(self):
+        self._events.put((self._message, time.time()))
+
+    def clear(self):
+        pass
+
+
+class AsyncBlockAcquisition(object):
+    """Captures blocks continuously, reading out each one while the next is captured.
+    Configure the channels, timebase and trigger on the device first (e.g. with the driver functions directly), then:
+
+        with AsyncBlockAcquisition(device, ['A', 'B'], 0, 10000, timebase_id, ring_size=4) as acquisition:
+            for block in acquisition:
+                process(block.buffers)
+                acquisition.release(block)
+
+    ring_size: the number of memory segments and buffer sets to rotate through. The device can keep capturing while
+        up to ring_size - 1 blocks are being transferred or held by the consumer.
+    max_blocks: optionally, stop after capturing this many blocks.
+    Blocks which are not released hold up the acquisition: once every buffer set is in use, no more blocks are
+    captured until one is released."""
+    def __init__(self, device, channels, pre_trigger_samples, post_trigger_samples, timebase_id, ring_size=2,
+                 max_blocks=None):
+        driver = device.driver
+        if not driver.can_get_values_async() or not driver.can_signal_block_ready():
+            raise FeatureNotSupportedError("%s devices cannot read out blocks asynchronously." % driver.name)
+        self.device = device
+        self.channels = list(channels)
+        self.pre_trigger_samples = pre_trigger_samples
+        self.post_trigger_samples = post_trigger_samples
+        self.timebase_id = timebase_id
+        self.ring_size = ring_size
+        self.max_blocks = max_blocks
+        self.no_of_samples = pre_trigger_samples + post_trigger_samples
+
+        max_samples = device.memory_segments(ring_size)
+        if self.no_of_samples > max_samples:
+            raise InvalidCaptureParameters("%s samples do not fit in each of %s memory segments (at most %s)" % (
+                                            self.no_of_samples, ring_size, max_samples))
+        driver.clear_data_buffers(device)
+        self._buffer_sets = []
+        for segment_index in range(ring_size):
+            buffers = {channel: numpy.empty(self.no_of_samples, numpy.dtype('int16')) for channel in self.channels}
+            driver.set_data_buffers(device, buffers, segment_index)
+            self._buffer_sets.append(buffers)
+
+        self.blocks = queue.Queue()
+        self.error = None
+        # driver callbacks and releases are all handled on the acquisition thread, in the order they arrive.
+        self._events = queue.Queue()
+        self._block_ready = _QueueEvent(self._events, 'block_ready')
+        self._data_ready = driver.DataReadyType(self._on_data_ready)
+        self._thread = None
+
+        self._free = collections.deque(range(ring_size))
+        self._armed = None
+        self._captured = collections.deque()
+        self._reading = None
+        self._started = 0
+        self._delivered = 0
+        self._stopping = False
+        self._start_time = None
+
+    def _on_data_ready(self, handle, status, no_of_samples, overflow, parameter):
+        self._events.put(('data_ready', status, no_of_samples, overflow))
+
+    def start(self):
+        """start capturing, on a background thread."""
+        self._start_time = time.time()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def _arm(self):
+        """start the next capture, if a buffer set is free."""
+        if self._armed is not None or not self._free or self._stopping:
+            return
+        if self.max_blocks is not None and self._started >= self.max_blocks:
+            return
+        segment_index = self._free.popleft()
+        self.device.driver.run_block(self.device,
+                                     self.pre_trigger_samples,
+                                     self.post_trigger_samples,
+                                     self.timebase_id,
+                                     segment_index=segment_index,
+                                     ready_event=self._block_ready)
+        self._armed = (self._started, segment_index)
+        self._started += 1
+
+    def _read_next(self):
+        """start transferring the oldest captured block, unless a transfer is already in progress."""
+        if self._reading is not None or not self._captured:
+            return
+        self._reading = self._captured.popleft()
+        self.device.driver.get_values_async(self.device, self.no_of_samples, self._reading[1], self._data_ready)
+
+    def _finished(self):
+        return self._armed is None and self._reading is None and not self._captured and (
+            self._stopping or (self.max_blocks is not None and self._started >= self.max_blocks))
+
+    def _run(self):
+        try:
+            self._arm()
+            while not self._finished():
+                message = self._events.get()
+                if message[0] == 'block_ready':
+                    self._captured.append(self._armed + (message[1],))
+                    self._armed = None
+                    # capture the next block while this one is transferred.
+                    self._arm()
+                    self._read_next()
+                elif message[0] == 'data_ready':
+                    _, status, no_of_samples, overflow = message
+                    if status != self.device.driver.PICO_STATUS['PICO_OK']:
+                        raise InvalidCaptureParameters("get_values_async failed (status %s)" % status)
+                    self._deliver(no_of_samples, overflow)
+                    self._read_next()
+                elif message[0] == 'release':
+                    self._free.append(message[1])
+                    self._arm()
+                elif message[0] == 'stop':
+                    self._stopping = True
+                    if self._armed is not None:
+                        # the block will never be ready.
+                        self.device.driver.stop(self.device)
+                        self._free.append(self._armed[1])
+                        self._armed = None
+        except Exception as e:
+            # not just PicoErrors: whatever stopped the thread must reach the consumer, not look like a normal end.
+            self.error = e
+        finally:
+            self.blocks.put(None)
+
+    def _deliver(self, no_of_samples, overflow_flags):
+        index, segment_index, timestamp = self._reading
+        self._reading = None
+        buffers = self._buffer_sets[segment_index]
+        overflow = {channel: True for channel in self.channels
+                    if overflow_flags & (1 << self.device.driver.PICO_CHANNEL[channel])}
+        self.blocks.put(AcquiredBlock(index, segment_index, buffers, overflow, no_of_samples, timestamp))
+        self._delivered += 1
+
+    def release(self, block):
+        """return a block's buffer set to the acquisition, to capture into again. Don't use its buffers afterwards."""
+        self._events.put(('release', block.segment))
+
+    def get(self, timeout=None):
+        """Returns: the next AcquiredBlock, or None if the acquisition has finished.
+        raises: the error which stopped the acquisition, if any; queue.Empty if timeout (in seconds) passes first."""
+        block = self.blocks.get(timeout=timeout)
+        if block is None:
+            # leave the end marker for any other consumers.
+            self.blocks.put(None)
+            if self.error is not None:
+                raise self.error
+        return block
+
+    def __iter__(self):
+        while True:
+            block = self.get()
+            if block is None:
+                return
+            yield block
+
+    def stop(self):
+        """stop capturing, and wait for any blocks already captured to be delivered."""
+        if self._thread is None:
+            return
+        self._events.put(('stop',))
+        self._thread.join()
+        self._thread = None
+
+    def blocks_per_second(self):
+        """Returns: the number of blocks delivered per second since start, or None if none have been delivered."""
+        if not self._delivered:
+            return None
+        return self._delivered / (time.time() - self._start_time)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
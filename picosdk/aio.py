@@ -0,0 +1,163 @@
+#
+# Copyright (C) 2024 Pico Technology Ltd. See LICENSE file for terms.
+#
+"""
+asyncio counterparts of the blocking capture methods on Device and CaptureSession.
+
+Driver callbacks (e.g. BlockReady) are bridged into the event loop with call_soon_threadsafe, and the blocking driver
+calls (arming, reading out and converting buffers) are run on an executor, so one event loop can drive many devices
+at once without a thread per device.
+
+Note: this module needs Python 3.6 or later. It is only imported when one of the *_async methods is used, so the rest
+of picosdk still works on older versions.
+"""
+
+import asyncio
+import time
+
+from picosdk.device import CaptureSession, RapidBlockSession
+
+
+# get_running_loop is new in Python 3.7.
+_get_running_loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)
+
+
+class LoopEvent(object):
+    """Looks like the threading.Event passed to Library.run_block, but wakes an asyncio future instead.
+    set() may be called from any thread (e.g. a driver callback thread). Create a new one for each wait."""
+    def __init__(self, loop):
+        self._loop = loop
+        self._future = loop.create_future()
+
+    def set(self):
+        self._loop.call_soon_threadsafe(self._set_result)
+
+    def _set_result(self):
+        if not self._future.done():
+            self._future.set_result(None)
+
+    def clear(self):
+        # each LoopEvent is only waited on once.
+        pass
+
+    def is_set(self):
+        return self._future.done()
+
+    async def wait(self, timeout=None):
+        """Returns: True if the event was set, or False if timeout (seconds) passed first."""
+        try:
+            await asyncio.wait_for(asyncio.shield(self._future), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+async def wait_for_block(device, approx_time_busy, ready_event=None, executor=None):
+    """the asyncio counterpart of Device._wait_for_block: wait for the LoopEvent if the driver will set it, otherwise
+    poll is_ready with exponential back off."""
+    loop = _get_running_loop()
+    if ready_event is not None:
+        while not await ready_event.wait(max(approx_time_busy * 2, 1.)):
+            if await loop.run_in_executor(executor, device.driver.is_ready, device):
+                return
+        return
+
+    if approx_time_busy > 0:
+        await asyncio.sleep(approx_time_busy)
+    interval = device.MIN_POLL_INTERVAL
+    while not await loop.run_in_executor(executor, device.driver.is_ready, device):
+        await asyncio.sleep(interval)
+        interval = min(interval * 2, device.MAX_POLL_INTERVAL)
+
+
+async def capture_async(session, raw=False, executor=None):
+    """capture one block with a CaptureSession (or one set of blocks with a RapidBlockSession), without blocking the
+    event loop. arguments and result are as for the session's capture."""
+    loop = _get_running_loop()
+    ready_event = None
+    if session.device.driver.can_signal_block_ready():
+        ready_event = LoopEvent(loop)
+
+    start = time.time()
+    approx_time_busy = await loop.run_in_executor(executor, session._run_block, ready_event)
+    wait_start = time.time()
+    await wait_for_block(session.device, approx_time_busy, ready_event, executor)
+    wait_time = time.time() - wait_start
+    result = await loop.run_in_executor(executor, session._read, raw)
+    session._record(start, wait_time)
+    return result
+
+
+async def capture_block_async(device, timebase_options, channel_configs=(), executor=None):
+    """the asyncio counterpart of Device.capture_block."""
+    loop = _get_running_loop()
+    session = await loop.run_in_executor(executor, CaptureSession, device, timebase_options, channel_configs)
+    return await capture_async(session, executor=executor)
+
+
+async def capture_rapid_block_async(device, number_segments, timebase_options, channel_configs=(), raw=True,
+                                    executor=None):
+    """the asyncio counterpart of Device.capture_rapid_block."""
+    loop = _get_running_loop()
+    session = await loop.run_in_executor(executor, RapidBlockSession, device, number_segments, timebase_options,
+                                         channel_configs)
+    return await capture_async(session, raw=raw, executor=executor)
+
+
+async def iter_captures(session, count=None, raw=False, executor=None):
+    """capture blocks repeatedly with a CaptureSession or RapidBlockSession, yielding the result of each (as for the
+    session's capture.)
+    count: the number of blocks to capture, or None to carry on until the caller stops iterating.
+    Note: each capture refills the same arrays, so copy them if you need them after the next iteration."""
+    captured = 0
+    while count is None or captured < count:
+        yield await capture_async(session, raw=raw, executor=executor)
+        captured += 1
+
+
+async def capture_chunks_async(session, executor=None):
+    """capture with a ChunkedRapidBlockSession, yielding each RapidBlockChunk as it is read out (as for the session's
+    capture), without blocking the event loop."""
+    loop = _get_running_loop()
+    ready_event = None
+    if session.device.driver.can_signal_block_ready():
+        ready_event = LoopEvent(loop)
+
+    start = time.time()
+    approx_time_busy = await loop.run_in_executor(executor, session._run_block, ready_event)
+    wait_start = time.time()
+    await wait_for_block(session.device, approx_time_busy, ready_event, executor)
+    wait_time = time.time() - wait_start
+    try:
+        for i, (from_segment, to_segment) in enumerate(session._windows()):
+            yield await loop.run_in_executor(executor, session._read_chunk, i % session.pool_size, from_segment,
+                                             to_segment)
+    finally:
+        await loop.run_in_executor(executor, session.device.driver.stop, session.device)
+        session._record(start, wait_time)
+
+
+async def iter_stream(stream, executor=None):
+    """yield each StreamChunk of a Stream (e.g. from Device.stream), without blocking the event loop while waiting for
+    the samples. The stream's polling thread wakes the loop with call_soon_threadsafe as each chunk completes, so no
+    executor thread waits for them; only stopping the stream at the end runs on executor. As for iterating the stream
+    directly, each chunk is only valid until the next one is requested."""
+    loop = _get_running_loop()
+    ready = asyncio.Event()
+    stream.set_listener(lambda: loop.call_soon_threadsafe(ready.set))
+    try:
+        while True:
+            # clear before looking, so a chunk completing in between still wakes us.
+            ready.clear()
+            chunk = stream.next_chunk(block=False)
+            if chunk is None:
+                break
+            if chunk is False:
+                await ready.wait()
+                continue
+            yield chunk
+    finally:
+        stream.set_listener(None)
+    await loop.run_in_executor(executor, stream.stop)
+    if stream.error is not None:
+        raise stream.error
@@ -0,0 +1,172 @@
+#
+# Copyright (C) 2024 Pico Technology Ltd. See LICENSE file for terms.
+#
+"""
+An on-disk store of rapid block segments, which opens instantly however large it is.
+
+A capture store is a directory holding one .npy file per channel, shaped (segments, samples) of int16 ADC counts, a
+times.npy with the trigger time of each segment, and an index.npy with its trigger offset and overflow flags, plus a
+metadata.json with the channel ranges, sample interval and maximum ADC count. CaptureStoreWriter appends segments as
+they are read out (e.g. the chunks of a ChunkedRapidBlockSession), and CaptureStore memory-maps the files, so reading
+a store only touches the segments you use. The segments must be appended in order of trigger time, so a time range
+can be found by binary search.
+"""
+from __future__ import print_function
+import json
+import os
+import numpy
+from picosdk.errors import ArgumentOutOfRangeError
+from picosdk.recorder import NpyAppender
+
+
+def _index_dtype(no_of_channels):
+    """the index records: the offset of each segment's trigger point from its trigger sample (in seconds, or NaN if
+    unknown), and whether each channel overflowed. (The trigger times are kept in their own file, so that they can be
+    searched in place: a field of these records would not be contiguous, or even aligned.)"""
+    return numpy.dtype([('trigger_offset', '<f8'), ('overflow', '?', (no_of_channels,))])
+
+
+def _times_path(path):
+    return os.path.join(path, 'times.npy')
+
+
+def _channel_path(path, channel):
+    return os.path.join(path, "channel_%s.npy" % channel)
+
+
+class CaptureStoreWriter(object):
+    """Appends rapid block segments to a new capture store, in the directory at path.
+    usage:
+        with CaptureStoreWriter.for_session('captures', session) as store:
+            for chunk in session.capture():
+                store.append_chunk(chunk, trigger_times[chunk.segments.start:chunk.segments.stop])
+        store = CaptureStore('captures')
+    channels: the names of the channels, in the order of the first axis of the data appended.
+    no_of_samples: the number of samples in each segment.
+    reserve_segments: optionally, the expected number of segments, to allocate the files up front."""
+    def __init__(self, path, channels, no_of_samples, channel_ranges=None, sample_interval=None, max_adc=None,
+                 reserve_segments=None, metadata=None):
+        self.path = path
+        self.channels = tuple(channels)
+        self.no_of_samples = no_of_samples
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.metadata = dict(metadata or {})
+        self.metadata.update({'channels': list(self.channels),
+                              'no_of_samples': no_of_samples,
+                              'channel_ranges': dict(channel_ranges or {}),
+                              'sample_interval': sample_interval,
+                              'max_adc': max_adc})
+        with open(os.path.join(path, 'metadata.json'), 'w') as f:
+            json.dump(self.metadata, f, indent=2)
+        self._channel_files = [NpyAppender(_channel_path(path, channel), numpy.int16, (no_of_samples,),
+                                           reserve_rows=reserve_segments) for channel in self.channels]
+        self._times_file = NpyAppender(_times_path(path), numpy.float64, reserve_rows=reserve_segments)
+        self._index_file = NpyAppender(os.path.join(path, 'index.npy'), _index_dtype(len(self.channels)),
+                                       reserve_rows=reserve_segments)
+        self._last_time = -numpy.inf
+
+    @classmethod
+    def for_session(cls, path, session, **kwargs):
+        """Returns: a CaptureStoreWriter for the segments of a RapidBlockSession (or ChunkedRapidBlockSession), saving
+        its channels, channel ranges, sample interval and maximum ADC count."""
+        return cls(path, session.channels, session.no_of_samples, channel_ranges=session.channel_ranges,
+                   sample_interval=session.timebase_info.time_interval, max_adc=session.max_adc, **kwargs)
+
+    @property
+    def segments(self):
+        """the number of segments appended so far."""
+        return self._index_file.rows
+
+    def append(self, data, times, overflow=None, trigger_offsets=None):
+        """append segments to the store.
+        data: a (channels, segments, samples) int16 array of raw ADC counts.
+        times: the trigger time of each segment (in seconds), in order, and after those already in the store.
+        overflow: optionally, a (channels, segments) bool array, which is True where the channel overflowed.
+        trigger_offsets: optionally, the offset (in seconds) of each segment's trigger point from its trigger sample."""
+        times = numpy.asarray(times, numpy.float64)
+        if data.shape[0] != len(self.channels) or data.shape[1] != len(times):
+            raise ArgumentOutOfRangeError("expected data for %s channels and %s segments, not %s" % (
+                len(self.channels), len(times), data.shape[:2]))
+        if len(times) and (times[0] < self._last_time or numpy.any(numpy.diff(times) < 0)):
+            raise ArgumentOutOfRangeError("segments must be appended in order of trigger time")
+        index = numpy.zeros(len(times), self._index_file.dtype)
+        index['trigger_offset'] = numpy.nan if trigger_offsets is None else trigger_offsets
+        if overflow is not None:
+            index['overflow'] = numpy.transpose(overflow)
+        for channel_file, channel_data in zip(self._channel_files, data):
+            channel_file.append(channel_data)
+        self._index_file.append(index)
+        self._times_file.append(times)
+        if len(times):
+            self._last_time = times[-1]
+
+    def append_chunk(self, chunk, times):
+        """append the segments of a RapidBlockChunk (from ChunkedRapidBlockSession.capture), with their trigger times
+        (in seconds.)"""
+        self.append(chunk.data, times, chunk.overflow, chunk.trigger_offsets)
+
+    def flush(self):
+        """make the segments appended so far visible to readers opening the store."""
+        for appender in self._appenders():
+            appender.flush()
+
+    def close(self):
+        for appender in self._appenders():
+            appender.close()
+
+    def _appenders(self):
+        return self._channel_files + [self._index_file, self._times_file]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class CaptureStore(object):
+    """A capture store written by CaptureStoreWriter, opened read-only. Nothing is read until it is used: each
+    channel's segments, the trigger times and the index, are memory maps.
+    store[channel] is the (segments, samples) array of a channel, so e.g. store['A'][1000:2000] is a view of those
+    segments, and store.segments_between(t0, t1) finds the segments which triggered between two times."""
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'metadata.json')) as f:
+            self.metadata = json.load(f)
+        self.channels = tuple(self.metadata['channels'])
+        self.channel_ranges = self.metadata['channel_ranges']
+        self.sample_interval = self.metadata['sample_interval']
+        self.max_adc = self.metadata['max_adc']
+        self.index = numpy.load(os.path.join(path, 'index.npy'), mmap_mode='r')
+        self._times = numpy.load(_times_path(path), mmap_mode='r')
+        self._data = {channel: numpy.load(_channel_path(path, channel), mmap_mode='r') for channel in self.channels}
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, channel):
+        return self._data[channel]
+
+    @property
+    def times(self):
+        """the trigger time of each segment (in seconds.)"""
+        return self._times
+
+    @property
+    def overflow(self):
+        """a (segments, channels) bool array, which is True where the channel overflowed during that segment."""
+        return self.index['overflow']
+
+    def segments_between(self, start_time, end_time):
+        """Returns: a slice of the segments which triggered at or after start_time, and before end_time (in seconds.)
+        This is a binary search of the memory-mapped trigger times, so it only reads O(log n) of them."""
+        times = self.times
+        return slice(int(numpy.searchsorted(times, start_time, 'left')),
+                     int(numpy.searchsorted(times, end_time, 'left')))
+
+    def between(self, start_time, end_time):
+        """Returns: a dict of (segments, samples) views of each channel, for the segments which triggered at or after
+        start_time, and before end_time (in seconds.)"""
+        segments = self.segments_between(start_time, end_time)
+        return {channel: data[segments] for channel, data in self._data.items()}
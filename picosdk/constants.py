@@ -40,6 +40,16 @@ def make_enum(members):
     return enum
 
 
+class HeaderNamespace(object):
+    """Holds the enums and structs from a shared Pico C header (e.g. PicoDeviceEnums.h) as attributes.
+    Unlike a Library, it never loads a driver, so the definitions can be used with any driver which shares the header."""
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return "picosdk %s definitions" % self.name
+
+
 PICO_STATUS = {
     "PICO_OK": 0x00000000,
     "PICO_MAX_UNITS_OPENED": 0x00000001,
@@ -328,3 +338,6 @@ PICO_INFO = {
     "PICO_SHADOW_CAL": 0x0000000C,
     "PICO_IPP_VERSION": 0x0000000D,
 }
+
+# the length of each of the drivers' time units (PICO_FS, PICO_PS, PICO_NS, PICO_US, PICO_MS and PICO_S), in seconds.
+SECONDS_PER_TIME_UNIT = (1e-15, 1e-12, 1e-9, 1e-6, 1e-3, 1.)
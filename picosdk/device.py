@@ -10,9 +10,12 @@ from __future__ import print_function
 import collections
 import numpy
 import math
+import threading
 import time
 from picosdk.errors import DeviceCannotSegmentMemoryError, InvalidTimebaseError, ClosedDeviceError, \
-    NoChannelsEnabledError, NoValidTimebaseForOptionsError
+    NoChannelsEnabledError, NoValidTimebaseForOptionsError, FeatureNotSupportedError
+from picosdk.functions import adc2mVLookup, CacheInfo
+from picosdk.streaming import Stream, PooledStream
 
 
 def requires_open(error_message="This operation requires a device to be connected."):
@@ -63,6 +66,16 @@ class Device(object):
         self._channel_ranges = {}
         self._channel_offsets = {}
 
+        # None means "as opened" for resolution, and "not set through this object" for memory segments.
+        self._resolution = None
+        self._memory_segments = None
+        self._max_samples_per_segment = None
+
+        # find_timebase results, keyed by the options and the device configuration they depend on.
+        self._timebase_cache = {}
+        self._timebase_cache_hits = 0
+        self._timebase_cache_misses = 0
+
     @requires_open("The device either did not initialise correctly or has already been closed.")
     def close(self):
         self.driver.close_unit(self)
@@ -106,6 +119,25 @@ class Device(object):
         self._channel_offsets[name] = channel_config.analog_offset
         return self._channel_ranges[name]
 
+    @requires_open()
+    def set_resolution(self, resolution):
+        """set the vertical resolution of a flexible resolution device (see Library.set_resolution.)"""
+        self.driver.set_resolution(self, resolution)
+        if resolution != self._resolution:
+            self._resolution = resolution
+            # the memory per segment can depend on the resolution.
+            self._memory_segments = None
+            self._max_samples_per_segment = None
+
+    @requires_open()
+    def memory_segments(self, number_segments):
+        """divide the device memory into number_segments segments.
+        returns: the maximum number of samples in each segment."""
+        if number_segments != self._memory_segments:
+            self._max_samples_per_segment = self.driver.memory_segments(self, number_segments).value
+            self._memory_segments = number_segments
+        return self._max_samples_per_segment
+
     @requires_open()
     def set_channels(self, *channel_configs):
         """ set_channels(self, *channel_configs)
@@ -155,100 +187,617 @@ class Device(object):
                 return False
         return True
 
+    def _first_timebase(self, timebase_options):
+        """walk up from timebase 0 to the first timebase the device accepts with its current settings.
+        returns: the TimebaseInfo of that timebase."""
+        timebase_id = 0
+        while timebase_id <= self.driver.MAX_TIMEBASE_ID:
+            try:
+                return self.driver.get_timebase(self, timebase_id, 0, timebase_options.oversample)
+            except InvalidTimebaseError:
+                timebase_id += 1
+        raise NoValidTimebaseForOptionsError("the device doesn't accept any timebase with these settings.")
+
+    def _probe_timebase(self, timebase_options, timebase_id):
+        """returns: the TimebaseInfo for timebase_id, or None if the device doesn't accept it."""
+        try:
+            return self.driver.get_timebase(self, timebase_id, 0, timebase_options.oversample)
+        except InvalidTimebaseError:
+            return None
+
+    def _search_collection_time(self, timebase_options, first_info):
+        """find the first timebase which can collect for at least timebase_options.min_collection_time.
+        The collection time grows with the timebase id, so we start from an estimate (from the driver's
+        timebase_formula), gallop away from it in whichever direction it was wrong, then binary search between the
+        fastest timebase we know is too short and the slowest we've seen to be long enough. This costs O(log n) calls
+        to get_timebase (and very few when the estimate is close), rather than the n calls of walking up one id at a
+        time.
+        returns: that timebase's TimebaseInfo, or None if even the slowest timebase is too short."""
+        def long_enough(info):
+            # timebases beyond the last valid one count as "long enough", so that the search stops there.
+            return info is None or info.max_samples * info.time_interval >= timebase_options.min_collection_time
+
+        max_id = self.driver.MAX_TIMEBASE_ID
+        low = first_info.timebase_id
+        if low >= max_id:
+            return None
+        formula = self.driver.timebase_formula(self._resolution)
+        if formula is not None and first_info.max_samples > 0:
+            estimate = formula.timebase_id(timebase_options.min_collection_time / first_info.max_samples)
+        else:
+            estimate = low + 1
+        high = min(max(estimate, low + 1), max_id)
+        high_info = self._probe_timebase(timebase_options, high)
+        step = 1
+        if long_enough(high_info):
+            # gallop down, in case the estimate was too slow.
+            while high - step > low:
+                info = self._probe_timebase(timebase_options, high - step)
+                if not long_enough(info):
+                    low = high - step
+                    break
+                high, high_info = high - step, info
+                step *= 2
+        else:
+            # gallop up, because the estimate was too fast.
+            while not long_enough(high_info):
+                if high == max_id:
+                    return None
+                low = high
+                high = min(high + step, max_id)
+                step *= 2
+                high_info = self._probe_timebase(timebase_options, high)
+
+        while high - low > 1:
+            middle = (low + high) // 2
+            middle_info = self._probe_timebase(timebase_options, middle)
+            if long_enough(middle_info):
+                high, high_info = middle, middle_info
+            else:
+                low = middle
+        return high_info
+
+    def _timebase_cache_key(self, timebase_options):
+        return (timebase_options,
+                frozenset(self._channel_ranges),
+                self._resolution,
+                self._memory_segments)
+
     @requires_open()
     def find_timebase(self, timebase_options):
-        timebase_id = 0
+        """find the fastest timebase which meets all of the given TimebaseOptions.
+        Results are cached for the enabled channels, resolution and memory segments set through this object, so
+        repeating a search with the same configuration makes no calls to the driver.
+        returns: a TimebaseInfo.
+        raises: NoValidTimebaseForOptionsError if no timebase can meet the options."""
+        key = self._timebase_cache_key(timebase_options)
+        try:
+            timebase_info = self._timebase_cache[key]
+        except KeyError:
+            self._timebase_cache_misses += 1
+        else:
+            self._timebase_cache_hits += 1
+            return timebase_info
+        timebase_info = self._find_timebase(timebase_options)
+        self._timebase_cache[key] = timebase_info
+        return timebase_info
+
+    def timebase_cache_info(self):
+        """Returns: a CacheInfo of the find_timebase cache's hits and misses."""
+        return CacheInfo(self._timebase_cache_hits, self._timebase_cache_misses, None, len(self._timebase_cache))
+
+    def clear_timebase_cache(self):
+        """forget the cached find_timebase results, e.g. after configuring the device directly through the driver."""
+        self._timebase_cache.clear()
+        self._timebase_cache_hits = 0
+        self._timebase_cache_misses = 0
+
+    def _find_timebase(self, timebase_options):
         # quickly validate that the request is not impossible.
         if self._timebase_options_are_impossible(timebase_options):
             raise NoValidTimebaseForOptionsError()
-        # TODO binary search?
+        timebase_info = self._first_timebase(timebase_options)
+        if timebase_options.min_collection_time is not None and not self._validate_timebase(timebase_options,
+                                                                                             timebase_info):
+            timebase_info = self._search_collection_time(timebase_options, timebase_info)
+            if timebase_info is None:
+                raise NoValidTimebaseForOptionsError("no timebase can collect for %ss" % (
+                    timebase_options.min_collection_time,))
+        # slower timebases only have longer intervals, so if this one is too slow we're done. Otherwise, carry on
+        # walking up one timebase at a time until the number of samples fits.
         last_error = None
-        found_one_good = False
         while True:
+            if timebase_options.max_time_interval is not None and \
+                    timebase_info.time_interval > timebase_options.max_time_interval:
+                break
+            if self._validate_timebase(timebase_options, timebase_info):
+                return timebase_info
             try:
-                timebase_info = self.driver.get_timebase(self, timebase_id, 0, timebase_options.oversample)
-                found_one_good = True
-                if self._validate_timebase(timebase_options, timebase_info):
-                    return timebase_info
+                timebase_info = self.driver.get_timebase(self, timebase_info.timebase_id + 1, 0,
+                                                         timebase_options.oversample)
             except InvalidTimebaseError as e:
-                if found_one_good:
-                    # we won't find a valid timebase.
-                    last_error = e
-                    break
-            timebase_id += 1
+                # we won't find a valid timebase.
+                last_error = e
+                break
         args = ()
         if last_error is not None:
-            args = (last_error.args[0],)
+            args = last_error.args[:1]
         raise NoValidTimebaseForOptionsError(*args)
 
+    # polling is_ready starts this often (in seconds), and backs off to at most this often.
+    MIN_POLL_INTERVAL = 50e-6
+    MAX_POLL_INTERVAL = 20e-3
+
+    def _wait_for_block(self, approx_time_busy, ready_event=None):
+        """wait for a block capture started with run_block to finish.
+        approx_time_busy: the time returned by run_block. The device won't be ready any sooner.
+        ready_event: the event passed to run_block, if the driver will signal it."""
+        if ready_event is not None:
+            # The driver calls back as soon as the block is ready. We still check is_ready every so often (and after a
+            # trigger which never comes, we keep waiting, as polling would.)
+            while not ready_event.wait(max(approx_time_busy * 2, 1.)):
+                if self.driver.is_ready(self):
+                    return
+            return
+
+        # Without a callback, don't poll until the device could be ready, then poll with exponential back off: quickly
+        # for short captures, but without hammering the USB connection while waiting for a trigger.
+        if approx_time_busy > 0:
+            time.sleep(approx_time_busy)
+        interval = self.MIN_POLL_INTERVAL
+        while not self.driver.is_ready(self):
+            time.sleep(interval)
+            interval = min(interval * 2, self.MAX_POLL_INTERVAL)
+
+    @requires_open()
+    def capture_session(self, timebase_options, channel_configs=(), overlapped=False):
+        """device.capture_session(timebase_options, channel_configs)
+        Configure the device for a block capture once, returning a CaptureSession which can then capture repeatedly.
+        timebase_options and channel_configs are as for capture_block.
+        overlapped: if True, the driver reads each block as soon as it is captured (see CaptureSession.)"""
+        return CaptureSession(self, timebase_options, channel_configs, overlapped=overlapped)
+
+    def capture_block_async(self, timebase_options, channel_configs=(), executor=None):
+        """a coroutine counterpart of capture_block, for use with asyncio (see picosdk.aio.)
+        usage: times, voltages, overflow_warnings = await device.capture_block_async(timebase_options, channel_configs)
+        Blocking driver calls are run on executor (default: the event loop's default executor.)"""
+        from picosdk import aio
+        return aio.capture_block_async(self, timebase_options, channel_configs, executor=executor)
+
+    @requires_open()
+    def rapid_block_session(self, number_segments, timebase_options, channel_configs=(), overlapped=False):
+        """Configure the device for rapid block captures of number_segments blocks once, returning a RapidBlockSession.
+        number_segments, timebase_options and channel_configs are as for capture_rapid_block.
+        overlapped: if True, the driver reads the segments as soon as they are captured (see CaptureSession.)"""
+        return RapidBlockSession(self, number_segments, timebase_options, channel_configs, overlapped=overlapped)
+
+    @requires_open()
+    def capture_rapid_block(self, number_segments, timebase_options, channel_configs=(), raw=True):
+        """device.capture_rapid_block(number_segments, timebase_options, channel_configs)
+        Capture number_segments blocks in quick succession (rapid block mode), one into each memory segment.
+        timebase_options: TimebaseOptions object, as for capture_block. no_of_samples is the samples per segment.
+        channel_configs: a collection of ChannelConfig objects. If present, will be passed to set_channels.
+        raw: if False, convert the ADC counts to volts.
+        returns: RapidBlockData, with all the segments in one (channels, segments, samples) array.
+        Note: to capture the same configuration repeatedly, use rapid_block_session instead."""
+        return RapidBlockSession(self, number_segments, timebase_options, channel_configs).capture(raw)
+
+    def capture_rapid_block_async(self, number_segments, timebase_options, channel_configs=(), raw=True,
+                                  executor=None):
+        """a coroutine counterpart of capture_rapid_block, for use with asyncio (see picosdk.aio.)"""
+        from picosdk import aio
+        return aio.capture_rapid_block_async(self, number_segments, timebase_options, channel_configs, raw=raw,
+                                             executor=executor)
+
+    @requires_open()
+    def capture_rapid_block_chunks(self, number_segments, timebase_options, channel_configs=(), chunk_segments=1000,
+                                   pool_size=2):
+        """device.capture_rapid_block_chunks(number_segments, timebase_options, channel_configs, chunk_segments)
+        Capture number_segments blocks in rapid block mode, as for capture_rapid_block, but read them out chunk_segments
+        segments at a time, so that the host memory needed doesn't grow with the number of segments.
+        pool_size: the number of chunk buffers to reuse in turn (see ChunkedRapidBlockSession.)
+        yields: RapidBlockChunk for each chunk of segments, in order."""
+        session = ChunkedRapidBlockSession(self, number_segments, timebase_options, channel_configs,
+                                           chunk_segments=chunk_segments, pool_size=pool_size)
+        return session.capture()
+
+    @requires_open()
+    def stream(self, sample_interval, channel_configs=(), chunk_samples=10000, ring_chunks=16, max_samples=None,
+               drop=False, driver_buffer_size=None, poll_interval=None):
+        """device.stream(sample_interval, channel_configs, chunk_samples)
+        Start streaming, returning a Stream: an iterator of StreamChunk, each with chunk_samples samples per channel.
+        sample_interval: the time between samples (in seconds.) See Stream.sample_interval for the one the device chose.
+        channel_configs: a collection of ChannelConfig objects. If present, will be passed to set_channels.
+        ring_chunks: the number of chunks which the stream buffers ahead of the consumer.
+        max_samples: optionally, stop after this many samples (per channel.)
+        drop: if True, drop (and count) samples when the consumer falls behind, rather than waiting for it.
+        driver_buffer_size: the size of the driver's buffers (default chunk_samples.)
+        poll_interval: the time to wait between polls of the driver (default: a quarter of the driver buffer.)
+        usage:
+            with device.stream(1e-6, channel_configs, max_samples=10**8) as stream:
+                for chunk in stream:
+                    process(chunk.data)"""
+        if channel_configs:
+            self.set_channels(*channel_configs)
+        return Stream(self, sample_interval, chunk_samples=chunk_samples, ring_chunks=ring_chunks,
+                      max_samples=max_samples, drop=drop, driver_buffer_size=driver_buffer_size,
+                      poll_interval=poll_interval)
+
+    @requires_open()
+    def pooled_stream(self, channels, sample_interval, buffer_samples=100000, pool_size=8, queued=2, max_buffers=None,
+                      poll_interval=None):
+        """device.pooled_stream(channels, sample_interval, buffer_samples)
+        On ps6000a and psospa, stream through a pool of buffers, returning a PooledStream of StreamBuffer. Use it as a
+        context manager (or call start), and release each buffer once you have finished with it.
+        channels: the names of the channels to stream. These drivers switch channels on with SetChannelOn, rather than
+            set_channels, so configure them (and the trigger) on the driver first.
+        sample_interval: the time between samples (in seconds.)
+        buffer_samples: the number of samples (per channel) in each buffer.
+        pool_size, queued, max_buffers: see PooledStream.
+        poll_interval: the time to wait between polls of the driver (default: a quarter of a buffer.)"""
+        return PooledStream(self, channels, sample_interval, buffer_samples=buffer_samples, pool_size=pool_size,
+                            queued=queued, max_buffers=max_buffers, poll_interval=poll_interval)
+
     @requires_open()
     def capture_block(self, timebase_options, channel_configs=()):
         """device.capture_block(timebase_options, channel_configs)
         timebase_options: TimebaseOptions object, specifying at least 1 constraint, and optionally oversample.
         channel_configs: a collection of ChannelConfig objects. If present, will be passed to set_channels.
+        Note: to capture the same configuration repeatedly, use capture_session instead.
         """
-        # set_channel:
+        return CaptureSession(self, timebase_options, channel_configs).capture()
+
+
+"""CaptureStats: how long a CaptureSession has spent capturing.
+captures = the number of calls to capture.
+total_time = the time spent in capture (in seconds.)
+wait_time = the part of total_time spent waiting for the device to finish capturing.
+overhead_per_capture = the mean time per capture not spent waiting for the device, i.e. driver calls and conversion.
+waveforms_per_second = the number of blocks (one per segment, for rapid block captures) captured per second of
+                       total_time."""
+CaptureStats = collections.namedtuple('CaptureStats', ['captures', 'total_time', 'wait_time', 'overhead_per_capture',
+                                                       'waveforms_per_second'])
+CaptureStats.__new__.__defaults__ = (None,)
+
+
+class CaptureSession(object):
+    """A block capture which is configured once (channels, memory segments, timebase, trigger and buffers), and can then
+    be run repeatedly with capture(). Each capture only runs the block, waits for it, reads the data into the session's
+    buffers and stops the device.
+    In overlapped mode, before running each block the session asks the driver (with get_values_overlapped) to read the
+    data as soon as the capture finishes, so there is no separate read out after the device is ready.
+    Please don't reconfigure the device while using a session: create a new session instead."""
+    USE_SEGMENT_ID = 0
+
+    def __init__(self, device, timebase_options, channel_configs=(), overlapped=False):
+        if overlapped and not device.driver.can_get_values_overlapped():
+            raise FeatureNotSupportedError("%s devices cannot read data during a capture." % device.driver.name)
+        self.device = device
+        self.timebase_options = timebase_options
+        self.overlapped = overlapped
+        self._configure(channel_configs, self.USE_SEGMENT_ID + 1)
+        self._allocate_buffers()
+
+        # the driver writes to these when it reads an overlapped capture, so they must live as long as the session.
+        self._overlapped_overflow = numpy.zeros(1, numpy.dtype('int16'))
+        self._overlapped_samples = None
+
+        # where the driver can call back when the block is ready, wait on that rather than polling.
+        self._ready_event = None
+        if device.driver.can_signal_block_ready():
+            self._ready_event = threading.Event()
+
+        self._captures = 0
+        self._total_time = 0.
+        self._wait_time = 0.
+
+    def _configure(self, channel_configs, number_segments):
+        """set up the channels, memory segments, timebase and trigger."""
+        device = self.device
+        timebase_options = self.timebase_options
 
+        # set_channel:
         if channel_configs:
-            self.set_channels(*channel_configs)
+            device.set_channels(*channel_configs)
 
-        if len(self._channel_ranges) == 0:
+        if len(device._channel_ranges) == 0:
             raise NoChannelsEnabledError("We cannot capture any data if no channels are enabled.")
+        self.channel_ranges = dict(device._channel_ranges)
+        self._waveforms_per_capture = number_segments
 
         # memory_segments:
-        USE_SEGMENT_ID=0
         try:
-            # always force the number of memory segments on the device to 1 before computing timebases for a one-off
-            # block capture.
-            max_samples_possible = self.driver.memory_segments(self, USE_SEGMENT_ID+1)
-            if timebase_options.no_of_samples is not None and timebase_options.no_of_samples > max_samples_possible.value:
+            # always set the number of memory segments on the device before computing timebases, since the samples
+            # available per segment depend on it.
+            max_samples_possible = device.memory_segments(number_segments)
+            if timebase_options.no_of_samples is not None and timebase_options.no_of_samples > max_samples_possible:
                 raise NoValidTimebaseForOptionsError()
         except DeviceCannotSegmentMemoryError:
-            pass
+            if number_segments > 1:
+                raise
 
         # get_timebase
-        timebase_info = self.find_timebase(timebase_options)
-
-        post_trigger_samples = timebase_options.no_of_samples
-        pre_trigger_samples = 0
+        self.timebase_info = device.find_timebase(timebase_options)
 
-        if post_trigger_samples is None:
-            post_trigger_samples = int(math.ceil(timebase_options.min_collection_time / timebase_info.time_interval))
+        self.no_of_samples = timebase_options.no_of_samples
+        if self.no_of_samples is None:
+            self.no_of_samples = int(math.ceil(timebase_options.min_collection_time / self.timebase_info.time_interval))
 
-        self.driver.set_null_trigger(self)
+        device.driver.set_null_trigger(device)
+        self.max_adc = device.driver.maximum_value(device)
 
-        # tell the device to capture something:
-        approx_time_busy = self.driver.run_block(self,
-                                                 pre_trigger_samples,
-                                                 post_trigger_samples,
-                                                 timebase_info.timebase_id,
-                                                 timebase_options.oversample,
-                                                 USE_SEGMENT_ID)
+        self.times = numpy.linspace(0.,
+                                    self.no_of_samples * self.timebase_info.time_interval,
+                                    self.no_of_samples,
+                                    dtype=numpy.dtype('float32'))
 
-        is_ready = self.driver.is_ready(self)
-        while not is_ready:
-            time.sleep(approx_time_busy / 5)
-            is_ready = self.driver.is_ready(self)
+    def _allocate_buffers(self):
+        """allocate the session's buffers, and register them with the driver."""
+        self.raw_data = {channel: numpy.empty(self.no_of_samples, numpy.dtype('int16'))
+                         for channel in self.channel_ranges}
+        self.voltages = {channel: numpy.empty(self.no_of_samples, numpy.dtype('float32'))
+                         for channel in self.channel_ranges}
+        self.device.driver.set_data_buffers(self.device, self.raw_data, self.USE_SEGMENT_ID)
 
-        raw_data, overflow_warnings = self.driver.get_values(self,
-                                                             self._channel_ranges.keys(),
-                                                             post_trigger_samples,
-                                                             USE_SEGMENT_ID)
-
-        self.driver.stop(self)
-
-        times = numpy.linspace(0.,
-                               post_trigger_samples * timebase_info.time_interval,
-                               post_trigger_samples,
-                               dtype=numpy.dtype('float32'))
+    @requires_open()
+    def capture(self, raw=False):
+        """capture one block.
+        raw: if True, return the raw ADC counts (int16) rather than converting them to volts.
+        returns: times, a dict of data arrays (by channel name), and a dict of channels which overflowed.
+        Note: the same arrays are refilled by every capture, so copy them if you need to keep them."""
+        start = time.time()
+        approx_time_busy = self._run_block(self._ready_event)
+        wait_start = time.time()
+        self.device._wait_for_block(approx_time_busy, self._ready_event)
+        wait_time = time.time() - wait_start
+        result = self._read(raw)
+        self._record(start, wait_time)
+        return result
+
+    def capture_async(self, raw=False, executor=None):
+        """a coroutine which captures one block without blocking the asyncio event loop (see picosdk.aio.)
+        arguments and result are as for capture. Blocking driver calls are run on executor (default: the loop's.)"""
+        from picosdk import aio
+        return aio.capture_async(self, raw=raw, executor=executor)
+
+    def _run_block(self, ready_event):
+        """tell the device to capture something.
+        returns: the approximate time (in seconds) it will take."""
+        if ready_event is not None:
+            ready_event.clear()
+        if self.overlapped:
+            self._start_overlapped_read()
+        return self.device.driver.run_block(self.device,
+                                            0,
+                                            self.no_of_samples,
+                                            self.timebase_info.timebase_id,
+                                            self.timebase_options.oversample,
+                                            self.USE_SEGMENT_ID,
+                                            ready_event=ready_event)
+
+    def _start_overlapped_read(self):
+        _, self._overlapped_samples = self.device.driver.get_values_overlapped(self.device,
+                                                                               self.no_of_samples,
+                                                                               self.USE_SEGMENT_ID,
+                                                                               overflow=self._overlapped_overflow)
+
+    def _read(self, raw):
+        """read a finished block into the session's buffers, and stop the device."""
+        device = self.device
+        if self.overlapped:
+            # the driver has already read the data.
+            device.driver.stop_using_get_values_overlapped(device)
+            flags = int(self._overlapped_overflow[0])
+            overflow_warnings = {channel: True for channel in self.raw_data
+                                 if flags & (1 << device.driver.PICO_CHANNEL[channel])}
+        else:
+            overflow_warnings = device.driver.get_values_into(device, self.raw_data, self.no_of_samples,
+                                                              self.USE_SEGMENT_ID)
+        device.driver.stop(device)
+
+        if not raw:
+            # converted with a cached lookup table for each channel's range.
+            for channel, raw_array in self.raw_data.items():
+                adc2mVLookup(raw_array,
+                             device.driver,
+                             self.channel_ranges[channel],
+                             self.max_adc,
+                             rangeType="V",
+                             out=self.voltages[channel])
+        return self.times, self.raw_data if raw else self.voltages, overflow_warnings
+
+    def _record(self, start, wait_time):
+        self._captures += 1
+        self._total_time += time.time() - start
+        self._wait_time += wait_time
 
-        voltages = {}
+    @property
+    def is_open(self):
+        return self.device.is_open
+
+    def stats(self):
+        """Returns: a CaptureStats of the time spent in capture."""
+        overhead = None
+        waveforms_per_second = None
+        if self._captures:
+            overhead = (self._total_time - self._wait_time) / self._captures
+            if self._total_time > 0:
+                waveforms_per_second = self._captures * self._waveforms_per_capture / self._total_time
+        return CaptureStats(self._captures, self._total_time, self._wait_time, overhead, waveforms_per_second)
+
+
+"""RapidBlockData: the result of a rapid block capture.
+channels = the names of the captured channels, in the order of the first axis of data (and overflow.)
+times = the time of each sample from the start of its segment (in seconds.)
+data = a C-contiguous (channels, segments, samples) array of raw ADC counts (int16), or of volts (float32.)
+overflow = a (channels, segments) bool array, which is True where the channel overflowed during that segment."""
+RapidBlockData = collections.namedtuple('RapidBlockData', ['channels', 'times', 'data', 'overflow'])
+
+
+class RapidBlockSession(CaptureSession):
+    """A rapid block capture: each capture() captures one block into each of number_segments memory segments, then reads
+    them all with one get_values_bulk call, straight into a single preallocated (channels, segments, samples) array.
+    The driver buffers are views into that array, registered once when the session is created."""
+    def __init__(self, device, number_segments, timebase_options, channel_configs=(), overlapped=False):
+        self.number_segments = number_segments
+        super(RapidBlockSession, self).__init__(device, timebase_options, channel_configs, overlapped=overlapped)
+
+    def _configure(self, channel_configs, number_segments):
+        super(RapidBlockSession, self)._configure(channel_configs, self.number_segments)
+        self.device.driver.set_no_of_captures(self.device, self.number_segments)
+
+    def _allocate_buffers(self):
+        driver = self.device.driver
+        self.channels = tuple(sorted(self.channel_ranges, key=lambda channel: driver.PICO_CHANNEL[channel]))
+        self.raw_data = numpy.empty((len(self.channels), self.number_segments, self.no_of_samples),
+                                    numpy.dtype('int16'))
+        # only allocated if a capture converts to volts.
+        self.voltages = None
+        self.overflow = numpy.zeros((len(self.channels), self.number_segments), numpy.dtype('bool'))
+        self._overflow_flags = numpy.zeros(self.number_segments, numpy.dtype('int16'))
+        self._channel_bits = numpy.array([driver.PICO_CHANNEL[channel] for channel in self.channels],
+                                         numpy.dtype('int16')).reshape(-1, 1)
+
+        for segment_index in range(self.number_segments):
+            views = {channel: self.raw_data[i, segment_index] for i, channel in enumerate(self.channels)}
+            driver.set_data_buffers(self.device, views, segment_index)
 
-        max_adc = self.driver.maximum_value(self)
-        for channel, raw_array in raw_data.items():
-            array = raw_array.astype(numpy.dtype('float32'), casting='safe')
-            factor = self._channel_ranges[channel] / max_adc
-            array = array * factor
-            voltages[channel] = array
+    @requires_open()
+    def capture(self, raw=True):
+        """capture number_segments blocks.
+        raw: if False, convert the ADC counts to volts (into a float32 array, twice the size of the raw data.)
+        returns: RapidBlockData.
+        Note: the same arrays are refilled by every capture, so copy them if you need to keep them."""
+        return super(RapidBlockSession, self).capture(raw)
+
+    def capture_async(self, raw=True, executor=None):
+        """a coroutine which captures number_segments blocks without blocking the asyncio event loop (see picosdk.aio.)
+        arguments and result are as for capture."""
+        return super(RapidBlockSession, self).capture_async(raw, executor)
+
+    def _start_overlapped_read(self):
+        # the captures fill the segments in turn, from the first (USE_SEGMENT_ID.)
+        _, self._overlapped_samples = self.device.driver.get_values_overlapped(self.device,
+                                                                               self.no_of_samples,
+                                                                               0,
+                                                                               self.number_segments - 1,
+                                                                               overflow=self._overflow_flags)
+
+    def _read(self, raw):
+        device = self.device
+        if self.overlapped:
+            device.driver.stop_using_get_values_overlapped(device)
+        else:
+            device.driver.get_values_bulk(device, self.no_of_samples, 0, self.number_segments - 1,
+                                          self._overflow_flags)
+        device.driver.stop(device)
+        self.overflow[...] = (self._overflow_flags >> self._channel_bits) & 1
+
+        if raw:
+            return RapidBlockData(self.channels, self.times, self.raw_data, self.overflow)
+
+        if self.voltages is None:
+            self.voltages = numpy.empty(self.raw_data.shape, numpy.dtype('float32'))
+        for i, channel in enumerate(self.channels):
+            adc2mVLookup(self.raw_data[i], device.driver, self.channel_ranges[channel], self.max_adc, rangeType="V",
+                         out=self.voltages[i])
+        return RapidBlockData(self.channels, self.times, self.voltages, self.overflow)
+
+
+"""RapidBlockChunk: some consecutive segments of a rapid block capture, read out by ChunkedRapidBlockSession.
+segments = the range of segment indices in this chunk.
+data = a (channels, segments, samples) array of raw ADC counts (int16), for just these segments.
+overflow = a (channels, segments) bool array, which is True where the channel overflowed during that segment.
+trigger_offsets = the offset (in seconds) of each segment's trigger point from its trigger sample, or None if the driver
+                  can't report them."""
+RapidBlockChunk = collections.namedtuple('RapidBlockChunk', ['segments', 'data', 'overflow', 'trigger_offsets'])
+
+
+class ChunkedRapidBlockSession(RapidBlockSession):
+    """A rapid block capture which is read out chunk_segments segments at a time (with get_values_bulk over a window of
+    segments), rather than all at once. The chunks are read into a pool of pool_size buffers, which are reused in turn,
+    so the host memory used is fixed however many segments the device captures.
+    Each chunk's arrays are refilled pool_size chunks later: keep at most pool_size - 1 earlier chunks while handling
+    one (e.g. while another thread writes them out), and copy any you need for longer."""
+    def __init__(self, device, number_segments, timebase_options, channel_configs=(), chunk_segments=1000,
+                 pool_size=2):
+        self.chunk_segments = min(chunk_segments, number_segments)
+        self.pool_size = pool_size
+        super(ChunkedRapidBlockSession, self).__init__(device, number_segments, timebase_options, channel_configs)
+
+    def _allocate_buffers(self):
+        driver = self.device.driver
+        self.channels = tuple(sorted(self.channel_ranges, key=lambda channel: driver.PICO_CHANNEL[channel]))
+        self._channel_bits = numpy.array([driver.PICO_CHANNEL[channel] for channel in self.channels],
+                                         numpy.dtype('int16')).reshape(-1, 1)
+
+        chunk = self.chunk_segments
+        self._data_pool = [numpy.empty((len(self.channels), chunk, self.no_of_samples), numpy.dtype('int16'))
+                           for _ in range(self.pool_size)]
+        self._overflow_pool = [numpy.zeros((len(self.channels), chunk), numpy.dtype('bool'))
+                               for _ in range(self.pool_size)]
+        self._trigger_offset_pool = [numpy.zeros(chunk, numpy.dtype('float64')) for _ in range(self.pool_size)]
+        # the window of segments each pool buffer is registered for, so that it is only registered again if it changes.
+        self._registered_windows = [None] * self.pool_size
+
+        self._overflow_flags = numpy.zeros(chunk, numpy.dtype('int16'))
+        self._trigger_times = numpy.zeros(chunk, numpy.dtype('int64'))
+        self._trigger_time_units = numpy.zeros(chunk, numpy.dtype('int32'))
+        self._can_get_trigger_offsets = True
+
+    def _windows(self):
+        for from_segment in range(0, self.number_segments, self.chunk_segments):
+            yield from_segment, min(from_segment + self.chunk_segments, self.number_segments) - 1
 
-        return times, voltages, overflow_warnings
+    @requires_open()
+    def capture(self):
+        """capture number_segments blocks, then read them out.
+        yields: RapidBlockChunk for each chunk of (at most) chunk_segments segments, in order.
+        The device is stopped once all the chunks have been read, or if you stop iterating early."""
+        start = time.time()
+        approx_time_busy = self._run_block(self._ready_event)
+        wait_start = time.time()
+        self.device._wait_for_block(approx_time_busy, self._ready_event)
+        wait_time = time.time() - wait_start
+        try:
+            for i, (from_segment, to_segment) in enumerate(self._windows()):
+                yield self._read_chunk(i % self.pool_size, from_segment, to_segment)
+        finally:
+            self.device.driver.stop(self.device)
+            self._record(start, wait_time)
+
+    def capture_async(self, executor=None):
+        """an asynchronous generator counterpart of capture, for use with asyncio (see picosdk.aio.)
+        usage: async for chunk in session.capture_async(): ..."""
+        from picosdk import aio
+        return aio.capture_chunks_async(self, executor=executor)
+
+    def _read_chunk(self, pool_index, from_segment, to_segment):
+        """read segments from_segment to to_segment (inclusive) into the pool buffer pool_index."""
+        device = self.device
+        driver = device.driver
+        count = to_segment - from_segment + 1
+        data = self._data_pool[pool_index]
+
+        if self._registered_windows[pool_index] != (from_segment, to_segment):
+            for i in range(count):
+                views = {channel: data[c, i] for c, channel in enumerate(self.channels)}
+                driver.set_data_buffers(device, views, from_segment + i)
+            self._registered_windows[pool_index] = (from_segment, to_segment)
+
+        flags = self._overflow_flags[:count]
+        driver.get_values_bulk(device, self.no_of_samples, from_segment, to_segment, flags)
+        overflow = self._overflow_pool[pool_index][:, :count]
+        overflow[...] = (flags >> self._channel_bits) & 1
+
+        trigger_offsets = None
+        if self._can_get_trigger_offsets:
+            try:
+                trigger_offsets = driver.get_trigger_time_offsets_seconds(device, from_segment, to_segment,
+                                                                          self._trigger_offset_pool[pool_index][:count],
+                                                                          self._trigger_times[:count],
+                                                                          self._trigger_time_units[:count])
+            except FeatureNotSupportedError:
+                self._can_get_trigger_offsets = False
+
+        return RapidBlockChunk(range(from_segment, to_segment + 1), data[:, :count], overflow, trigger_offsets)
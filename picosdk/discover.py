@@ -1,52 +1,482 @@
 #
 # Copyright (C) 2018 Pico Technology Ltd. See LICENSE file for terms.
 #
-from picosdk.errors import DeviceNotFoundError
-from picosdk.ps2000 import ps2000
-from picosdk.ps2000a import ps2000a
-from picosdk.ps3000 import ps3000
-from picosdk.ps3000a import ps3000a
-from picosdk.ps4000 import ps4000
-from picosdk.ps4000a import ps4000a
-from picosdk.ps5000a import ps5000a
-from picosdk.ps6000 import ps6000
-from picosdk.ps6000a import ps6000a
+import collections
+try:
+    from collections.abc import Sequence
+except ImportError:
+    from collections import Sequence
+import importlib
+import threading
+import time
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+from picosdk.errors import DeviceNotFoundError, CannotFindPicoSDKError, CannotOpenPicoSDKError, \
+    ArgumentOutOfRangeError, DeviceOpenTimeoutError, PicoError
 
 
 # the A drivers are faster to enumerate devices, so search them first.
-drivers = [
-    ps2000a,
-    ps3000a,
-    ps4000a,
-    ps5000a,
-    ps6000a,
-    ps6000,
-    ps2000,
-    ps3000,
-    ps4000,
+# Each driver's module is only imported (and its library loaded) when a search reaches it.
+driver_names = [
+    'ps2000a',
+    'ps3000a',
+    'ps4000a',
+    'ps5000a',
+    'ps6000a',
+    'ps6000',
+    'ps2000',
+    'ps3000',
+    'ps4000',
 ]
 
 
-def find_unit():
-    """Search for, open and return the first device connected, on any driver."""
-    for driver in drivers:
+class _LazyDrivers(Sequence):
+    """The Library instances of the drivers in driver_names, each imported and loaded (with load_driver) when it is
+    first used, so that code which iterates over discover.drivers keeps working."""
+    def __init__(self, names):
+        self._names = names
+        self._loaded = {}
+
+    def __len__(self):
+        return len(self._names)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        name = self._names[index]
+        if name not in self._loaded:
+            self._loaded[name] = load_driver(name)
+        return self._loaded[name]
+
+
+drivers = _LazyDrivers(driver_names)
+
+
+"""DriverTiming: how long a search spent loading a driver, and searching it for devices.
+search_time is None if the driver could not be loaded."""
+DriverTiming = collections.namedtuple('DriverTiming', ['driver', 'load_time', 'search_time', 'units_found'])
+
+
+"""UnitIdentifier: a device to open with open_units."""
+UnitIdentifier = collections.namedtuple('UnitIdentifier', ['driver', 'serial'])
+
+
+"""OpenResult: the outcome of opening one device with open_units.
+device is the opened Device, or None if it failed to open, in which case error is the exception.
+elapsed is the time in seconds from starting to open this device until it opened (or failed)."""
+OpenResult = collections.namedtuple('OpenResult', ['driver', 'serial', 'device', 'error', 'elapsed'])
+
+
+def load_driver(name):
+    """Import the wrapper for a driver (e.g. 'ps2000a'), load its library, and return its Library instance.
+    Raises CannotFindPicoSDKError or CannotOpenPicoSDKError if the driver is not installed."""
+    module = importlib.import_module("picosdk.%s" % name)
+    driver = getattr(module, name)
+    driver.load()
+    return driver
+
+
+def _search_order(families):
+    if families is None:
+        return list(driver_names)
+    families = set(families)
+    unknown = families.difference(driver_names)
+    if unknown:
+        raise ArgumentOutOfRangeError("Unknown driver families: %s. Choose from %s." % (sorted(unknown), driver_names))
+    return [name for name in driver_names if name in families]
+
+
+def _installed_drivers(families, timings):
+    """Yields (name, driver, load_time) for each installed driver, in search order."""
+    for name in _search_order(families):
+        start = time.time()
         try:
-            device = driver.open_unit()
-        except DeviceNotFoundError:
+            driver = load_driver(name)
+        except (CannotFindPicoSDKError, CannotOpenPicoSDKError):
+            if timings is not None:
+                timings.append(DriverTiming(name, time.time() - start, None, 0))
             continue
-        return device
-    raise DeviceNotFoundError("Could not find any devices on any drivers.")
+        yield name, driver, time.time() - start
 
 
-def find_all_units():
-    """Search for, open and return ALL devices on ALL pico drivers (supported in this SDK wrapper)."""
-    devices = []
-    for driver in drivers:
+def find_unit(families=None, timings=None):
+    """Search for, open and return the first device connected, on any driver.
+    families: optionally, the names of the drivers to search (e.g. ['ps2000a', 'ps5000a']). Drivers are always searched
+              in the order of driver_names, and only loaded when the search reaches them.
+    timings: optionally, a list to which a DriverTiming is appended for each driver searched."""
+    for name, driver, load_time in _installed_drivers(families, timings):
+        start = time.time()
         try:
             device = driver.open_unit()
         except DeviceNotFoundError:
+            device = None
+        if timings is not None:
+            timings.append(DriverTiming(name, load_time, time.time() - start, 0 if device is None else 1))
+        if device is not None:
+            return device
+    raise DeviceNotFoundError("Could not find any devices on any drivers.")
+
+
+def list_all_units(families=None, timings=None, max_age=None):
+    """List the devices connected on all pico drivers, without opening them where the driver can enumerate its units.
+    families and timings are as for find_unit; max_age is as for Library.list_units.
+    returns: a list of UnitInfo tuples."""
+    units = []
+    for name, driver, load_time in _installed_drivers(families, timings):
+        start = time.time()
+        driver_units = driver.list_units(max_age=max_age)
+        units.extend(driver_units)
+        if timings is not None:
+            timings.append(DriverTiming(name, load_time, time.time() - start, len(driver_units)))
+    return units
+
+
+def _list_units_concurrently(installed, timings):
+    """Lists the units on each driver which can enumerate them, on a thread per driver."""
+    listed = {}
+
+    def list_driver_units(name, driver, load_time):
+        start = time.time()
+        try:
+            units = driver.list_units(max_age=0)
+        except PicoError:
+            units = []
+        listed[name] = (units, DriverTiming(name, load_time, time.time() - start, len(units)))
+
+    threads = [threading.Thread(target=list_driver_units, args=args) for args in installed]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    units = []
+    for name, _, _ in installed:
+        driver_units, timing = listed[name]
+        units.extend(driver_units)
+        if timings is not None:
+            timings.append(timing)
+    return units
+
+
+def _serial_bytes(serial):
+    return serial if isinstance(serial, bytes) else serial.encode('utf8')
+
+
+def _open_all_units_in_thread(name, driver, load_time, allowed, resolution, results, lock, closed):
+    """Opens every unit on a driver which can't enumerate them (so would have to open them to list them anyway),
+    putting ('opened', device), ('failed', OpenResult) and finally ('done', DriverTiming) messages on results.
+    allowed: the serials (as bytes) to keep open, or None for all of them. The others stay open until the driver has
+        no more units to open (or else they would be found again), then are closed.
+    closed: an Event set (under lock) when nobody will take any more devices from results."""
+    start = time.time()
+    found = 0
+    unwanted = []
+    try:
+        while not closed.is_set():
+            open_start = time.time()
+            try:
+                device = driver.open_unit(resolution=resolution)
+            except DeviceNotFoundError:
+                break
+            except PicoError as e:
+                results.put(('failed', OpenResult(driver, None, None, e, time.time() - open_start)))
+                break
+            found += 1
+            try:
+                serial = driver.get_unit_info(device).serial
+            except PicoError:
+                serial = None
+            if allowed is not None and (serial is None or _serial_bytes(serial) not in allowed):
+                unwanted.append(device)
+                continue
+            with lock:
+                if closed.is_set():
+                    device.close()
+                else:
+                    results.put(('opened', device))
+    finally:
+        for device in unwanted:
+            device.close()
+        results.put(('done', DriverTiming(name, load_time, time.time() - start, found)))
+
+
+def iter_all_units(serials=None, families=None, timings=None, failures=None, resolution=None, timeout=60.0):
+    """Search for and open ALL devices on ALL pico drivers (supported in this SDK wrapper), yielding each Device as it
+    opens. Devices on all drivers are opened at the same time (see open_units.)
+    Drivers which can't enumerate their units would have to open each one to list it, so their units are opened once,
+    on a thread per driver, and kept open.
+    serials: optionally, only open the devices with these serial numbers (e.g. ['AB123/0001', 'CD456/0002']).
+    families and timings are as for find_unit.
+    failures: optionally, a list to which the OpenResult is appended for each device which failed to open.
+    resolution and timeout are as for open_units (timeout only applies to drivers which can enumerate their units.)"""
+    installed = list(_installed_drivers(families, timings))
+    allowed = None if serials is None else set(_serial_bytes(serial) for serial in serials)
+
+    thread_results = queue.Queue()
+    lock = threading.Lock()
+    closed = threading.Event()
+    opening_threads = []
+    enumerating = []
+    for name, driver, load_time in installed:
+        if driver.can_enumerate_units():
+            enumerating.append((name, driver, load_time))
             continue
-        devices.append(device)
+        thread = threading.Thread(target=_open_all_units_in_thread,
+                                  args=(name, driver, load_time, allowed, resolution, thread_results, lock, closed))
+        thread.daemon = True
+        thread.start()
+        opening_threads.append(thread)
+
+    thread_timings = []
+    opened = []
+
+    def take_thread_results(block):
+        while len(thread_timings) < len(opening_threads):
+            try:
+                message = thread_results.get(block)
+            except queue.Empty:
+                return
+            # only wait for the first message.
+            block = False
+            if message[0] == 'opened':
+                opened.append(message[1])
+            elif message[0] == 'failed':
+                if failures is not None:
+                    failures.append(message[1])
+            else:
+                thread_timings.append(message[1])
+
+    opening = None
+    try:
+        units = _list_units_concurrently(enumerating, timings)
+        if allowed is not None:
+            units = [unit for unit in units if _serial_bytes(unit.serial) in allowed]
+
+        opening = open_units(units, resolution=resolution, timeout=timeout)
+        for result in opening:
+            if result.device is not None:
+                yield result.device
+            elif failures is not None:
+                failures.append(result)
+            take_thread_results(False)
+            while opened:
+                yield opened.pop(0)
+
+        while True:
+            take_thread_results(False)
+            while opened:
+                yield opened.pop(0)
+            if len(thread_timings) == len(opening_threads):
+                break
+            take_thread_results(True)
+        if timings is not None:
+            timings.extend(sorted(thread_timings, key=lambda timing: driver_names.index(timing.driver)))
+    finally:
+        # if the caller stopped early, close the devices they were never given.
+        if opening is not None:
+            opening.close()
+        with lock:
+            closed.set()
+        while True:
+            try:
+                message = thread_results.get_nowait()
+            except queue.Empty:
+                break
+            if message[0] == 'opened':
+                opened.append(message[1])
+        for device in opened:
+            device.close()
+
+
+def find_all_units(families=None, timings=None, serials=None, failures=None, resolution=None, timeout=60.0):
+    """Search for, open and return ALL devices on ALL pico drivers (supported in this SDK wrapper).
+    arguments are as for iter_all_units.
+    returns: a list of Device instances.
+    raises: DeviceNotFoundError if no devices opened."""
+    devices = list(iter_all_units(serials=serials, families=families, timings=timings, failures=failures,
+                                  resolution=resolution, timeout=timeout))
     if not devices:
         raise DeviceNotFoundError("Could not find any devices on any drivers.")
-    return devices
\ No newline at end of file
+    return devices
+
+
+def _group_by_driver(units):
+    pending = collections.OrderedDict()
+    for unit in units:
+        pending.setdefault(unit.driver, collections.deque()).append(unit.serial)
+    return pending
+
+
+def _open_units_in_thread(driver, serials, resolution, results, abandoned, lock):
+    """Opens each serial in turn with the blocking open_unit, putting ('started'|'done', ...) messages on results.
+    Serials added to abandoned (under lock) are not opened, or are closed if they are already opening."""
+    for serial in serials:
+        if (driver, serial) in abandoned:
+            continue
+        start = time.time()
+        results.put(('started', driver, serial, start))
+        try:
+            device, error = driver.open_unit(serial=serial, resolution=resolution), None
+        except PicoError as e:
+            device, error = None, e
+        with lock:
+            if (driver, serial) not in abandoned:
+                results.put(('done', OpenResult(driver, serial, device, error, time.time() - start)))
+                continue
+        # the caller has already reported a timeout for this device (or stopped), so nobody else will close it.
+        if device is not None:
+            device.close()
+
+
+def _close_async_opens(in_progress, timeout, poll_interval):
+    """Polls the opens in progress (which can't be cancelled) until they finish, and closes their devices."""
+    while in_progress:
+        for driver, (serial, start, _) in list(in_progress.items()):
+            try:
+                _, device = driver.open_unit_progress()
+                finished = device is not None
+            except PicoError:
+                device, finished = None, True
+            if device is not None:
+                device.close()
+            if finished or time.time() - start > 2 * timeout:
+                del in_progress[driver]
+        time.sleep(poll_interval)
+
+
+def open_units(units, resolution=None, timeout=60.0, poll_interval=0.01):
+    """Open several devices at once, yielding an OpenResult for each as it completes (in whatever order they finish.)
+    units: the devices to open, as (driver, serial) pairs or UnitInfo tuples (e.g. from list_all_units.)
+    resolution: as for Library.open_unit.
+    timeout: the longest time (in seconds) to wait for any one device to open. Devices which take longer are reported
+        with a DeviceOpenTimeoutError, and closed if they open later.
+    poll_interval: the time (in seconds) to sleep between polling the opens in progress.
+    Drivers which support it open their devices with OpenUnitAsync, one device per driver at a time, polled together
+    in this thread. Other drivers each open their devices in turn on their own thread. Opening the devices on different
+    drivers all happens at the same time.
+    Note: close each returned device when you are finished with it. If you stop iterating early, the devices still
+    opening are closed once they open."""
+    units = [unit if hasattr(unit, 'serial') else UnitIdentifier(*unit) for unit in units]
+    pending = _group_by_driver(units)
+
+    # drivers without async open get a thread each.
+    thread_results = queue.Queue()
+    abandoned = set()
+    lock = threading.Lock()
+    thread_units = {}
+    for driver in list(pending.keys()):
+        if not driver.can_open_unit_async():
+            serials = list(pending.pop(driver))
+            for serial in serials:
+                thread_units[(driver, serial)] = None
+            thread = threading.Thread(target=_open_units_in_thread,
+                                      args=(driver, serials, resolution, thread_results, abandoned, lock))
+            thread.daemon = True
+            thread.start()
+
+    # for the async drivers: the first attempt to start each open, and the open in progress on each driver.
+    first_attempt = {}
+    in_progress = {}
+    remaining = len(units)
+
+    # the results not yet yielded.
+    results = []
+    try:
+        # after the last result, keep polling any timed out opens so that the devices can be closed if they open.
+        while remaining or in_progress:
+            now = time.time()
+
+            for driver, serials in pending.items():
+                if driver in in_progress or not serials:
+                    continue
+                serial = serials[0]
+                first_attempt.setdefault((driver, serial), now)
+                try:
+                    started = driver.open_unit_async(serial=serial, resolution=resolution)
+                except PicoError as e:
+                    serials.popleft()
+                    results.append(OpenResult(driver, serial, None, e,
+                                              time.time() - first_attempt[(driver, serial)]))
+                    continue
+                if started:
+                    serials.popleft()
+                    in_progress[driver] = [serial, first_attempt[(driver, serial)], False]
+                elif now - first_attempt[(driver, serial)] > timeout:
+                    # something else has held the driver's open for our whole timeout.
+                    serials.popleft()
+                    results.append(OpenResult(driver, serial, None, DeviceOpenTimeoutError(
+                        "Driver %s was busy opening another device" % driver.name),
+                        now - first_attempt[(driver, serial)]))
+
+            for driver, (serial, start, timed_out) in list(in_progress.items()):
+                try:
+                    _, device = driver.open_unit_progress()
+                    error = None
+                except PicoError as e:
+                    device, error = None, e
+                now = time.time()
+                if device is not None or error is not None:
+                    del in_progress[driver]
+                    if timed_out:
+                        if device is not None:
+                            device.close()
+                    else:
+                        results.append(OpenResult(driver, serial, device, error, now - start))
+                elif not timed_out and now - start > timeout:
+                    # the driver can't cancel an open: keep polling it (so the next open can start), and close it
+                    # later.
+                    in_progress[driver][2] = True
+                    results.append(OpenResult(driver, serial, None, DeviceOpenTimeoutError(
+                        "%s did not open within %ss" % (serial, timeout)), now - start))
+                elif timed_out and now - start > 2 * timeout:
+                    # give up on the driver ever finishing: the remaining opens on it will time out in turn.
+                    del in_progress[driver]
+
+            while True:
+                try:
+                    message = thread_results.get_nowait()
+                except queue.Empty:
+                    break
+                if message[0] == 'started':
+                    thread_units[(message[1], message[2])] = message[3]
+                elif (message[1].driver, message[1].serial) in thread_units:
+                    del thread_units[(message[1].driver, message[1].serial)]
+                    results.append(message[1])
+                elif message[1].device is not None:
+                    # it finished just after we reported it as timed out.
+                    message[1].device.close()
+
+            now = time.time()
+            for (driver, serial), start in list(thread_units.items()):
+                if start is not None and now - start > timeout:
+                    with lock:
+                        abandoned.add((driver, serial))
+                    del thread_units[(driver, serial)]
+                    results.append(OpenResult(driver, serial, None, DeviceOpenTimeoutError(
+                        "%s did not open within %ss" % (serial, timeout)), now - start))
+
+            if not results:
+                time.sleep(poll_interval)
+            while results:
+                remaining -= 1
+                yield results.pop(0)
+    finally:
+        # if the caller stopped early, nobody will close the devices still opening, or not yet yielded.
+        with lock:
+            abandoned.update(thread_units)
+        while True:
+            try:
+                message = thread_results.get_nowait()
+            except queue.Empty:
+                break
+            if message[0] == 'done':
+                results.append(message[1])
+        for result in results:
+            if result.device is not None:
+                result.device.close()
+        if in_progress:
+            closer = threading.Thread(target=_close_async_opens, args=(in_progress, timeout, poll_interval))
+            closer.daemon = True
+            closer.start()
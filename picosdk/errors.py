@@ -71,3 +71,8 @@ class NoValidTimebaseForOptionsError(PicoError, ValueError):
 
 class UnknownConstantError(PicoError, TypeError):
     pass
+
+
+class DeviceOpenTimeoutError(DeviceNotFoundError):
+    """raised (or reported) when a device does not finish opening within the time allowed."""
+    pass
@@ -2,11 +2,78 @@
 # Copyright (C) 2018-2024 Pico Technology Ltd. See LICENSE file for terms.
 #
 from __future__ import division
+import collections
+import threading
 import numpy as np
-from picosdk.constants import PICO_STATUS, PICO_STATUS_LOOKUP
+from picosdk.constants import PICO_STATUS, PICO_STATUS_LOOKUP, SECONDS_PER_TIME_UNIT
 from picosdk.errors import PicoSDKCtypesError
 
 
+# Full-scale value in millivolts of each member of the 10 mV to 200 V range enumerations.
+channelInputRanges = [10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000, 200000]
+
+
+def _ctypesValue(value):
+    # arguments such as maxADC are normally ctypes values filled in by the driver, but plain numbers are accepted too.
+    return getattr(value, 'value', value)
+
+
+def adcBufferView(bufferADC):
+    """
+        adcBufferView(
+                        c_short_Array       bufferADC
+                        )
+
+        Returns a numpy view of a buffer of raw adc count values. ctypes arrays and numpy arrays are viewed in place
+        (no samples are copied), any other sequence is converted into a new array.
+    """
+    if isinstance(bufferADC, np.ndarray):
+        return bufferADC
+    return np.ctypeslib.as_array(bufferADC)
+
+
+def _rangeInMillivolts(range, rangeType):
+    if rangeType == "enum":
+        return channelInputRanges[range]
+    elif rangeType == "mV":
+        return range
+    elif rangeType == "nV":
+        return range / 1000000
+    elif rangeType == "V":
+        # results are in volts, like the ranges picosdk.device works with.
+        return range
+    raise ValueError("unknown range type '%s', expected 'enum', 'mV', 'nV' or 'V'" % rangeType)
+
+
+def adc2mVArray(bufferADC, range, maxADC, rangeType="enum", out=None, dtype=np.float64):
+    """
+        adc2mVArray(
+                c_short_Array           bufferADC
+                int                     range
+                c_int32                 maxADC
+                str                     rangeType
+                numpy.ndarray           out
+                numpy.dtype             dtype
+                )
+
+        Takes a buffer of raw adc count values and converts it into millivolts in a single numpy pass.
+        The buffer is read in place, and the result is written into out if it is given (it must have the same shape
+        as the buffer), otherwise into a new array of the requested dtype (float32 or float64).
+
+        rangeType selects how range is interpreted:
+            "enum" - a member of the 10 mV to 200 V range enumerations (adc2mV)
+            "mV"   - the full-scale range in millivolts, as used by the pl1000 (adc2mVpl1000)
+            "nV"   - the full-scale range in nanovolts, i.e. rangeMax for psospa and ps6000a (adc2mVV2)
+    """
+    samples = adcBufferView(bufferADC)
+    if out is None:
+        out = np.empty(samples.shape, dtype=dtype)
+    scale = _rangeInMillivolts(range, rangeType) / _ctypesValue(maxADC)
+    np.multiply(samples, out.dtype.type(scale), out=out)
+
+    return out
+
+
 def adc2mV(bufferADC, range, maxADC):
     """ 
         adc2mc(
@@ -15,14 +82,10 @@ def adc2mV(bufferADC, range, maxADC):
                 c_int32                 maxADC
                 )
                
-        Takes a buffer of raw adc count values and converts it into millivolts
+        Takes a buffer of raw adc count values and converts it into a list of millivolts.
+        Use adc2mVArray for a numpy array, without building a list.
     """
-
-    channelInputRanges = [10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000, 200000]
-    vRange = channelInputRanges[range]
-    bufferV = [(np.int64(x) * vRange) / maxADC.value for x in bufferADC]
-    
-    return bufferV
+    return adc2mVArray(bufferADC, range, maxADC, rangeType="enum").tolist()
 	
 def adc2mVpl1000(bufferADC, range, maxADC):
 	"""
@@ -32,12 +95,10 @@ def adc2mVpl1000(bufferADC, range, maxADC):
 						c_int32				maxADC
 						)
 		
-		Takes a buffer of raw adc count values and converts it into millvolts
+		Takes a buffer of raw adc count values and converts it into a list of millvolts.
+		Use adc2mVArray(..., rangeType="mV") for a numpy array, without building a list.
 	"""
-	
-	bufferV = [(x * range) / maxADC.value for x in bufferADC]
-	
-	return bufferV
+	return adc2mVArray(bufferADC, range, maxADC, rangeType="mV").tolist()
 
 def mV2adc(millivolts, range, maxADC):
     """
@@ -48,7 +109,6 @@ def mV2adc(millivolts, range, maxADC):
                 )
         Takes a voltage value and converts it into adc counts
     """
-    channelInputRanges = [10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000, 200000]
     vRange = channelInputRanges[range]
     adcValue = round((millivolts * maxADC.value)/vRange)
 
@@ -68,6 +128,222 @@ def mV2adcpl1000(millivolts, range, maxADC):
 	return adcValue
 
 
+"""CacheInfo: hit and miss counters of a ConversionTableCache, in the style of functools.lru_cache."""
+CacheInfo = collections.namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+class ConversionTableCache(object):
+    """
+    A least-recently-used cache of lookup tables which map every int16 adc count to a float32 value.
+
+    Each table is keyed by (driver, range, maxADC, analogOffset, probeAttenuation) and holds
+        (count * range / maxADC - analogOffset) * probeAttenuation
+    for all 65536 counts, so converting a buffer is a single numpy.take over its uint16 view. Results are in
+    millivolts, except for rangeType "V" where the range, offset and results are in volts.
+    """
+    TABLE_SIZE = 2**16
+
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self._tables = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def table(self, driver, range, maxADC, analogOffset=0.0, probeAttenuation=1.0, rangeType="enum"):
+        """Returns the lookup table for this configuration, building it if it is not cached."""
+        key = (getattr(driver, 'name', driver), rangeType, range, _ctypesValue(maxADC), analogOffset,
+               probeAttenuation)
+        with self._lock:
+            if key in self._tables:
+                # re-insert to mark this table as the most recently used.
+                table = self._tables[key] = self._tables.pop(key)
+                self._hits += 1
+                return table
+            self._misses += 1
+
+        counts = np.arange(self.TABLE_SIZE, dtype=np.uint16).view(np.int16)
+        table = adc2mVArray(counts, range, maxADC, rangeType=rangeType, dtype=np.float32)
+        if analogOffset:
+            table -= np.float32(analogOffset)
+        if probeAttenuation != 1:
+            table *= np.float32(probeAttenuation)
+        table.flags.writeable = False
+
+        with self._lock:
+            self._tables[key] = table
+            while len(self._tables) > self.maxsize:
+                self._tables.popitem(last=False)
+        return table
+
+    def convert(self, bufferADC, driver, range, maxADC, analogOffset=0.0, probeAttenuation=1.0, rangeType="enum",
+                out=None):
+        """
+        Converts a buffer of int16 adc counts with the cached table for this configuration.
+        out: optional float32 array with the same shape as the buffer, which receives the result.
+        """
+        table = self.table(driver, range, maxADC, analogOffset, probeAttenuation, rangeType)
+        counts = adcBufferView(bufferADC).view(np.uint16)
+        # every uint16 is a valid index, so 'wrap' skips numpy's bounds checking without changing the result.
+        return np.take(table, counts, out=out, mode='wrap')
+
+    def cacheInfo(self):
+        with self._lock:
+            return CacheInfo(self._hits, self._misses, self.maxsize, len(self._tables))
+
+    def clear(self):
+        with self._lock:
+            self._tables.clear()
+            self._hits = 0
+            self._misses = 0
+
+
+# the cache used by adc2mVLookup.
+conversionTables = ConversionTableCache()
+
+
+def adc2mVLookup(bufferADC, driver, range, maxADC, analogOffset=0.0, probeAttenuation=1.0, rangeType="enum",
+                 out=None):
+    """
+        adc2mVLookup(
+                c_short_Array           bufferADC
+                str                     driver
+                int                     range
+                c_int32                 maxADC
+                float                   analogOffset
+                float                   probeAttenuation
+                str                     rangeType
+                numpy.ndarray           out
+                )
+
+        Takes a buffer of raw adc count values and converts it into millivolts (float32) using a cached lookup
+        table. This is faster than adc2mVArray when the same configuration is converted repeatedly, e.g. for the
+        segments of a rapid block capture. rangeType is as for adc2mVArray.
+    """
+    return conversionTables.convert(bufferADC, driver, range, maxADC, analogOffset, probeAttenuation, rangeType, out)
+
+
+def _portWords(port):
+    # 16 bit buffers are viewed in place. Anything else (e.g. a list, which numpy makes int64) is converted to 16 bit
+    # words, rather than viewed, which would make several words of each sample.
+    words = adcBufferView(port)
+    if words.dtype.itemsize != 2:
+        return words.astype(np.uint16)
+    return words.view(np.uint16)
+
+
+def decodeDigitalPorts(port0, port1=None, channels=None, packed=False, dtype=np.uint8):
+    """
+        decodeDigitalPorts(
+                        c_int16 array   port0
+                        c_int16 array   port1
+                        list            channels
+                        bool            packed
+                        numpy.dtype     dtype
+                        )
+
+    Splits digital port buffers into one bit-plane per digital channel, without a Python loop over the samples.
+
+    If only port0 is given, all 16 bits of each sample are decoded, so row n of the result is bit n of the buffer.
+    If port1 is also given, the low byte of port0 becomes D0 - D7 and the low byte of port1 becomes D8 - D15.
+
+    Returns a (16, N) array of 0/1 values (uint8 by default, or bool), indexed by digital channel number.
+    channels: optional list of digital channel numbers; only those rows are returned, in the order requested.
+    packed: if True, each row is packed 8 samples per byte with numpy.packbits, so numpy.unpackbits(result, axis=1,
+            count=N) restores the bit-planes.
+    """
+    words = _portWords(port0)
+    if port1 is not None:
+        words = (words & 0xFF) | ((_portWords(port1) & 0xFF) << 8)
+
+    if channels is None:
+        channels = range(16)
+    channels = list(channels)
+
+    planes = np.empty((len(channels), words.shape[-1]), dtype=np.uint8)
+    shifted = np.empty(words.shape, dtype=np.uint16)
+    for row, channel in enumerate(channels):
+        np.right_shift(words, channel, out=shifted)
+        np.bitwise_and(shifted, 1, out=planes[row], casting='unsafe')
+
+    if packed:
+        return np.packbits(planes, axis=-1)
+    return planes.astype(dtype, copy=False)
+
+
+def digitalEdges(planes, edge="both"):
+    """
+        digitalEdges(
+                        numpy.ndarray   planes
+                        str             edge
+                        )
+
+    Finds the sample indices at which digital channels change state. planes is a single bit-plane of N samples or a
+    (channels, N) array as returned by decodeDigitalPorts. edge is "rising", "falling" or "both".
+
+    Returns an array of indices for a single bit-plane, or a list with one array per row. Each index is that of the
+    first sample after the transition.
+    """
+    planes = np.asarray(planes)
+    if planes.ndim == 1:
+        return digitalEdges(planes[np.newaxis, :], edge)[0]
+
+    steps = np.diff(planes.astype(np.int8), axis=-1)
+    if edge == "rising":
+        changes = steps > 0
+    elif edge == "falling":
+        changes = steps < 0
+    elif edge == "both":
+        changes = steps != 0
+    else:
+        raise ValueError("unknown edge '%s', expected 'rising', 'falling' or 'both'" % edge)
+
+    return [np.flatnonzero(row) + 1 for row in changes]
+
+
+def triggerTimesFromInfo(triggerInfo, sampleInterval):
+    """
+        triggerTimesFromInfo(
+                        numpy.ndarray   triggerInfo
+                        float           sampleInterval
+                        )
+
+    Converts an array of trigger info records (as returned by Library.get_trigger_info_records) to the time of each
+    segment's trigger, in seconds since the first sample of the capture: its time stamp counter (in samples, of
+    sampleInterval seconds) plus its trigger time, in its own time units.
+    """
+    units = np.asarray(SECONDS_PER_TIME_UNIT)[triggerInfo['timeUnits']]
+    return triggerInfo['timeStampCounter'] * float(sampleInterval) + triggerInfo['triggerTime'] * units
+
+
+def interTriggerIntervals(triggerTimes):
+    """
+        interTriggerIntervals(
+                        numpy.ndarray   triggerTimes
+                        )
+
+    Returns the interval between each trigger and the one before it, one fewer than the trigger times.
+    """
+    return np.diff(np.asarray(triggerTimes, dtype=np.float64))
+
+
+def deadTimes(triggerTimes, captureDuration):
+    """
+        deadTimes(
+                        numpy.ndarray   triggerTimes
+                        float           captureDuration
+                        )
+
+    Returns the time between the end of each segment's capture (of captureDuration seconds, from its trigger) and the
+    next trigger, during which the device was re-arming and not capturing.
+    """
+    return interTriggerIntervals(triggerTimes) - captureDuration
+
+
+def _planesAsCharArrays(planes):
+    return [np.where(plane, b'1', b'0').view(np.char.chararray) for plane in planes]
+
+
 def splitMSOData(dataLength, data):
     """
     This method converts an array of values for a ditial port into the binary equivalent, splitting the bits by
@@ -82,39 +358,9 @@ def splitMSOData(dataLength, data):
                         c_int16 array   data
                         )
     """
-    # Makes an array for each digital channel
-    binaryBufferD0 = np.chararray((dataLength.value, 1))
-    binaryBufferD1 = np.chararray((dataLength.value, 1))
-    binaryBufferD2 = np.chararray((dataLength.value, 1))
-    binaryBufferD3 = np.chararray((dataLength.value, 1))
-    binaryBufferD4 = np.chararray((dataLength.value, 1))
-    binaryBufferD7 = np.chararray((dataLength.value, 1))
-    binaryBufferD5 = np.chararray((dataLength.value, 1))
-    binaryBufferD6 = np.chararray((dataLength.value, 1))
-    
-    # Changes the data from int type to a binary type and then separates the data for each digital channel
-    for i in range(0, dataLength.value):
-        MSOData = data[i]
-        binaryMSOData = bin(MSOData)
-        binaryMSOData = binaryMSOData[2:]
-        binaryMSOData = binaryMSOData.zfill(8)
-        binaryBufferD0[i] = binaryMSOData[7]
-        binaryBufferD1[i] = binaryMSOData[6]
-        binaryBufferD2[i] = binaryMSOData[5]
-        binaryBufferD3[i] = binaryMSOData[4]
-        binaryBufferD4[i] = binaryMSOData[3]
-        binaryBufferD5[i] = binaryMSOData[2]
-        binaryBufferD6[i] = binaryMSOData[1]
-        binaryBufferD7[i] = binaryMSOData[0]
-
-    return binaryBufferD0, \
-           binaryBufferD1, \
-           binaryBufferD2, \
-           binaryBufferD3, \
-           binaryBufferD4, \
-           binaryBufferD5, \
-           binaryBufferD6, \
-           binaryBufferD7
+    planes = decodeDigitalPorts(adcBufferView(data)[:_ctypesValue(dataLength)], channels=range(8))
+
+    return tuple(plane.reshape(-1, 1) for plane in _planesAsCharArrays(planes))
 
 
 def splitMSODataFast(dataLength, data):
@@ -130,23 +376,9 @@ def splitMSODataFast(dataLength, data):
                         c_int16 array   data
                         )
     """
-    # Makes an array for each digital channel
-    bufferBinaryDj = (
-        np.chararray(dataLength.value),
-        np.chararray(dataLength.value),
-        np.chararray(dataLength.value),
-        np.chararray(dataLength.value),
-        np.chararray(dataLength.value),
-        np.chararray(dataLength.value),
-        np.chararray(dataLength.value),
-        np.chararray(dataLength.value),
-    )
-    # Splits out the individual bits from the port into the binary values for each digital channel/pin.
-    for i in range(dataLength.value):
-        for j in range(8):
-            bufferBinaryDj[j][i] = 1 if (data[i] & (1 << (7-j))) else 0
-
-    return bufferBinaryDj
+    planes = decodeDigitalPorts(adcBufferView(data)[:_ctypesValue(dataLength)], channels=range(7, -1, -1))
+
+    return tuple(_planesAsCharArrays(planes))
 
 
 def assert_pico_ok(status):
@@ -194,8 +426,7 @@ def adc2mVV2(bufferADC, rangeMax, maxADC):
                 c_int32                 maxADC
                 )
                
-        Takes a buffer of raw adc count values and converts it into millivolts for psospa driver scopes
+        Takes a buffer of raw adc count values and converts it into a list of millivolts for psospa driver scopes.
+        Use adc2mVArray(..., rangeType="nV") for a numpy array, without building a list.
     """
-    buffermV = [(x * (rangeMax/1000000)) / maxADC.value for x in bufferADC]
-    
-    return buffermV
\ No newline at end of file
+    return adc2mVArray(bufferADC, rangeMax, maxADC, rangeType="nV").tolist()
\ No newline at end of file
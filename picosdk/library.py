@@ -10,7 +10,12 @@ this type and attach the missing methods.
 from __future__ import print_function
 
 import sys
-from ctypes import c_int16, c_int32, c_uint32, c_float, create_string_buffer, byref
+import math
+import re
+import threading
+import time
+from ctypes import c_int16, c_uint16, c_int32, c_uint32, c_uint64, c_float, c_double, c_char_p, c_void_p, \
+    create_string_buffer, byref
 from ctypes.util import find_library
 import collections
 import picosdk.constants as constants
@@ -18,7 +23,8 @@ import numpy
 
 from picosdk.errors import CannotFindPicoSDKError, CannotOpenPicoSDKError, DeviceNotFoundError, \
     ArgumentOutOfRangeError, ValidRangeEnumValueNotValidForThisDevice, DeviceCannotSegmentMemoryError, \
-    InvalidMemorySegmentsError, InvalidTimebaseError, InvalidTriggerParameters, InvalidCaptureParameters
+    InvalidMemorySegmentsError, InvalidTimebaseError, InvalidTriggerParameters, InvalidCaptureParameters, \
+    PicoSDKCtypesError, FeatureNotSupportedError
 
 
 from picosdk.device import Device
@@ -33,6 +39,72 @@ TimebaseInfo = collections.namedtuple('TimebaseInfo', ['timebase_id',
                                                        'segment_id'])
 
 
+class TimebaseFormula(collections.namedtuple('TimebaseFormula', ['exponential_ids',
+                                                                 'exponential_rate',
+                                                                 'linear_rate',
+                                                                 'linear_offset'])):
+    """TimebaseFormula: how a driver's timebase ids map to sample intervals (from its programming guide).
+    Timebases below exponential_ids sample every 2**id / exponential_rate seconds, and the rest every
+    (id - linear_offset) / linear_rate seconds. Some devices differ (e.g. at higher resolutions), so this is only used
+    to estimate where to start searching for a timebase."""
+    __slots__ = ()
+
+    def time_interval(self, timebase_id):
+        if timebase_id < self.exponential_ids:
+            return 2 ** timebase_id / float(self.exponential_rate)
+        return (timebase_id - self.linear_offset) / float(self.linear_rate)
+
+    def timebase_id(self, time_interval):
+        """Returns: the smallest timebase id which samples no faster than every time_interval seconds."""
+        # allow a little rounding error, so that exact intervals map onto their own id.
+        if self.exponential_ids and time_interval <= self.time_interval(self.exponential_ids - 1):
+            return max(0, int(math.ceil(math.log(time_interval * self.exponential_rate, 2) - 1e-9)))
+        return max(self.exponential_ids, int(math.ceil(time_interval * self.linear_rate + self.linear_offset - 1e-9)))
+
+
+"""UnitInfo: identifies a connected device. variant is None where the device was found without opening it.
+"""
+UnitInfo = collections.namedtuple('UnitInfo', ['driver', 'variant', 'serial'])
+
+
+"""TRIGGER_INFO_DTYPE: the layout of PICO_TRIGGER_INFO (ps6000a and psospa), so that get_trigger_info_records can have
+the driver fill a numpy array of them directly."""
+TRIGGER_INFO_DTYPE = numpy.dtype([('status', '<u4'),
+                                  ('segmentIndex', '<u8'),
+                                  ('triggerIndex', '<u8'),
+                                  ('triggerTime', '<f8'),
+                                  ('timeUnits', '<u4'),
+                                  ('missedTriggers', '<u8'),
+                                  ('timeStampCounter', '<u8')])
+
+_SECONDS_PER_TIME_UNIT = numpy.array(constants.SECONDS_PER_TIME_UNIT)
+
+
+def _check_buffer(name, array, dtype, length):
+    """raise ArgumentOutOfRangeError unless array is a writeable, C-contiguous numpy array of dtype, with room for
+    length elements, since the driver writes length elements through a pointer to it."""
+    dtype = numpy.dtype(dtype)
+    if not isinstance(array, numpy.ndarray) or array.dtype != dtype or array.ndim != 1 or len(array) < length \
+            or not array.flags['C_CONTIGUOUS'] or not array.flags['WRITEABLE']:
+        raise ArgumentOutOfRangeError("%s must be a writeable, C-contiguous array of at least %s %s elements" % (
+            name, length, dtype))
+
+
+"""CSymbol: the signature of a C function registered with Library.make_symbol, which is bound on first use."""
+CSymbol = collections.namedtuple('CSymbol', ['python_name', 'c_name', 'return_type', 'argument_types', 'docstring'])
+
+_CAPITAL_LETTER = re.compile('[A-Z]')
+
+
+def _underscore_name(python_name):
+    """The "underscore-ized" alias of a camel case python name, e.g. _OpenUnit -> _open_unit."""
+    # Be careful to exclude both digits and lower case: only capitals gain an underscore.
+    name = _CAPITAL_LETTER.sub(lambda match: "_" + match.group(0).lower(), python_name[1:])
+    if name.startswith("__"):
+        name = name[1:]
+    return name
+
+
 def requires_device(error_message="This method requires a Device instance registered to this Library instance."):
     def check_device_decorator(method):
         def check_device_impl(self, device, *args, **kwargs):
@@ -46,7 +118,14 @@ def requires_device(error_message="This method requires a Device instance regist
 class Library(object):
     def __init__(self, name):
         self.name = name
-        self._clib = self._load()
+        # The shared library is loaded, and C functions are looked up in it, on first use. See make_symbol.
+        self._loaded_clib = None
+        self._load_lock = threading.Lock()
+        self._symbols = {}
+        # the last result of list_units, as (time, units).
+        self._listed_units = None
+        # (ready_event, BlockReadyType callback) by device handle, see run_block.
+        self._block_ready_callbacks = {}
         # ! some drivers will replace these dicts at import time, where they have different constants (notably ps2000).
         self.PICO_INFO = constants.PICO_INFO
         self.PICO_STATUS = constants.PICO_STATUS
@@ -59,6 +138,15 @@ class Library(object):
         # most series of scopes top out at 512MS.
         self.MAX_MEMORY = 2**29
 
+        # the largest timebase id get_timebase accepts, and (where known) a TimebaseFormula for estimating one.
+        self.MAX_TIMEBASE_ID = 2**32 - 1
+        self.TIMEBASE_FORMULA = None
+        # TimebaseFormulas for the resolutions at which TIMEBASE_FORMULA doesn't hold.
+        self.TIMEBASE_FORMULAS = {}
+
+        # how long (in seconds) list_units may reuse its last result by default.
+        self.LIST_UNITS_MAX_AGE = 1.0
+
         # These are set in some driver files, but not all.
         self.PICO_RATIO_MODE = {}
         self.PICO_THRESHOLD_DIRECTION = {}
@@ -87,33 +175,105 @@ class Library(object):
             raise CannotOpenPicoSDKError("PicoSDK (%s) not compatible (check 32 vs 64-bit): %s" % (self.name, e))
         return result
 
+    @property
+    def _clib(self):
+        if self._loaded_clib is None:
+            with self._load_lock:
+                if self._loaded_clib is None:
+                    self._loaded_clib = self._load()
+        return self._loaded_clib
+
+    @property
+    def is_loaded(self):
+        """True once the shared library has been loaded."""
+        return self._loaded_clib is not None
+
+    def load(self):
+        """Load the shared library now, rather than when the first C function is used.
+        Raises CannotFindPicoSDKError or CannotOpenPicoSDKError if the driver is not installed."""
+        return self._clib
+
     def __str__(self):
         return "picosdk %s library" % self.name
 
     def make_symbol(self, python_name, c_name, return_type, argument_types, docstring=None):
-        """Used by python wrappers for particular drivers to register C functions on the class."""
-        c_function = getattr(self._clib, c_name)
-        c_function.restype = return_type
-        c_function.argtypes = argument_types
-        if docstring is not None:
-            c_function.__doc__ = docstring
+        """Used by python wrappers for particular drivers to register C functions on the class.
+        The function is only looked up in the shared library (and the library loaded) when one of its names is first
+        used, so importing a driver module is cheap."""
+        symbol = CSymbol(python_name, c_name, return_type, argument_types, docstring)
         # make the functions available under *both* their original and generic names
-        setattr(self, python_name, c_function)
-        setattr(self, c_name, c_function)
+        self._symbols[python_name] = symbol
+        self._symbols[c_name] = symbol
         # AND if the function is camel case, add an "underscore-ized" version:
         if python_name.lower() != python_name:
-            acc = []
-            for c in python_name[1:]:
-                # Be careful to exclude both digits (lower index) and lower case (higher index).
-                if ord('A') <= ord(c) <= ord('Z'):
-                    c = "_" + c.lower()
-                acc.append(c)
-            if acc[:2] == ['_', '_']:
-                acc = acc[1:]
-            setattr(self, "".join(acc), c_function)
-
-    def list_units(self):
-        """Returns: a list of dictionaries which identify connected devices which use this driver."""
+            self._symbols[_underscore_name(python_name)] = symbol
+
+    def __getattr__(self, name):
+        # only called for names which are not set on the instance yet, i.e. C functions which haven't been used yet.
+        symbols = self.__dict__.get('_symbols', {})
+        if name not in symbols:
+            raise AttributeError("%r object has no attribute %r" % (type(self).__name__, name))
+        return self._bind_symbol(symbols[name])
+
+    def _bind_symbol(self, symbol):
+        c_function = getattr(self._clib, symbol.c_name)
+        c_function.restype = symbol.return_type
+        c_function.argtypes = symbol.argument_types
+        if symbol.docstring is not None:
+            c_function.__doc__ = symbol.docstring
+        for name, registered in self._symbols.items():
+            # don't hide a method of the same name (e.g. ps6000a's _getTriggerInfo alias, get_trigger_info.)
+            if registered is symbol and not hasattr(type(self), name):
+                setattr(self, name, c_function)
+        return c_function
+
+    def bind_symbols(self):
+        """Look up every registered C function now, rather than on first use.
+        Raises AttributeError if the installed driver is missing one of them."""
+        for symbol in list(self._symbols.values()):
+            if symbol.c_name not in self.__dict__:
+                self._bind_symbol(symbol)
+
+    def list_units(self, max_age=None):
+        """Returns: a list of UnitInfo tuples which identify connected devices which use this driver.
+        Where the driver can enumerate its units, no devices are opened (and variant is None).
+        max_age: how old (in seconds) a previous result may be and still be returned without searching again. Defaults
+            to LIST_UNITS_MAX_AGE; pass 0 to always search."""
+        if max_age is None:
+            max_age = self.LIST_UNITS_MAX_AGE
+        listed_units = self._listed_units
+        if listed_units is not None and time.time() - listed_units[0] <= max_age:
+            return list(listed_units[1])
+
+        if self.can_enumerate_units():
+            units = [UnitInfo(driver=self, variant=None, serial=serial) for serial in self._python_enumerate_units()]
+        else:
+            units = self._python_list_units_by_opening()
+
+        self._listed_units = (time.time(), units)
+        return list(units)
+
+    def can_enumerate_units(self):
+        """Returns: whether list_units can find devices without opening them."""
+        # picosynthEnumerateUnits takes a model rather than returning a count, so isn't supported here.
+        return hasattr(self, '_enumerate_units') and len(self._enumerate_units.argtypes) == 3 \
+            and self._enumerate_units.argtypes[0] is c_void_p
+
+    def _python_enumerate_units(self):
+        """Returns: the serial numbers of the connected devices which aren't open."""
+        count = c_int16(0)
+        serials = create_string_buffer(4096)
+        serial_length = c_int16(len(serials))
+        status = self._enumerate_units(byref(count), serials, byref(serial_length))
+        if status == self.PICO_STATUS['PICO_NOT_FOUND']:
+            return []
+        if status != self.PICO_STATUS['PICO_OK']:
+            raise PicoSDKCtypesError("enumerate_units failed (%s)" % constants.pico_tag(status))
+        if count.value == 0:
+            return []
+        return serials.value[:serial_length.value].split(b",")[:count.value]
+
+    def _python_list_units_by_opening(self):
         handles = []
         device_infos = []
         try:
@@ -137,11 +297,38 @@ class Library(object):
         returns: a Device instance, which has functions on it for collecting data and using the waveform generator (if
             present).
         Note: Either use this object in a context manager, or manually call .close() on it when you are finished."""
-        return Device(self, self._python_open_unit(serial=serial, resolution=resolution))
+        handle = self._python_open_unit(serial=serial, resolution=resolution)
+        self._listed_units = None
+        return Device(self, handle)
+
+    def can_open_unit_async(self):
+        """Returns: whether this driver can open a device in the background (see open_unit_async)."""
+        return hasattr(self, '_open_unit_async') and hasattr(self, '_open_unit_progress') \
+            and len(self._open_unit_async.argtypes) in (2, 3) and self._open_unit_async.argtypes[1] is c_char_p
+
+    def open_unit_async(self, serial=None, resolution=None):
+        """Start opening a device in the background. Only one device per driver may be opening at once.
+        arguments are as for open_unit.
+        returns: True if the open started, or False if another open on this driver is still in progress. Call
+            open_unit_progress until it returns a Device."""
+        return self._python_open_unit_async(serial, resolution)
+
+    def open_unit_progress(self):
+        """Poll a device being opened by open_unit_async.
+        returns: (progress_percent, device), where device is None until the open completes.
+        raises: DeviceNotFoundError if the open completed without finding the device."""
+        handle, progress, complete = self._python_open_unit_progress()
+        if not complete:
+            return progress, None
+        if handle < 1:
+            raise DeviceNotFoundError("Driver %s could not open the device (handle %d)" % (self.name, handle))
+        self._listed_units = None
+        return progress, Device(self, handle)
 
     @requires_device("close_unit requires a picosdk.device.Device instance, passed to the correct owning driver.")
     def close_unit(self, device):
         self._python_close_unit(device.handle)
+        self._listed_units = None
 
     @requires_device("get_unit_info requires a picosdk.device.Device instance, passed to the correct owning driver.")
     def get_unit_info(self, device, *args):
@@ -215,6 +402,31 @@ class Library(object):
 
         return handle, status
 
+    def _python_open_unit_async(self, serial, resolution):
+        cstatus = c_int16()
+        cserial = None if serial is None else create_string_buffer(serial)
+        if len(self._open_unit_async.argtypes) == 3:
+            if resolution is None:
+                resolution = self.DEFAULT_RESOLUTION
+            status = self._open_unit_async(byref(cstatus), cserial, c_int32(resolution))
+        else:
+            status = self._open_unit_async(byref(cstatus), cserial)
+
+        if status == self.PICO_STATUS['PICO_OPEN_OPERATION_IN_PROGRESS']:
+            return False
+        if status != self.PICO_STATUS['PICO_OK']:
+            raise DeviceNotFoundError("open_unit_async failed (%s)" % constants.pico_tag(status))
+        return cstatus.value != 0
+
+    def _python_open_unit_progress(self):
+        chandle = c_int16()
+        cprogress = c_int16()
+        ccomplete = c_int16()
+        status = self._open_unit_progress(byref(chandle), byref(cprogress), byref(ccomplete))
+        if status != self.PICO_STATUS['PICO_OK']:
+            raise DeviceNotFoundError("open_unit_progress failed (%s)" % constants.pico_tag(status))
+        return chandle.value, cprogress.value, ccomplete.value != 0
+
     def _python_close_unit(self, handle):
         return self._close_unit(c_int16(handle))
 
@@ -252,7 +464,6 @@ class Library(object):
 
         if not keys:
             # backwards compatible behaviour from first release of this wrapper, which works on all drivers.
-            UnitInfo = collections.namedtuple('UnitInfo', ['driver', 'variant', 'serial'])
             return UnitInfo(
                 driver=self,
                 variant=self._python_get_unit_info(handle, self.PICO_INFO["PICO_VARIANT_INFO"]),
@@ -260,14 +471,14 @@ class Library(object):
             )
 
         # make a new type here, with the relevant keys.
-        UnitInfo = collections.namedtuple('UnitInfo', list(keys))
+        KeyedUnitInfo = collections.namedtuple('UnitInfo', list(keys))
 
         info_lines = {}
 
         for line in keys:
             info_lines[line] = self._python_get_unit_info(handle, self.PICO_INFO[line])
 
-        return UnitInfo(**info_lines)
+        return KeyedUnitInfo(**info_lines)
 
     @requires_device("set_channel requires a picosdk.device.Device instance, passed to the correct owning driver.")
     def set_channel(self, device, channel_name='A', enabled=True, coupling='DC', range_peak=float('inf'),
@@ -368,13 +579,46 @@ class Library(object):
     def memory_segments(self, device, number_segments):
         if not hasattr(self, '_memory_segments'):
             raise DeviceCannotSegmentMemoryError()
-        max_samples = c_int32(0)
-        status = self._memory_segments(c_int16(device.handle), c_uint32(number_segments), byref(max_samples))
+        # the segment count (and on ps6000a and psospa, the max samples) are 16, 32 or 64 bit depending on the driver.
+        segments_type = self._memory_segments.argtypes[1]
+        max_samples = c_uint64(0) if segments_type == c_uint64 else c_int32(0)
+        status = self._memory_segments(c_int16(device.handle), segments_type(number_segments), byref(max_samples))
         if status != self.PICO_STATUS['PICO_OK']:
             raise InvalidMemorySegmentsError("could not segment the device memory into (%s) segments (%s)" % (
                                               number_segments, constants.pico_tag(status)))
         return max_samples
 
+    @requires_device()
+    def set_no_of_captures(self, device, number_captures):
+        """set the number of blocks which the next run_block captures, one into each memory segment (rapid block mode.)
+        Divide the memory into at least as many segments first (see memory_segments.)"""
+        if not hasattr(self, '_set_no_of_captures'):
+            raise FeatureNotSupportedError("%s devices do not support rapid block mode." % self.name)
+        status = self._set_no_of_captures(c_int16(device.handle),
+                                          self._set_no_of_captures.argtypes[1](number_captures))
+        if status != self.PICO_STATUS['PICO_OK']:
+            raise InvalidCaptureParameters("set_no_of_captures failed (%s)" % constants.pico_tag(status))
+
+    @requires_device("set_resolution requires a picosdk.device.Device instance, passed to the correct owning driver.")
+    def set_resolution(self, device, resolution):
+        """set the vertical resolution of a flexible resolution device.
+        resolution: a numeric constant from the relevant driver module (as for open_unit.)"""
+        if hasattr(self, '_set_device_resolution'):
+            status = self._set_device_resolution(c_int16(device.handle), resolution)
+        elif hasattr(self, '_set_resolution'):
+            status = self._set_resolution(c_int16(device.handle), resolution)
+        else:
+            raise FeatureNotSupportedError("%s devices have a fixed resolution." % self.name)
+        if status != self.PICO_STATUS['PICO_OK']:
+            raise ArgumentOutOfRangeError("set_resolution failed (%s)" % constants.pico_tag(status))
+
+    def timebase_formula(self, resolution=None):
+        """Returns: the TimebaseFormula for estimating timebases at resolution (None for the default resolution), or
+        None if it isn't known."""
+        if resolution is None:
+            resolution = getattr(self, 'DEFAULT_RESOLUTION', None)
+        return self.TIMEBASE_FORMULAS.get(resolution, self.TIMEBASE_FORMULA)
+
     @requires_device("get_timebase requires a picosdk.device.Device instance, passed to the correct owning driver.")
     def get_timebase(self, device, timebase_id, no_of_samples, oversample=1, segment_index=0):
         """query the device about what time precision modes it can handle.
@@ -423,6 +667,35 @@ class Library(object):
             if status != self.PICO_STATUS['PICO_OK']:
                 raise InvalidTimebaseError("get_timebase2 failed (%s)" % constants.pico_tag(status))
 
+            return TimebaseInfo(timebase_id, time_interval.value, None, max_samples.value, segment_index)
+        elif hasattr(self, '_get_timebase2') and (
+                     len(self._get_timebase2.argtypes) == 6 and self._get_timebase2.argtypes[2] == c_int32):
+            # ps4000a and ps5000a: no oversample.
+            time_interval = c_float(0.0)
+            max_samples = c_int32(0)
+            status = self._get_timebase2(c_int16(handle),
+                                         c_uint32(timebase_id),
+                                         c_int32(no_of_samples),
+                                         byref(time_interval),
+                                         byref(max_samples),
+                                         c_uint32(segment_index))
+            if status != self.PICO_STATUS['PICO_OK']:
+                raise InvalidTimebaseError("get_timebase2 failed (%s)" % constants.pico_tag(status))
+
+            return TimebaseInfo(timebase_id, time_interval.value, None, max_samples.value, segment_index)
+        elif len(self._get_timebase.argtypes) == 6 and self._get_timebase.argtypes[2] == c_uint64:
+            # ps6000a and psospa: 64 bit sample counts, and the interval is a double.
+            time_interval = c_double(0.0)
+            max_samples = c_uint64(0)
+            status = self._get_timebase(c_int16(handle),
+                                        c_uint32(timebase_id),
+                                        c_uint64(no_of_samples),
+                                        byref(time_interval),
+                                        byref(max_samples),
+                                        c_uint64(segment_index))
+            if status != self.PICO_STATUS['PICO_OK']:
+                raise InvalidTimebaseError("get_timebase failed (%s)" % constants.pico_tag(status))
+
             return TimebaseInfo(timebase_id, time_interval.value, None, max_samples.value, segment_index)
         else:
             raise NotImplementedError("not done other driver types yet")
@@ -455,19 +728,62 @@ class Library(object):
             raise NotImplementedError("not done other driver types yet")
 
     @requires_device()
-    def run_block(self, device, pre_trigger_samples, post_trigger_samples, timebase_id, oversample=1, segment_index=0):
+    def run_block(self, device, pre_trigger_samples, post_trigger_samples, timebase_id, oversample=1, segment_index=0,
+                  ready_event=None):
         """tell the device to arm any triggers and start capturing in block mode now.
+        ready_event: optionally, a threading.Event which the driver's BlockReady callback will set when the capture
+            has finished (only if can_signal_block_ready(), otherwise poll is_ready.)
         returns: the approximate time (in seconds) which the device will take to capture with these settings."""
+        ready = None
+        if ready_event is not None and self.can_signal_block_ready():
+            ready = self._block_ready_callback(device.handle, ready_event)
         return self._python_run_block(device.handle,
                                       pre_trigger_samples,
                                       post_trigger_samples,
                                       timebase_id,
                                       oversample,
-                                      segment_index)
-
-    def _python_run_block(self, handle, pre_samples, post_samples, timebase_id, oversample, segment_index):
+                                      segment_index,
+                                      ready)
+
+    def can_signal_block_ready(self):
+        """Returns: whether run_block can set a ready_event when the capture finishes."""
+        return hasattr(self, 'BlockReadyType') and self._run_block_form() in ('oversample', 'segment', 'segment64')
+
+    def _run_block_form(self):
+        # which RunBlock signature the driver has:
+        # 'legacy': no segments or callback (ps2000, ps3000.)
+        # 'oversample': with an oversample argument (ps2000a, ps3000a, ps4000, ps5000, ps6000.)
+        # 'segment': 32 bit sample counts, no oversample (ps4000a, ps5000a.)
+        # 'segment64': 64 bit sample counts, no oversample, and a double time indisposed (ps6000a, psospa.)
+        argtypes = self._run_block.argtypes
+        if len(argtypes) == 5:
+            return 'legacy'
+        if len(argtypes) == 9:
+            return 'oversample'
+        if len(argtypes) == 8 and argtypes[1] is c_uint64:
+            return 'segment64'
+        if len(argtypes) == 8 and argtypes[1] is c_int32:
+            return 'segment'
+        return None
+
+    def _block_ready_callback(self, handle, ready_event):
+        # the driver keeps a pointer to the callback until it fires, so we must keep the callback alive: we keep the
+        # last one for each device, and reuse it while it is for the same event.
+        callbacks = self._block_ready_callbacks
+        if handle in callbacks and callbacks[handle][0] is ready_event:
+            return callbacks[handle][1]
+
+        def block_ready(handle, status, parameter):
+            ready_event.set()
+
+        callback = self.BlockReadyType(block_ready)
+        callbacks[handle] = (ready_event, callback)
+        return callback
+
+    def _python_run_block(self, handle, pre_samples, post_samples, timebase_id, oversample, segment_index, ready=None):
         time_indisposed = c_int32(0)
-        if len(self._run_block.argtypes) == 5:
+        form = self._run_block_form()
+        if form == 'legacy':
             return_code = self._run_block(c_int16(handle),
                                           c_int32(pre_samples + post_samples),
                                           c_int16(timebase_id),
@@ -475,7 +791,7 @@ class Library(object):
                                           byref(time_indisposed))
             if return_code == 0:
                 raise InvalidCaptureParameters()
-        elif len(self._run_block.argtypes) == 9:
+        elif form == 'oversample':
             status = self._run_block(c_int16(handle),
                                      c_int32(pre_samples),
                                      c_int32(post_samples),
@@ -483,7 +799,32 @@ class Library(object):
                                      c_int16(oversample),
                                      byref(time_indisposed),
                                      c_uint32(segment_index),
-                                     None,
+                                     ready,
+                                     None)
+            if status != self.PICO_STATUS['PICO_OK']:
+                raise InvalidCaptureParameters("run_block failed (%s)" % constants.pico_tag(status))
+        elif form == 'segment':
+            # ps4000a and ps5000a: no oversample.
+            status = self._run_block(c_int16(handle),
+                                     c_int32(pre_samples),
+                                     c_int32(post_samples),
+                                     c_uint32(timebase_id),
+                                     byref(time_indisposed),
+                                     c_uint32(segment_index),
+                                     ready,
+                                     None)
+            if status != self.PICO_STATUS['PICO_OK']:
+                raise InvalidCaptureParameters("run_block failed (%s)" % constants.pico_tag(status))
+        elif form == 'segment64':
+            # ps6000a and psospa: 64 bit sample counts, no oversample, and the time indisposed is a double.
+            time_indisposed = c_double(0)
+            status = self._run_block(c_int16(handle),
+                                     c_uint64(pre_samples),
+                                     c_uint64(post_samples),
+                                     c_uint32(timebase_id),
+                                     byref(time_indisposed),
+                                     c_uint64(segment_index),
+                                     ready,
                                      None)
             if status != self.PICO_STATUS['PICO_OK']:
                 raise InvalidCaptureParameters("run_block failed (%s)" % constants.pico_tag(status))
@@ -492,6 +833,102 @@ class Library(object):
 
         return float(time_indisposed.value) * 0.001
 
+    def can_stream(self):
+        """Returns: whether run_streaming and get_streaming_latest_values are supported (with a StreamingReady
+        callback.)"""
+        return hasattr(self, 'StreamingReadyType') and hasattr(self, '_run_streaming') and (
+            len(self._run_streaming.argtypes) in (8, 9)) and len(self._get_streaming_latest_values.argtypes) == 3
+
+    def can_stream_data_info(self):
+        """Returns: whether the driver streams into buffers added with set_data_buffers, and reports progress in
+        PICO_STREAMING_DATA_INFO structures (ps6000a and psospa) rather than with a StreamingReady callback."""
+        return hasattr(self, '_get_streaming_latest_values') and len(self._get_streaming_latest_values.argtypes) == 4
+
+    @requires_device()
+    def run_streaming(self, device, sample_interval, buffer_size, pre_trigger_samples=0, post_trigger_samples=0,
+                      auto_stop=False):
+        """start capturing in streaming mode, into the buffers registered with set_data_buffers.
+        sample_interval: the time between samples (in seconds.)
+        buffer_size: the number of samples in each registered buffer (ps6000a and psospa use the buffers' own sizes.)
+        pre_trigger_samples, post_trigger_samples, auto_stop: with auto_stop, the device stops once it has captured this
+            many samples around a trigger. Otherwise it streams until stop is called.
+        returns: the sample interval the device chose (in seconds.)"""
+        if self.can_stream_data_info():
+            return self._run_streaming_data_info(device, sample_interval, pre_trigger_samples, post_trigger_samples,
+                                                 auto_stop)
+        if not self.can_stream():
+            raise FeatureNotSupportedError("%s devices cannot stream with a StreamingReady callback." % self.name)
+        # express the interval in the smallest of nanoseconds, microseconds, milliseconds or seconds which will fit.
+        time_units = 2
+        while round(sample_interval / constants.SECONDS_PER_TIME_UNIT[time_units]) >= 2**32 and time_units < 5:
+            time_units += 1
+        interval = c_uint32(int(round(sample_interval / constants.SECONDS_PER_TIME_UNIT[time_units])))
+
+        args = [c_int16(device.handle),
+                byref(interval),
+                c_int32(time_units),
+                c_uint32(pre_trigger_samples),
+                c_uint32(post_trigger_samples),
+                c_int16(int(auto_stop)),
+                c_uint32(1)]
+        if len(self._run_streaming.argtypes) == 9:
+            args.append(c_int32(self.PICO_RATIO_MODE['NONE']))
+        args.append(c_uint32(buffer_size))
+        status = self._run_streaming(*args)
+        if status != self.PICO_STATUS['PICO_OK']:
+            raise InvalidCaptureParameters("run_streaming failed (%s)" % constants.pico_tag(status))
+        return interval.value * constants.SECONDS_PER_TIME_UNIT[time_units]
+
+    def _run_streaming_data_info(self, device, sample_interval, pre_trigger_samples, post_trigger_samples, auto_stop):
+        # ps6000a and psospa take the interval as a double, and the buffer size from the buffers themselves.
+        PICO_NS = 2
+        PICO_RATIO_MODE_RAW = 0x80000000
+        interval = c_double(sample_interval / constants.SECONDS_PER_TIME_UNIT[PICO_NS])
+        status = self._run_streaming(c_int16(device.handle),
+                                     byref(interval),
+                                     c_uint32(PICO_NS),
+                                     c_uint64(pre_trigger_samples),
+                                     c_uint64(post_trigger_samples),
+                                     c_int16(int(auto_stop)),
+                                     c_uint64(1),
+                                     c_uint32(PICO_RATIO_MODE_RAW))
+        if status != self.PICO_STATUS['PICO_OK']:
+            raise InvalidCaptureParameters("run_streaming failed (%s)" % constants.pico_tag(status))
+        return interval.value * constants.SECONDS_PER_TIME_UNIT[PICO_NS]
+
+    @requires_device()
+    def get_streaming_latest_values_info(self, device, data_infos, trigger_info):
+        """on ps6000a and psospa, ask the driver how far it has streamed into the buffers added with set_data_buffers.
+        Poll this while streaming.
+        data_infos: a ctypes array of PICO_STREAMING_DATA_INFO, with the channel, mode (raw) and type (int16) set for
+            each enabled channel. The driver fills in the number of samples, buffer index, start index and overflow
+            of the samples written since the last call.
+        trigger_info: a PICO_STREAMING_DATA_TRIGGER_INFO, which the driver fills in.
+        returns: True if the driver has filled all the buffers it was given, and is waiting for more to be added."""
+        status = self._get_streaming_latest_values(c_int16(device.handle),
+                                                   byref(data_infos),
+                                                   c_uint64(len(data_infos)),
+                                                   byref(trigger_info))
+        if status == self.PICO_STATUS['PICO_WAITING_FOR_DATA_BUFFERS']:
+            return True
+        if status not in (self.PICO_STATUS['PICO_OK'], self.PICO_STATUS['PICO_BUSY']):
+            raise InvalidCaptureParameters("get_streaming_latest_values failed (%s)" % constants.pico_tag(status))
+        return False
+
+    @requires_device()
+    def get_streaming_latest_values(self, device, streaming_ready):
+        """ask the driver for the samples captured since the last call. Poll this while streaming.
+        streaming_ready: a StreamingReadyType callback, which the driver calls before this returns if there are new
+            samples, with (handle, number of samples, start index in the buffers, overflow flags, trigger index,
+            triggered, auto stopped, parameter.)
+        returns: False if the driver was busy (and didn't call back), otherwise True."""
+        status = self._get_streaming_latest_values(c_int16(device.handle), streaming_ready, None)
+        if status == self.PICO_STATUS['PICO_BUSY']:
+            return False
+        if status != self.PICO_STATUS['PICO_OK']:
+            raise InvalidCaptureParameters("get_streaming_latest_values failed (%s)" % constants.pico_tag(status))
+        return True
+
     @requires_device()
     def is_ready(self, device):
         """poll this function to find out when block mode is ready or has triggered.
@@ -518,14 +955,93 @@ class Library(object):
 
     @requires_device()
     def get_values(self, device, active_channels, num_samples, segment_index=0):
+        """collect the data from a block capture into new buffers.
+        returns: a dict of int16 arrays (by channel name), and a dict of channels which overflowed."""
         # Initialise buffers to hold the data:
         results = {channel: numpy.empty(num_samples, numpy.dtype('int16')) for channel in active_channels}
+        self.set_data_buffers(device, results, segment_index)
+        overflow_warning = self.get_values_into(device, results, num_samples, segment_index)
+        return results, overflow_warning
+
+    @requires_device()
+    def set_data_buffers(self, device, buffers, segment_index=0):
+        """register buffers for get_values_into (or get_values_bulk) to fill. Buffers stay registered with the driver
+        until they are replaced, so capturing repeatedly into the same buffers only needs this to be called once.
+        buffers: a dict of (contiguous) int16 numpy arrays, by channel name. You must keep them alive while registered.
+        segment_index: the memory segment which these buffers are for."""
+        if len(self._get_values.argtypes) == 7 and self._get_timebase.argtypes[1] == c_int16:
+            # drivers whose get_values takes the buffers directly (ps2000, ps3000) have nothing to register.
+            return
+        for channel, array in buffers.items():
+            self._python_set_data_buffer(device.handle, self.PICO_CHANNEL[channel], array, segment_index)
+
+    @requires_device()
+    def clear_data_buffers(self, device):
+        """on drivers which keep adding buffers until told otherwise (ps6000a and psospa), unregister all the buffers
+        registered with set_data_buffers. Other drivers replace a buffer when a new one is registered in its place."""
+        if len(self._set_data_buffer.argtypes) != 8:
+            return
+        PICO_INT16_T = 1
+        PICO_RATIO_MODE_RAW = 0x80000000
+        PICO_CLEAR_ALL = 1
+        status = self._set_data_buffer(c_int16(device.handle),
+                                       c_uint32(0),
+                                       None,
+                                       self._set_data_buffer.argtypes[3](0),
+                                       c_uint32(PICO_INT16_T),
+                                       c_uint64(0),
+                                       c_uint32(PICO_RATIO_MODE_RAW),
+                                       c_uint32(PICO_CLEAR_ALL))
+        if status != self.PICO_STATUS['PICO_OK']:
+            raise InvalidCaptureParameters("clear_data_buffers failed (%s)" % constants.pico_tag(status))
+
+    def _python_set_data_buffer(self, handle, channel_id, array, segment_index):
+        argument_types = self._set_data_buffer.argtypes
+        if len(argument_types) == 6:
+            status = self._set_data_buffer(c_int16(handle),
+                                           c_int32(channel_id),
+                                           array.ctypes.data,
+                                           c_int32(len(array)),
+                                           c_uint32(segment_index),
+                                           c_int32(self.PICO_RATIO_MODE['NONE']))
+        elif len(argument_types) == 8:
+            # ps6000a and psospa: add this buffer to those registered (for other channels and segments.)
+            PICO_INT16_T = 1
+            PICO_RATIO_MODE_RAW = 0x80000000
+            PICO_ADD = 2
+            status = self._set_data_buffer(c_int16(handle),
+                                           c_uint32(channel_id),
+                                           array.ctypes.data,
+                                           argument_types[3](len(array)),
+                                           c_uint32(PICO_INT16_T),
+                                           c_uint64(segment_index),
+                                           c_uint32(PICO_RATIO_MODE_RAW),
+                                           c_uint32(PICO_ADD))
+        elif hasattr(self, '_set_data_buffer_bulk'):
+            # ps4000 and ps6000: set_data_buffer has no segment index, but set_data_buffer_bulk does.
+            bulk_argument_types = self._set_data_buffer_bulk.argtypes
+            args = [c_int16(handle),
+                    c_int32(channel_id),
+                    array.ctypes.data,
+                    bulk_argument_types[3](len(array)),
+                    bulk_argument_types[4](segment_index)]
+            if len(bulk_argument_types) == 6:
+                args.append(c_int32(self.PICO_RATIO_MODE['NONE']))
+            status = self._set_data_buffer_bulk(*args)
+        else:
+            raise NotImplementedError("not done other driver types yet")
+        if status != self.PICO_STATUS['PICO_OK']:
+            raise InvalidCaptureParameters("set_data_buffer failed (%s)" % constants.pico_tag(status))
 
+    @requires_device()
+    def get_values_into(self, device, buffers, num_samples, segment_index=0):
+        """collect the data from a block capture into buffers registered with set_data_buffers.
+        returns: a dict of channels which overflowed."""
         overflow = c_int16(0)
 
         if len(self._get_values.argtypes) == 7 and self._get_timebase.argtypes[1] == c_int16:
             inputs = {k: None for k in 'ABCD'}
-            for k, arr in results.items():
+            for k, arr in buffers.items():
                 inputs[k] = arr.ctypes.data
             return_code = self._get_values(c_int16(device.handle),
                                            inputs['A'],
@@ -537,18 +1053,6 @@ class Library(object):
             if return_code == 0:
                 raise InvalidCaptureParameters()
         elif len(self._get_values.argtypes) == 7 and self._get_timebase.argtypes[1] == c_uint32:
-            # For this function pattern, we first call a function (self._set_data_buffer) to register each buffer. Then,
-            # we can call self._get_values to actually populate them.
-            for channel, array in results.items():
-                status = self._set_data_buffer(c_int16(device.handle),
-                                               c_int32(self.PICO_CHANNEL[channel]),
-                                               array.ctypes.data,
-                                               c_int32(num_samples),
-                                               c_uint32(segment_index),
-                                               c_int32(self.PICO_RATIO_MODE['NONE']))
-                if status != self.PICO_STATUS['PICO_OK']:
-                    raise InvalidCaptureParameters("set_data_buffer failed (%s)" % constants.pico_tag(status))
-
             samples_collected = c_uint32(num_samples)
             status = self._get_values(c_int16(device.handle),
                                       c_uint32(0),
@@ -562,11 +1066,226 @@ class Library(object):
 
         overflow_warning = {}
         if overflow.value:
-            for channel in results.keys():
-                if overflow.value & (1 >> self.PICO_CHANNEL[channel]):
+            for channel in buffers.keys():
+                if overflow.value & (1 << self.PICO_CHANNEL[channel]):
                     overflow_warning[channel] = True
 
-        return results, overflow_warning
+        return overflow_warning
+
+    @requires_device()
+    def get_values_bulk(self, device, num_samples, from_segment, to_segment, overflow=None):
+        """collect the data from a rapid block capture, for the segments from_segment to to_segment (inclusive), into
+        the buffers registered with set_data_buffers for each of those segments.
+        overflow: optionally, an int16 array with an element for each segment, to fill with the overflow flags.
+        returns: the int16 array of overflow flags, one per segment. Bit n is set if the channel numbered n (see
+            PICO_CHANNEL) overflowed in that segment."""
+        if not hasattr(self, '_get_values_bulk'):
+            raise FeatureNotSupportedError("%s devices do not support rapid block mode." % self.name)
+        if overflow is None:
+            overflow = numpy.zeros(to_segment - from_segment + 1, numpy.dtype('int16'))
+
+        argument_types = self._get_values_bulk.argtypes
+        if len(argument_types) == 7:
+            samples_collected = c_uint32(num_samples)
+            status = self._get_values_bulk(c_int16(device.handle),
+                                           byref(samples_collected),
+                                           c_uint32(from_segment),
+                                           c_uint32(to_segment),
+                                           c_uint32(1),
+                                           c_int32(self.PICO_RATIO_MODE['NONE']),
+                                           overflow.ctypes.data)
+        elif len(argument_types) == 5:
+            # ps4000: no downsampling, and 16 bit segment indices.
+            samples_collected = c_uint32(num_samples)
+            status = self._get_values_bulk(c_int16(device.handle),
+                                           byref(samples_collected),
+                                           c_uint16(from_segment),
+                                           c_uint16(to_segment),
+                                           overflow.ctypes.data)
+        elif len(argument_types) == 8:
+            # ps6000a and psospa: 64 bit sample counts and segment indices, from a start index.
+            PICO_RATIO_MODE_RAW = 0x80000000
+            samples_collected = c_uint64(num_samples)
+            status = self._get_values_bulk(c_int16(device.handle),
+                                           c_uint64(0),
+                                           byref(samples_collected),
+                                           c_uint64(from_segment),
+                                           c_uint64(to_segment),
+                                           c_uint64(1),
+                                           c_uint32(PICO_RATIO_MODE_RAW),
+                                           overflow.ctypes.data)
+        else:
+            raise NotImplementedError("not done other driver types yet")
+        if status != self.PICO_STATUS['PICO_OK']:
+            raise InvalidCaptureParameters("get_values_bulk failed (%s)" % constants.pico_tag(status))
+        return overflow
+
+    def can_get_values_async(self):
+        """Returns: whether get_values_async is supported."""
+        return hasattr(self, 'DataReadyType') and hasattr(self, '_get_values_async')
+
+    @requires_device()
+    def get_values_async(self, device, num_samples, segment_index, data_ready):
+        """start reading a finished block from memory segment segment_index into the buffers registered for it with
+        set_data_buffers, and return without waiting for the transfer.
+        data_ready: a DataReadyType callback, which the driver calls (on its own thread) once the data has been
+            transferred, with (handle, status, number of samples, overflow flags, parameter). You must keep it alive
+            until then."""
+        if not self.can_get_values_async():
+            raise FeatureNotSupportedError("%s devices cannot read data asynchronously." % self.name)
+        argument_types = self._get_values_async.argtypes
+        if argument_types[1] == c_uint64:
+            # ps6000a and psospa
+            PICO_RATIO_MODE_RAW = 0x80000000
+            ratio_mode = PICO_RATIO_MODE_RAW
+        else:
+            ratio_mode = self.PICO_RATIO_MODE['NONE']
+        status = self._get_values_async(c_int16(device.handle),
+                                        argument_types[1](0),
+                                        argument_types[2](num_samples),
+                                        argument_types[3](1),
+                                        argument_types[4](ratio_mode),
+                                        argument_types[5](segment_index),
+                                        data_ready,
+                                        None)
+        if status != self.PICO_STATUS['PICO_OK']:
+            raise InvalidCaptureParameters("get_values_async failed (%s)" % constants.pico_tag(status))
+
+    def can_get_values_overlapped(self):
+        """Returns: whether get_values_overlapped is supported."""
+        return hasattr(self, '_get_values_overlapped')
+
+    @requires_device()
+    def get_values_overlapped(self, device, num_samples, from_segment=0, to_segment=None, overflow=None):
+        """ask the driver to read the next capture into the buffers registered with set_data_buffers as soon as it
+        finishes, so that no get_values (or get_values_bulk) call is needed afterwards. Call this before run_block.
+        from_segment, to_segment: the segments to read (to_segment defaults to from_segment, i.e. one block.)
+        overflow: optionally, an int16 array with an element for each segment, which the driver fills with the
+            overflow flags (as for get_values_bulk) when it reads the data.
+        returns: the overflow array, and the ctypes integer which the driver sets to the number of samples read. You
+            must keep both alive until the capture has finished."""
+        if not self.can_get_values_overlapped():
+            raise FeatureNotSupportedError("%s devices cannot read data during a capture." % self.name)
+        if to_segment is None:
+            to_segment = from_segment
+        if overflow is None:
+            overflow = numpy.zeros(to_segment - from_segment + 1, numpy.dtype('int16'))
+
+        if len(self._get_values_overlapped.argtypes) == 8:
+            # ps6000a and psospa: one function for one or many segments.
+            PICO_RATIO_MODE_RAW = 0x80000000
+            samples_collected = c_uint64(num_samples)
+            status = self._get_values_overlapped(c_int16(device.handle),
+                                                 c_uint64(0),
+                                                 byref(samples_collected),
+                                                 c_uint64(1),
+                                                 c_uint32(PICO_RATIO_MODE_RAW),
+                                                 c_uint64(from_segment),
+                                                 c_uint64(to_segment),
+                                                 overflow.ctypes.data)
+        elif from_segment == to_segment:
+            samples_collected = c_uint32(num_samples)
+            status = self._get_values_overlapped(c_int16(device.handle),
+                                                 c_uint32(0),
+                                                 byref(samples_collected),
+                                                 c_uint32(1),
+                                                 c_int32(self.PICO_RATIO_MODE['NONE']),
+                                                 c_uint32(from_segment),
+                                                 overflow.ctypes.data)
+        else:
+            samples_collected = c_uint32(num_samples)
+            argument_types = self._get_values_overlapped_bulk.argtypes
+            status = self._get_values_overlapped_bulk(c_int16(device.handle),
+                                                      c_uint32(0),
+                                                      byref(samples_collected),
+                                                      c_uint32(1),
+                                                      c_int32(self.PICO_RATIO_MODE['NONE']),
+                                                      argument_types[5](from_segment),
+                                                      argument_types[6](to_segment),
+                                                      overflow.ctypes.data)
+        if status != self.PICO_STATUS['PICO_OK']:
+            raise InvalidCaptureParameters("get_values_overlapped failed (%s)" % constants.pico_tag(status))
+        return overflow, samples_collected
+
+    @requires_device()
+    def stop_using_get_values_overlapped(self, device):
+        """on drivers which need it (ps6000a and psospa), stop reading captures as set up by get_values_overlapped."""
+        if not hasattr(self, '_stop_using_get_values_overlapped'):
+            return
+        status = self._stop_using_get_values_overlapped(c_int16(device.handle))
+        if status != self.PICO_STATUS['PICO_OK']:
+            raise InvalidCaptureParameters("stop_using_get_values_overlapped failed (%s)" % constants.pico_tag(status))
+
+    @requires_device()
+    def get_trigger_time_offsets_bulk(self, device, from_segment, to_segment, times=None, time_units=None):
+        """get the offset of each segment's trigger point from its trigger sample, for the segments from_segment to
+        to_segment (inclusive) of a rapid block capture.
+        times, time_units: optionally, int64 and int32 arrays with an element for each segment, to fill.
+        returns: the int64 array of offsets, and the int32 array of their time units (0 for femtoseconds, up to 5 for
+            seconds), one per segment."""
+        if hasattr(self, '_get_values_trigger_time_offset_bulk64'):
+            get_offsets = self._get_values_trigger_time_offset_bulk64
+        elif hasattr(self, '_get_values_trigger_time_offset_bulk') and (
+                len(self._get_values_trigger_time_offset_bulk.argtypes) == 5):
+            get_offsets = self._get_values_trigger_time_offset_bulk
+        else:
+            raise FeatureNotSupportedError("%s devices cannot report trigger time offsets in bulk." % self.name)
+        no_of_segments = to_segment - from_segment + 1
+        if times is None:
+            times = numpy.zeros(no_of_segments, numpy.dtype('int64'))
+        if time_units is None:
+            time_units = numpy.zeros(no_of_segments, numpy.dtype('int32'))
+        _check_buffer('times', times, 'int64', no_of_segments)
+        _check_buffer('time_units', time_units, 'int32', no_of_segments)
+
+        status = get_offsets(c_int16(device.handle),
+                             times.ctypes.data,
+                             time_units.ctypes.data,
+                             get_offsets.argtypes[3](from_segment),
+                             get_offsets.argtypes[4](to_segment))
+        if status != self.PICO_STATUS['PICO_OK']:
+            raise InvalidCaptureParameters("get_trigger_time_offsets_bulk failed (%s)" % constants.pico_tag(status))
+        return times, time_units
+
+    @requires_device()
+    def get_trigger_time_offsets_seconds(self, device, from_segment, to_segment, out=None, times=None,
+                                         time_units=None):
+        """get the offset (in seconds) of each segment's trigger point from its trigger sample, for the segments
+        from_segment to to_segment (inclusive) of a rapid block capture, converting the driver's offsets and units in
+        one vectorized step.
+        out: optionally, a float64 array with an element for each segment, to fill.
+        times, time_units: optionally, int64 and int32 arrays (as for get_trigger_time_offsets_bulk) to read into.
+        returns: the float64 array of offsets (a view of out, if given.)"""
+        no_of_segments = to_segment - from_segment + 1
+        if out is not None:
+            _check_buffer('out', out, 'float64', no_of_segments)
+            out = out[:no_of_segments]
+        times, time_units = self.get_trigger_time_offsets_bulk(device, from_segment, to_segment, times, time_units)
+        return numpy.multiply(times[:no_of_segments], _SECONDS_PER_TIME_UNIT[time_units[:no_of_segments]], out=out)
+
+    def can_get_trigger_info(self):
+        """Returns: whether get_trigger_info_records is supported (ps6000a and psospa.)"""
+        return hasattr(self, '_get_trigger_info') and self._get_trigger_info.argtypes[2] == c_uint64
+
+    @requires_device()
+    def get_trigger_info_records(self, device, first_segment, segment_count, info=None):
+        """get the trigger information of segment_count segments of a rapid block capture, from first_segment.
+        info: optionally, an array of TRIGGER_INFO_DTYPE with an element for each segment, to fill.
+        returns: the array of TRIGGER_INFO_DTYPE records, with the status, segment index, trigger index, trigger time
+            (jitter) and its time units, the number of missed triggers, and the time stamp counter (in samples) of
+            each segment."""
+        if not self.can_get_trigger_info():
+            raise FeatureNotSupportedError("%s devices cannot report trigger info." % self.name)
+        if info is None:
+            info = numpy.zeros(segment_count, TRIGGER_INFO_DTYPE)
+        _check_buffer('info', info, TRIGGER_INFO_DTYPE, segment_count)
+        status = self._get_trigger_info(c_int16(device.handle),
+                                        info.ctypes.data,
+                                        c_uint64(first_segment),
+                                        c_uint64(segment_count))
+        if status != self.PICO_STATUS['PICO_OK']:
+            raise InvalidCaptureParameters("get_trigger_info_records failed (%s)" % constants.pico_tag(status))
+        return info
 
     @requires_device()
     def stop(self, device):
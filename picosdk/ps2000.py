@@ -6,10 +6,13 @@ This is a Python module defining the functions from the ps2000.h C header file
 for PicoScope 2000 Series oscilloscopes using the ps2000 driver API functions.
 """
 
+import collections
+import time
 from ctypes import *
-from picosdk.library import Library
-from picosdk.errors import ArgumentOutOfRangeError
-from picosdk.constants import make_enum
+import numpy
+from picosdk.library import Library, requires_device
+from picosdk.errors import ArgumentOutOfRangeError, InvalidCaptureParameters, NoChannelsEnabledError
+from picosdk.constants import make_enum, SECONDS_PER_TIME_UNIT
 from picosdk.ctypes_wrapper import C_CALLBACK_FUNCTION_FACTORY
 
 
@@ -17,6 +20,38 @@ class Ps2000lib(Library):
     def __init__(self):
         super(Ps2000lib, self).__init__("ps2000")
 
+    @requires_device()
+    def run_streaming_ns(self, device, sample_interval, max_samples, auto_stop=False, samples_per_aggregate=1,
+                         overview_buffer_size=50000):
+        """start fast streaming, for get_streaming_last_values to collect.
+        sample_interval: the time between samples (in seconds.)
+        max_samples: the number of samples the driver keeps (and, with auto_stop, stops after.)
+        samples_per_aggregate: the number of samples which each value in the overview buffers is the max and min of.
+        overview_buffer_size: the number of values in each overview buffer. Poll often enough that it doesn't fill.
+        returns: the sample interval (in seconds), as passed to the driver."""
+        # express the interval in the smallest of nanoseconds, microseconds, milliseconds or seconds which will fit.
+        time_units = 2
+        while round(sample_interval / SECONDS_PER_TIME_UNIT[time_units]) >= 2**32 and time_units < 5:
+            time_units += 1
+        interval = int(round(sample_interval / SECONDS_PER_TIME_UNIT[time_units]))
+        return_code = self._run_streaming_ns(c_int16(device.handle),
+                                             c_uint32(interval),
+                                             c_int32(time_units),
+                                             c_uint32(max_samples),
+                                             c_int16(int(auto_stop)),
+                                             c_uint32(samples_per_aggregate),
+                                             c_uint32(overview_buffer_size))
+        if return_code == 0:
+            raise InvalidCaptureParameters("run_streaming_ns failed")
+        return interval * SECONDS_PER_TIME_UNIT[time_units]
+
+    @requires_device()
+    def get_streaming_last_values(self, device, get_overview_buffers):
+        """pass the values streamed since the last call to get_overview_buffers (a GetOverviewBuffersType), before
+        returning.
+        returns: False if there were no new values (so the callback wasn't called), otherwise True."""
+        return self._get_streaming_last_values(c_int16(device.handle), get_overview_buffers) != 0
+
 
 ps2000 = Ps2000lib()
 
@@ -75,6 +110,9 @@ ps2000.PICO_VOLTAGE_RANGE = {
 
 ps2000.MAX_MEMORY = 32e3
 
+# get_timebase takes an int16 timebase id.
+ps2000.MAX_TIMEBASE_ID = 2**15 - 1
+
 ps2000.PS2000_TIME_UNITS = make_enum([
     'PS2000_FS',
     'PS2000_PS',
@@ -445,4 +483,128 @@ ps2000.GetOverviewBuffersType = C_CALLBACK_FUNCTION_FACTORY(None,
                                                          c_int16,
                                                          c_uint32)
 
-ps2000.GetOverviewBuffersType.__doc__ = doc
\ No newline at end of file
+ps2000.GetOverviewBuffersType.__doc__ = doc
+
+
+"""StreamingChunk: consecutive values from a StreamingCollector (the last chunk may be shorter.)
+start = the number of values streamed before the first one in this chunk.
+max, min = (channels, values) arrays of raw ADC counts (int16), in the order of StreamingCollector.channels. Each
+           value is the max (and min) of samples_per_aggregate samples: with one sample per aggregate, they are equal.
+overflow = a (channels,) bool array, which is True where the channel overflowed in the polls for this chunk.
+trigger_index = the index in this chunk of the trigger, or None if the device didn't trigger during it."""
+StreamingChunk = collections.namedtuple('StreamingChunk', ['start', 'max', 'min', 'overflow', 'trigger_index'])
+
+
+class StreamingCollector(object):
+    """Fast streaming on a ps2000 device, as an iterator of StreamingChunk.
+    Each poll copies the overview buffers straight into preallocated numpy arrays, with a slice copy per buffer (of a
+    numpy.ctypeslib.as_array view of the driver's buffer), so no Python object is made per sample. Iterating polls the
+    driver until the next chunk is full.
+    Each chunk's arrays are views, which are overwritten once you move on to the next chunk: copy them if you need to
+    keep them. Please stop the collector (or use it as a context manager) if you finish iterating early.
+    usage:
+        with StreamingCollector(device, 1e-6, chunk_samples=100000) as collector:
+            for chunk in collector:
+                process(chunk.max[0])"""
+    def __init__(self, device, sample_interval, chunk_samples=100000, samples_per_aggregate=1,
+                 overview_buffer_size=50000, max_samples=None, poll_interval=None):
+        self.device = device
+        driver = device.driver
+        self.channels = tuple(sorted(device._channel_ranges, key=lambda channel: driver.PICO_CHANNEL[channel]))
+        if not self.channels:
+            raise NoChannelsEnabledError("We cannot capture any data if no channels are enabled.")
+        self.chunk_samples = chunk_samples
+        self.max_samples = max_samples
+        self._channel_indices = [driver.PICO_CHANNEL[channel] for channel in self.channels]
+        # room for a whole chunk, plus a full overview buffer which overruns the end of it.
+        shape = (len(self.channels), chunk_samples + overview_buffer_size)
+        self._max = numpy.empty(shape, numpy.dtype('int16'))
+        self._min = numpy.empty(shape, numpy.dtype('int16'))
+        self._overflow = numpy.zeros(len(self.channels), numpy.dtype('bool'))
+        self._trigger_index = None
+        self._filled = 0
+        self._held = 0
+        self._start = 0
+        self._auto_stopped = False
+        self._stopped = False
+        self._get_overview_buffers = driver.GetOverviewBuffersType(self._on_overview_buffers)
+
+        self.sample_interval = driver.run_streaming_ns(device,
+                                                       sample_interval,
+                                                       max_samples if max_samples is not None else chunk_samples,
+                                                       auto_stop=max_samples is not None,
+                                                       samples_per_aggregate=samples_per_aggregate,
+                                                       overview_buffer_size=overview_buffer_size)
+        if poll_interval is None:
+            poll_interval = max(1e-4, min(0.01, overview_buffer_size * self.sample_interval / 4))
+        self.poll_interval = poll_interval
+
+    def _on_overview_buffers(self, overview_buffers, overflow, trigger_at, triggered, auto_stop, n_values):
+        if n_values > 0:
+            end = self._filled + n_values
+            # the overview buffers are max and min for channel A, then for channel B.
+            for i, channel_index in enumerate(self._channel_indices):
+                self._max[i, self._filled:end] = numpy.ctypeslib.as_array(overview_buffers[2 * channel_index],
+                                                                          (n_values,))
+                self._min[i, self._filled:end] = numpy.ctypeslib.as_array(overview_buffers[2 * channel_index + 1],
+                                                                          (n_values,))
+                if overflow & (1 << channel_index):
+                    self._overflow[i] = True
+            if triggered and self._trigger_index is None:
+                self._trigger_index = self._filled + trigger_at
+            self._filled = end
+        if auto_stop:
+            self._auto_stopped = True
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        self._release()
+        remaining = self.chunk_samples
+        if self.max_samples is not None:
+            remaining = min(remaining, self.max_samples - self._start)
+        while self._filled < remaining and not self._auto_stopped and not self._stopped:
+            if not self.device.driver.get_streaming_last_values(self.device, self._get_overview_buffers):
+                time.sleep(self.poll_interval)
+        count = min(remaining, self._filled)
+        if count <= 0:
+            self.stop()
+            raise StopIteration
+        self._held = count
+        trigger_index = self._trigger_index
+        if trigger_index is not None and trigger_index >= count:
+            trigger_index = None
+        return StreamingChunk(self._start, self._max[:, :count], self._min[:, :count], self._overflow.copy(),
+                              trigger_index)
+
+    # python 2
+    next = __next__
+
+    def _release(self):
+        """move the values after the chunk which was returned last to the start of the arrays."""
+        if not self._held:
+            return
+        count = self._held
+        leftover = self._filled - count
+        self._max[:, :leftover] = self._max[:, count:self._filled]
+        self._min[:, :leftover] = self._min[:, count:self._filled]
+        self._filled = leftover
+        self._start += count
+        self._held = 0
+        self._overflow[:] = False
+        if self._trigger_index is not None:
+            self._trigger_index = self._trigger_index - count if self._trigger_index >= count else None
+
+    def stop(self):
+        """stop the device streaming, and end the iteration."""
+        if self._stopped:
+            return
+        self._stopped = True
+        self.device.driver.stop(self.device)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
@@ -8,7 +8,7 @@ file for PicoScope 2000 Series oscilloscopes using the ps2000a driver API functi
 
 from ctypes import *
 from picosdk.ctypes_wrapper import C_CALLBACK_FUNCTION_FACTORY
-from picosdk.library import Library
+from picosdk.library import Library, TimebaseFormula
 from picosdk.constants import make_enum
 
 
@@ -65,6 +65,9 @@ ps2000a.PICO_VOLTAGE_RANGE = {
 
 ps2000a.MAX_MEMORY = 128e6
 
+# 1 GS/s models: timebases 0-2 are 2**n / 1e9, and above that (n - 2) / 125e6.
+ps2000a.TIMEBASE_FORMULA = TimebaseFormula(3, 1e9, 125e6, 2)
+
 ps2000a.PS2000A_RATIO_MODE = {
     'PS2000A_RATIO_MODE_NONE': 0,
     'PS2000A_RATIO_MODE_AGGREGATE': 1,
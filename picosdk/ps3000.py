@@ -18,6 +18,9 @@ class Ps3000lib(Library):
 
 ps3000 = Ps3000lib()
 
+# get_timebase takes an int16 timebase id.
+ps3000.MAX_TIMEBASE_ID = 2**15 - 1
+
 ps3000.PS3000_CHANNEL = make_enum([
     "PS3000_CHANNEL_A",
     "PS3000_CHANNEL_B",
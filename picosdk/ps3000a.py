@@ -9,7 +9,7 @@ functions.
 
 from ctypes import *
 from picosdk.ctypes_wrapper import C_CALLBACK_FUNCTION_FACTORY
-from picosdk.library import Library
+from picosdk.library import Library, TimebaseFormula
 from picosdk.constants import make_enum
 
 
@@ -63,6 +63,8 @@ ps3000a.PICO_VOLTAGE_RANGE = {
     for k, v in ps3000a.PS3000A_RANGE.items() if k != "PS3000A_MAX_RANGES"
 }
 
+ps3000a.TIMEBASE_FORMULA = TimebaseFormula(3, 1e9, 125e6, 2)
+
 ps3000a.PS3000A_RATIO_MODE = {
     'PS3000A_RATIO_MODE_NONE': 0,
     'PS3000A_RATIO_MODE_AGGREGATE': 1,
@@ -70,6 +72,8 @@ ps3000a.PS3000A_RATIO_MODE = {
     'PS3000A_RATIO_MODE_AVERAGE': 4,
 }
 
+ps3000a.PICO_RATIO_MODE = {k[19:]: v for k, v in ps3000a.PS3000A_RATIO_MODE.items()}
+
 ps3000a.PS3000A_TIME_UNITS = make_enum([
     'PS3000A_FS',
     'PS3000A_PS',
@@ -707,6 +711,22 @@ ps3000a.StreamingReadyType = C_CALLBACK_FUNCTION_FACTORY(None,
 
 ps3000a.StreamingReadyType.__doc__ = doc
 
+doc = """ void *ps3000aBlockReady
+    (
+        int16_t    handle,
+        PICO_STATUS    status,
+        void    *pParameter
+    );
+    define a python function which accepts the correct arguments, and pass it to the constructor of this type.
+    """
+
+ps3000a.BlockReadyType = C_CALLBACK_FUNCTION_FACTORY(None,
+                                                     c_int16,
+                                                     c_uint32,
+                                                     c_void_p)
+
+ps3000a.BlockReadyType.__doc__ = doc
+
 doc = """ PICO_STATUS ps3000aNoOfStreamingValues
     (
         int16_t   handle,
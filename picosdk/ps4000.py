@@ -652,6 +652,22 @@ ps4000.StreamingReadyType = C_CALLBACK_FUNCTION_FACTORY(None,
 
 ps4000.StreamingReadyType.__doc__ = doc
 
+doc = """ void *ps4000BlockReady
+    (
+        int16_t    handle,
+        PICO_STATUS    status,
+        void    *pParameter
+    );
+    define a python function which accepts the correct arguments, and pass it to the constructor of this type.
+    """
+
+ps4000.BlockReadyType = C_CALLBACK_FUNCTION_FACTORY(None,
+                                                    c_int16,
+                                                    c_uint32,
+                                                    c_void_p)
+
+ps4000.BlockReadyType.__doc__ = doc
+
 doc = """ PICO_STATUS ps4000NoOfStreamingValues
     (
         int16_t   handle,
@@ -8,7 +8,7 @@ functions.
 """
 
 from ctypes import *
-from picosdk.library import Library
+from picosdk.library import Library, TimebaseFormula
 from picosdk.constants import make_enum
 from picosdk.ctypes_wrapper import C_CALLBACK_FUNCTION_FACTORY
 
@@ -194,6 +194,8 @@ def process_enum(enum):
 
 ps4000a.PICO_VOLTAGE_RANGE = process_enum(ps4000a.PICO_CONNECT_PROBE_RANGE)
 
+ps4000a.TIMEBASE_FORMULA = TimebaseFormula(0, 80e6, 80e6, -1)
+
 class PS4000A_USER_PROBE_INTERACTIONS(Structure):
     _pack_ = 1
     _fields_ = [    ("connected", c_uint16),
@@ -839,6 +841,22 @@ ps4000a.StreamingReadyType = C_CALLBACK_FUNCTION_FACTORY(None,
 
 ps4000a.StreamingReadyType.__doc__ = doc
 
+doc = """ void *ps4000aBlockReady
+    (
+        int16_t    handle,
+        PICO_STATUS    status,
+        void    *pParameter
+    );
+    define a python function which accepts the correct arguments, and pass it to the constructor of this type.
+    """
+
+ps4000a.BlockReadyType = C_CALLBACK_FUNCTION_FACTORY(None,
+                                                     c_int16,
+                                                     c_uint32,
+                                                     c_void_p)
+
+ps4000a.BlockReadyType.__doc__ = doc
+
 
 doc = """ PICO_STATUS ps4000aNoOfStreamingValues
     (
@@ -9,7 +9,7 @@ functions.
 
 from ctypes import *
 from picosdk.ctypes_wrapper import C_CALLBACK_FUNCTION_FACTORY
-from picosdk.library import Library
+from picosdk.library import Library, TimebaseFormula
 from picosdk.constants import make_enum
 
 
@@ -30,6 +30,14 @@ ps5000a.PS5000A_DEVICE_RESOLUTION = make_enum([
 
 ps5000a.DEFAULT_RESOLUTION = ps5000a.PS5000A_DEVICE_RESOLUTION["PS5000A_DR_8BIT"]
 
+# at 8, 14 and 15 bit resolution (where 14 and 15 bit start at timebase 3.)
+ps5000a.TIMEBASE_FORMULA = TimebaseFormula(3, 1e9, 125e6, 2)
+# at 12 and 16 bit resolution, timebases from 4 up are (n - 3) * 16ns (12 bit starts at timebase 1, 16 bit at 4.)
+ps5000a.TIMEBASE_FORMULAS = {
+    ps5000a.PS5000A_DEVICE_RESOLUTION["PS5000A_DR_12BIT"]: TimebaseFormula(4, 1e9, 62.5e6, 3),
+    ps5000a.PS5000A_DEVICE_RESOLUTION["PS5000A_DR_16BIT"]: TimebaseFormula(4, 1e9, 62.5e6, 3),
+}
+
 ps5000a.PS5000A_COUPLING = make_enum([
     'PS5000A_AC',
     'PS5000A_DC',
@@ -8,7 +8,7 @@ functions.
 """
 
 from ctypes import *
-from picosdk.library import Library
+from picosdk.library import Library, TimebaseFormula
 from picosdk.ctypes_wrapper import C_CALLBACK_FUNCTION_FACTORY
 from picosdk.constants import make_enum
 
@@ -66,6 +66,8 @@ ps6000.PS6000_RATIO_MODE = {
 	"PS6000_RATIO_MODE_DISTRIBUTION" : 8,
 }
 
+ps6000.PICO_RATIO_MODE = {k[18:]: v for k, v in ps6000.PS6000_RATIO_MODE.items()}
+
 ps6000.PS6000_TIME_UNITS = make_enum([
 	"PS6000_FS",
 	"PS6000_PS",
@@ -176,6 +178,8 @@ ps6000.PS6000_TRIGGER_INFO = PS6000_TRIGGER_INFO
 # some ps6000 scopes have 2GS of memory.
 ps6000.MAX_MEMORY = 2**31
 
+ps6000.TIMEBASE_FORMULA = TimebaseFormula(5, 5e9, 156.25e6, 4)
+
 doc = """ PICO_STATUS ps6000OpenUnit
     (
         int16_t *handle,
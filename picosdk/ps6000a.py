@@ -8,7 +8,7 @@ functions.
 """
 
 from ctypes import *
-from picosdk.library import Library
+from picosdk.library import Library, TimebaseFormula
 from picosdk.ctypes_wrapper import C_CALLBACK_FUNCTION_FACTORY
 from picosdk.constants import make_enum
 from picosdk.PicoDeviceEnums import picoEnum as enums
@@ -22,6 +22,11 @@ ps6000a = Ps6000alib()
 
 ps6000a.DEFAULT_RESOLUTION = enums.PICO_DEVICE_RESOLUTION["PICO_DR_8BIT"]
 
+ps6000a.TIMEBASE_FORMULA = TimebaseFormula(5, 5e9, 156.25e6, 4)
+
+# only include the normal analog channels for now:
+ps6000a.PICO_CHANNEL = {k[-1]: v for k, v in enums.PICO_CHANNEL.items() if k.startswith("PICO_CHANNEL_")}
+
 doc = """ void ps6000aExternalReferenceInteractions
     (
         int16_t    handle,
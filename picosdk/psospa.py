@@ -19,6 +19,9 @@ class Psospalib(Library):
 	
 psospa = Psospalib()
 
+# only include the normal analog channels for now:
+psospa.PICO_CHANNEL = {k[-1]: v for k, v in enums.PICO_CHANNEL.items() if k.startswith("PICO_CHANNEL_")}
+
 doc = """ void psospaBlockReady
     (
         int16_t    handle,
@@ -0,0 +1,197 @@
+#
+# Copyright (C) 2024 Pico Technology Ltd. See LICENSE file for terms.
+#
+"""
+Recording streamed samples straight to disk.
+
+StreamRecorder hands each block of samples to a writer thread through a bounded queue, and the writer appends it (with
+an NpyAppender) to a .npy file of int16 samples, shaped (samples, channels). The channel ranges, sample interval and
+maximum ADC count are kept in a JSON file next to it, so a recording can be opened with load_recording (or
+numpy.load(path, mmap_mode='r')) without reading it into memory.
+"""
+from __future__ import print_function
+import json
+import struct
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+import numpy
+from picosdk.errors import ArgumentOutOfRangeError
+
+
+class NpyAppender(object):
+    """A .npy file which grows as rows are appended to it. numpy.load reads it as an array of shape
+    (rows,) + row_shape.
+    The header is written with a fixed size, so it can be rewritten with the number of rows so far by flush (and
+    close), without moving the data.
+    reserve_rows: optionally, the expected number of rows, to allocate the file up front. close trims it to the rows
+        actually written."""
+    HEADER_SIZE = 256
+
+    def __init__(self, path, dtype, row_shape=(), reserve_rows=None):
+        self.path = path
+        self.dtype = numpy.dtype(dtype)
+        self.row_shape = tuple(row_shape)
+        self.row_bytes = self.dtype.itemsize * int(numpy.prod(self.row_shape, dtype=numpy.int64))
+        self.rows = 0
+        self._file = open(path, 'wb')
+        self._file.write(self._header())
+        if reserve_rows is not None:
+            # allocate the file now, so the file system can lay it out in one piece.
+            self._file.truncate(self.HEADER_SIZE + reserve_rows * self.row_bytes)
+
+    def _header(self):
+        header = "{'descr': %r, 'fortran_order': False, 'shape': %r, }" % (
+            numpy.lib.format.dtype_to_descr(self.dtype), (self.rows,) + self.row_shape)
+        magic = b'\x93NUMPY\x01\x00'
+        header = header.ljust(self.HEADER_SIZE - len(magic) - 2 - 1) + '\n'
+        if len(header) + len(magic) + 2 > self.HEADER_SIZE:
+            raise ArgumentOutOfRangeError("the dtype %s is too complicated for a .npy header" % self.dtype)
+        return magic + struct.pack('<H', len(header)) + header.encode('latin1')
+
+    def append(self, rows):
+        """write an array of shape (rows,) + row_shape to the end of the file."""
+        rows = numpy.ascontiguousarray(rows, self.dtype)
+        if rows.shape[1:] != self.row_shape:
+            raise ArgumentOutOfRangeError("expected rows of shape %s, not %s" % (self.row_shape, rows.shape[1:]))
+        rows.tofile(self._file)
+        self.rows += len(rows)
+
+    def flush(self):
+        """rewrite the header with the rows written so far, so that readers see them."""
+        self._file.seek(0)
+        self._file.write(self._header())
+        self._file.seek(self.HEADER_SIZE + self.rows * self.row_bytes)
+        self._file.flush()
+
+    def close(self):
+        """trim the file to the rows written, and rewrite the header with them."""
+        if self._file is None:
+            return
+        try:
+            self._file.truncate(self.HEADER_SIZE + self.rows * self.row_bytes)
+            self.flush()
+        finally:
+            self._file.close()
+            self._file = None
+
+
+def metadata_path(path):
+    """Returns: the path of the JSON metadata written alongside the recording at path."""
+    return path + '.json'
+
+
+class StreamRecorder(object):
+    """Appends blocks of int16 samples to a .npy file, on a writer thread.
+    write() only queues the block, so the caller (e.g. the loop reading a stream) never waits for the disk unless the
+    queue is full, which holds it up rather than using more memory.
+    usage:
+        with StreamRecorder.for_stream('capture.npy', stream) as recorder:
+            recorder.record(stream)
+        data, metadata = load_recording('capture.npy')
+    channels: the channel names, in the order of the rows of each block.
+    channel_ranges, sample_interval, max_adc, metadata: saved in the JSON file, for converting the samples to volts
+        and times.
+    max_samples: optionally, the expected length of the recording, to allocate the file up front.
+    queue_size: the number of blocks which can wait to be written."""
+    def __init__(self, path, channels, channel_ranges=None, sample_interval=None, max_adc=None, max_samples=None,
+                 queue_size=16, metadata=None):
+        self.path = path
+        self.channels = tuple(channels)
+        if not self.channels:
+            raise ArgumentOutOfRangeError("a recording needs at least one channel")
+        self.metadata = dict(metadata or {})
+        self.metadata.update({'channels': list(self.channels),
+                              'channel_ranges': dict(channel_ranges or {}),
+                              'sample_interval': sample_interval,
+                              'max_adc': max_adc})
+        with open(metadata_path(path), 'w') as f:
+            json.dump(self.metadata, f, indent=2)
+
+        self._file = NpyAppender(path, numpy.int16, (len(self.channels),), reserve_rows=max_samples)
+        self.samples_written = 0
+        self.error = None
+        self._queue = queue.Queue(queue_size)
+        self._thread = threading.Thread(target=self._write)
+        self._thread.daemon = True
+        self._thread.start()
+
+    @classmethod
+    def for_stream(cls, path, stream, **kwargs):
+        """Returns: a StreamRecorder for the samples of a (started) Stream or PooledStream, saving its channels,
+        channel ranges, sample interval and maximum ADC count."""
+        device = stream.device
+        channel_ranges = getattr(stream, 'channel_ranges', None) or {
+            channel: device._channel_ranges.get(channel) for channel in stream.channels}
+        max_adc = getattr(stream, 'max_adc', None)
+        if max_adc is None:
+            max_adc = device.driver.maximum_value(device)
+        return cls(path, stream.channels, channel_ranges=channel_ranges, sample_interval=stream.sample_interval,
+                   max_adc=max_adc, **kwargs)
+
+    def _write(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            data, release = item
+            try:
+                if self.error is None:
+                    # interleave the channels, as in the file (there is nothing to reorder for one channel.)
+                    self._file.append(data.T)
+                    self.samples_written += data.shape[1]
+            except (IOError, OSError) as e:
+                self.error = e
+            finally:
+                if release is not None:
+                    release()
+
+    def write(self, data, release=None):
+        """queue a (channels, samples) int16 array to be appended to the file. Don't change it until it is written.
+        release: optionally, a function to call (on the writer thread) once data has been written, e.g. to hand a
+            buffer back to the stream it came from.
+        raises: the error which stopped the writer, if any."""
+        if self.error is not None:
+            raise self.error
+        if data.shape[0] != len(self.channels):
+            raise ArgumentOutOfRangeError("expected %s channels, not %s" % (len(self.channels), data.shape[0]))
+        self._queue.put((data, release))
+
+    def record(self, stream):
+        """write all the samples of a stream (a Stream or a PooledStream, started), until it ends.
+        The buffers of a PooledStream are written as they are, and released once written. The chunks of a Stream are
+        only valid until the next one, so they are copied."""
+        if hasattr(stream, 'release'):
+            for buffer in stream:
+                self.write(buffer.data, lambda buffer=buffer: stream.release(buffer))
+        else:
+            for chunk in stream:
+                self.write(chunk.data.copy())
+
+    def close(self):
+        """wait for the queued blocks to be written, then finish the file with its final length.
+        raises: the error which stopped the writer, if any."""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self._file.close()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def load_recording(path):
+    """Returns: (data, metadata) for a recording made by StreamRecorder, where data is a read-only memory map of the
+    samples, shaped (samples, channels), and metadata is the dict saved with it."""
+    with open(metadata_path(path)) as f:
+        metadata = json.load(f)
+    return numpy.load(path, mmap_mode='r'), metadata
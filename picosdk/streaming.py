@@ -0,0 +1,538 @@
+#
+# Copyright (C) 2024 Pico Technology Ltd. See LICENSE file for terms.
+#
+"""
+Streaming captures, read as an iterator of fixed-size chunks.
+
+A polling thread calls get_streaming_latest_values, and a StreamingRingSink (the driver's StreamingReady callback)
+copies each batch of new samples from the driver buffers into a preallocated ring. Stream divides the ring into
+chunks, and the consumer iterates over the full chunks, which are views into the ring, so the memory used stays the
+same however long the stream runs.
+
+StreamingRingSink is also the building block for writing your own polling loop: a StreamingReady callback which only
+copies each batch into a ring, for a single consumer to read without locking.
+
+On ps6000a and psospa, the driver streams straight into buffers added with set_data_buffers, so PooledStream rotates a
+fixed pool of buffers through the driver instead, and hands each one to the consumer as it fills, without copying it.
+"""
+from __future__ import print_function
+import collections
+from ctypes import memmove
+import threading
+import time
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+import numpy
+from picosdk.PicoDeviceStructs import picoStruct
+from picosdk.errors import FeatureNotSupportedError, NoChannelsEnabledError, ArgumentOutOfRangeError, PicoError
+
+
+"""StreamChunk: a fixed number of consecutive samples from a Stream (the last chunk of a stream may be shorter.)
+start = the number of samples the device captured before the first sample in this chunk (including dropped samples.)
+data = a (channels, samples) array of raw ADC counts (int16), in the order of Stream.channels.
+overflow = a (channels,) bool array, which is True where the channel overflowed during this chunk.
+trigger_index = the index in this chunk of the trigger sample, or None if the device didn't trigger during it.
+dropped = the number of samples dropped (because the consumer fell behind) between the previous chunk and the end of
+          this one."""
+StreamChunk = collections.namedtuple('StreamChunk', ['start', 'data', 'overflow', 'trigger_index', 'dropped'])
+
+"""StreamBuffer: one buffer of a PooledStream, filled by the driver.
+index = the number of buffers filled before this one.
+start = the number of samples the device captured before the first sample in this buffer.
+data = a (channels, samples) array of raw ADC counts (int16), in the order of PooledStream.channels. Only the last
+       buffer of a stream may be shorter than PooledStream.buffer_samples.
+overflow = a (channels,) bool array, which is True where the channel overflowed while this buffer was filled.
+trigger_index = the index in this buffer of the trigger sample, or None if the device didn't trigger during it.
+pool_index = the buffer set of the pool which data is a view of."""
+StreamBuffer = collections.namedtuple('StreamBuffer', ['index', 'start', 'data', 'overflow', 'trigger_index',
+                                                       'pool_index'])
+
+
+class Stream(object):
+    """A streaming capture, which is an iterator of StreamChunk.
+    Each chunk's data is a view into the ring, which is refilled once you move on to the next chunk: copy it if you
+    need to keep it.
+    When the consumer falls a whole ring behind, the stream either waits for it (so the device's own buffer fills up
+    and it may overflow), or if drop is True, drops the new samples and counts them (see StreamChunk.dropped.)
+    Note: the device streams until max_samples have been read, the device stops itself, or stop() is called. Please
+    stop the stream (or use it as a context manager) if you finish iterating early."""
+    def __init__(self, device, sample_interval, chunk_samples=10000, ring_chunks=16, max_samples=None, drop=False,
+                 driver_buffer_size=None, poll_interval=None):
+        driver = device.driver
+        if not driver.can_stream():
+            raise FeatureNotSupportedError("%s devices cannot stream with a StreamingReady callback." % driver.name)
+        if len(device._channel_ranges) == 0:
+            raise NoChannelsEnabledError("We cannot capture any data if no channels are enabled.")
+        if driver_buffer_size is None:
+            driver_buffer_size = chunk_samples
+        if (ring_chunks - 1) * chunk_samples < driver_buffer_size:
+            # while the consumer holds one chunk, the rest of the ring must fit a full driver buffer.
+            raise ArgumentOutOfRangeError("the ring (%s chunks of %s samples) is too small for a driver buffer of %s "
+                                          "samples" % (ring_chunks, chunk_samples, driver_buffer_size))
+        self.device = device
+        self.channel_ranges = dict(device._channel_ranges)
+        self.chunk_samples = chunk_samples
+        self.ring_chunks = ring_chunks
+        self.max_samples = max_samples
+        self.drop = drop
+        self.max_adc = driver.maximum_value(device)
+        self.error = None
+        self._driver_buffer_size = driver_buffer_size
+
+        # chunks never wrap around the end of the ring, since it is a whole number of them.
+        self._sink = StreamingRingSink(driver, self.channel_ranges, driver_buffer_size, ring_chunks * chunk_samples,
+                                       on_batch=self._on_batch)
+        self.channels = self._sink.channels
+        self._channel_bits = numpy.array([driver.PICO_CHANNEL[channel] for channel in self.channels],
+                                         numpy.dtype('int16'))
+        driver.set_data_buffers(device, self._sink.buffers)
+
+        # per chunk of the ring: the overflow flags, the trigger index (or -1), the device sample number of the first
+        # sample, and the samples dropped before it was complete.
+        self._chunk_overflow = numpy.zeros(ring_chunks, numpy.dtype('int16'))
+        self._chunk_trigger = numpy.zeros(ring_chunks, numpy.dtype('int64'))
+        self._chunk_start = numpy.zeros(ring_chunks, numpy.dtype('int64'))
+        self._chunk_dropped = numpy.zeros(ring_chunks, numpy.dtype('int64'))
+
+        # the samples in the ring whose chunks are up to date, and captured by the device (counting dropped samples),
+        # since the stream started; and the samples of the chunk the consumer holds.
+        self._written = 0
+        self._captured = 0
+        self._held = 0
+        self._pending_dropped = 0
+        self._condition = threading.Condition()
+        self._finished = False
+        self._stopping = False
+        self._stopped = False
+        # called (on the polling thread) whenever a chunk may have completed, or the stream has finished.
+        self._listener = None
+
+        driver.set_null_trigger(device)
+        self.sample_interval = driver.run_streaming(device, sample_interval, driver_buffer_size)
+        if poll_interval is None:
+            # poll often enough that the driver buffer is emptied at least a few times before it could fill up.
+            poll_interval = max(1e-4, min(0.01, driver_buffer_size * self.sample_interval / 4))
+        self.poll_interval = poll_interval
+
+        self._thread = threading.Thread(target=self._poll)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _poll(self):
+        sink = self._sink
+        try:
+            while not self._stopping and not self._finished:
+                if not self.drop:
+                    # only take a driver buffer of samples once the ring has room for them all, so the sink never drops
+                    # any: the device's own buffer fills up instead.
+                    with self._condition:
+                        while sink.capacity - sink.available < self._driver_buffer_size and not self._stopping:
+                            self._condition.wait()
+                    if self._stopping:
+                        break
+                self.device.driver.get_streaming_latest_values(self.device, sink.callback)
+                if sink.auto_stopped:
+                    with self._condition:
+                        self._finished = True
+                time.sleep(self.poll_interval)
+        except PicoError as e:
+            self.error = e
+        finally:
+            with self._condition:
+                self._finished = True
+                self._condition.notify_all()
+            self._notify_listener()
+
+    def _on_batch(self, index, written, dropped, overflow, trigger_index):
+        """account for a batch the sink has taken from the driver, in the chunks it falls in."""
+        chunk_samples = self.chunk_samples
+        with self._condition:
+            self._captured += written + dropped
+            self._pending_dropped += dropped
+            if written:
+                # update the chunks which these samples fall in, starting any new ones.
+                for chunk in range(index // chunk_samples, (index + written - 1) // chunk_samples + 1):
+                    i = chunk % self.ring_chunks
+                    chunk_start = chunk * chunk_samples
+                    if chunk_start >= index:
+                        self._chunk_overflow[i] = 0
+                        self._chunk_trigger[i] = -1
+                        self._chunk_start[i] = self._captured - written + chunk_start - index
+                        self._chunk_dropped[i] = 0
+                    self._chunk_overflow[i] |= overflow
+                    self._chunk_dropped[i] += self._pending_dropped
+                    self._pending_dropped = 0
+                if trigger_index is not None:
+                    i = (trigger_index // chunk_samples) % self.ring_chunks
+                    self._chunk_trigger[i] = trigger_index % chunk_samples
+                self._written = index + written
+            self._condition.notify_all()
+        if written:
+            self._notify_listener()
+
+    def set_listener(self, listener):
+        """listener: a function to call (on the polling thread) whenever the next chunk may have completed, or the
+        stream has finished, e.g. to wake an event loop waiting for next_chunk(block=False). None to remove it."""
+        self._listener = listener
+
+    def _notify_listener(self):
+        listener = self._listener
+        if listener is not None:
+            listener()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        chunk = self.next_chunk()
+        if chunk is None:
+            self.stop()
+            if self.error is not None:
+                raise self.error
+            raise StopIteration
+        return chunk
+
+    # python 2
+    next = __next__
+
+    def next_chunk(self, block=True):
+        """Returns: the next StreamChunk, or None at the end of the stream (then call stop, and check error, as
+        iterating does), or if not block, False when the next chunk isn't complete yet (see set_listener.)"""
+        sink = self._sink
+        with self._condition:
+            # the consumer has finished with the chunk it was given last.
+            sink.release(self._held)
+            self._held = 0
+            self._condition.notify_all()
+
+            remaining = self.chunk_samples
+            if self.max_samples is not None:
+                remaining = min(remaining, self.max_samples - sink.read_index)
+            if remaining > 0 and not self._stopping:
+                if not block and self._written - sink.read_index < remaining and not self._finished:
+                    return False
+                while self._written - sink.read_index < remaining and not self._finished:
+                    self._condition.wait()
+                available = min(remaining, self._written - sink.read_index)
+            else:
+                available = 0
+            self._held = available
+
+        if available == 0:
+            return None
+
+        index, data = sink.read(available)
+        i = (index // self.chunk_samples) % self.ring_chunks
+        trigger_index = int(self._chunk_trigger[i])
+        if trigger_index >= available:
+            trigger_index = -1
+        return StreamChunk(int(self._chunk_start[i]),
+                           data,
+                           (self._chunk_overflow[i] >> self._channel_bits) & 1 == 1,
+                           None if trigger_index < 0 else trigger_index,
+                           int(self._chunk_dropped[i]))
+
+    @property
+    def samples_captured(self):
+        """the number of samples the device has sent, including any dropped."""
+        return self._captured
+
+    @property
+    def samples_dropped(self):
+        """the number of samples dropped because the consumer fell behind."""
+        return self._sink.dropped
+
+    def stop(self):
+        """stop the device streaming, and end the iteration."""
+        if self._stopped:
+            return
+        self._stopped = True
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        self._thread.join()
+        self.device.driver.stop(self.device)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+class StreamingRingSink(object):
+    """A StreamingReady callback (sink.callback) which copies each batch of new samples from the driver buffers into a
+    preallocated ring, with one memmove per channel (two where the batch wraps around the end of the ring.)
+    There is one producer (the callback, on the driver's thread) and one consumer, and no lock: the callback only
+    writes samples behind read_index + capacity and then advances write_index, and the consumer only reads samples
+    behind write_index and then advances read_index. If a batch doesn't fit in the space the consumer has left, it is
+    dropped (and counted) rather than waiting, so the callback never stalls the driver.
+    usage:
+        sink = StreamingRingSink(driver, ['A', 'B'], buffer_size, capacity)
+        driver.set_data_buffers(device, sink.buffers)
+        driver.run_streaming(device, sample_interval, buffer_size)
+        while not sink.auto_stopped:
+            driver.get_streaming_latest_values(device, sink.callback)
+            index, data = sink.read()
+            process(data)
+            sink.release(data.shape[1])
+    on_batch: optionally, a function called (on the driver's thread) at the end of each callback, with the
+        write_index of the batch's first sample, the number of samples written and dropped, the driver's overflow
+        flags, and the write_index of the trigger sample (or None.)"""
+    def __init__(self, driver, channels, buffer_size, capacity, on_batch=None):
+        self.channels = tuple(sorted(channels, key=lambda channel: driver.PICO_CHANNEL[channel]))
+        self.capacity = capacity
+        self._channel_bits = {channel: driver.PICO_CHANNEL[channel] for channel in self.channels}
+        self.driver_buffers = numpy.zeros((len(self.channels), buffer_size), numpy.dtype('int16'))
+        self.buffers = {channel: self.driver_buffers[i] for i, channel in enumerate(self.channels)}
+        self.ring = numpy.zeros((len(self.channels), capacity), numpy.dtype('int16'))
+        # the number of samples (per channel) written into the ring, and read from it, since the stream started.
+        self.write_index = 0
+        self.read_index = 0
+        self.dropped = 0
+        self.overflow = 0
+        self.trigger_index = None
+        self.auto_stopped = False
+        self._on_batch = on_batch
+        itemsize = self._itemsize = self.ring.itemsize
+        self._rows = [(self.ring.ctypes.data + i * capacity * itemsize,
+                       self.driver_buffers.ctypes.data + i * buffer_size * itemsize) for i in range(len(self.channels))]
+        self.callback = driver.StreamingReadyType(self._on_streaming_ready)
+
+    def _on_streaming_ready(self, handle, no_of_samples, start_index, overflow, trigger_at, triggered, auto_stop,
+                            parameter):
+        write_index = self.write_index
+        written = dropped = 0
+        trigger_index = None
+        if no_of_samples > self.capacity - (write_index - self.read_index):
+            self.dropped += no_of_samples
+            dropped = no_of_samples
+        elif no_of_samples > 0:
+            itemsize = self._itemsize
+            position = write_index % self.capacity
+            first = min(no_of_samples, self.capacity - position)
+            for ring, driver_buffer in self._rows:
+                memmove(ring + position * itemsize, driver_buffer + start_index * itemsize, first * itemsize)
+                if first < no_of_samples:
+                    memmove(ring, driver_buffer + (start_index + first) * itemsize, (no_of_samples - first) * itemsize)
+            if triggered:
+                trigger_index = self.trigger_index = write_index + trigger_at
+            # only publish the samples once they have been copied.
+            self.write_index = write_index + no_of_samples
+            written = no_of_samples
+        self.overflow |= overflow
+        if auto_stop:
+            self.auto_stopped = True
+        if self._on_batch is not None:
+            self._on_batch(write_index, written, dropped, overflow, trigger_index)
+
+    def read(self, max_samples=None):
+        """Returns: (index, data), where data is a (channels, samples) view of the unread samples in the ring, in the
+        order of channels, and index is the write_index of its first sample. data stops at the end of the ring, so
+        after releasing it, read again for any samples which have wrapped around to the start."""
+        read_index = self.read_index
+        position = read_index % self.capacity
+        count = min(self.write_index - read_index, self.capacity - position)
+        if max_samples is not None:
+            count = min(count, max_samples)
+        return read_index, self.ring[:, position:position + count]
+
+    def release(self, count):
+        """mark the next count samples as read, so the callback can write over them."""
+        self.read_index += count
+
+    @property
+    def available(self):
+        """the number of samples (per channel) written but not yet released."""
+        return self.write_index - self.read_index
+
+    def overflowed(self, channel):
+        """Returns: whether the channel has overflowed since the stream started."""
+        return bool(self.overflow & (1 << self._channel_bits[channel]))
+
+
+class PooledStream(object):
+    """A streaming capture on ps6000a or psospa, which rotates a fixed pool of buffers through the driver.
+    Configure the channels and trigger on the device first, then:
+
+        with PooledStream(device, ['A', 'B'], 1e-8, buffer_samples=10**6) as stream:
+            for buffer in stream:
+                process(buffer.data)
+                stream.release(buffer)
+
+    The driver is always given queued buffers ahead of the one it is filling, so it never has to wait for Python.
+    Each filled buffer is delivered as it is (a view of the pool, not a copy), and only handed back to the driver
+    once the consumer has released it. Buffers which are not released hold up the stream: once the whole pool is in
+    use, the driver waits for more buffers, and the device may overflow its own memory.
+    pool_size: the number of buffer sets in the pool.
+    queued: the number of buffer sets added to the driver ahead of time.
+    max_buffers: optionally, stop after filling this many buffers."""
+    def __init__(self, device, channels, sample_interval, buffer_samples=100000, pool_size=8, queued=2,
+                 max_buffers=None, poll_interval=None):
+        driver = device.driver
+        if not driver.can_stream_data_info():
+            raise FeatureNotSupportedError("%s devices do not stream into pooled buffers." % driver.name)
+        if not 0 < queued <= pool_size:
+            raise ArgumentOutOfRangeError("queued (%s) must be between 1 and pool_size (%s)" % (queued, pool_size))
+        self.device = device
+        self.channels = tuple(sorted(channels, key=lambda channel: driver.PICO_CHANNEL[channel]))
+        if not self.channels:
+            raise NoChannelsEnabledError("We cannot capture any data if no channels are enabled.")
+        self.requested_sample_interval = sample_interval
+        self.sample_interval = None
+        self.buffer_samples = buffer_samples
+        self.queued = queued
+        self.max_buffers = max_buffers
+        if poll_interval is None:
+            poll_interval = max(1e-4, min(0.01, buffer_samples * sample_interval / 4))
+        self.poll_interval = poll_interval
+
+        self.pool = numpy.empty((pool_size, len(self.channels), buffer_samples), numpy.dtype('int16'))
+        PICO_RATIO_MODE_RAW = 0x80000000
+        PICO_INT16_T = 1
+        self._data_infos = (picoStruct.PICO_STREAMING_DATA_INFO * len(self.channels))()
+        for info, channel in zip(self._data_infos, self.channels):
+            info.channel = driver.PICO_CHANNEL[channel]
+            info.mode = PICO_RATIO_MODE_RAW
+            info.type = PICO_INT16_T
+        self._trigger_info = picoStruct.PICO_STREAMING_DATA_TRIGGER_INFO()
+
+        self.buffers = queue.Queue()
+        self.error = None
+        self._released = queue.Queue()
+        self._free = collections.deque(range(pool_size))
+        # the buffer sets added to the driver, in the order it fills them.
+        self._registered = collections.deque()
+        # the driver's index of the buffer set it is filling, counting those added since streaming started.
+        self._buffer_index = 0
+        self._filled = 0
+        self._overflow = numpy.zeros(len(self.channels), numpy.dtype('bool'))
+        self._trigger_index = None
+        self._delivered = 0
+        self._captured = 0
+        self._stopping = False
+        self._thread = None
+
+    def start(self):
+        """add the first buffers to the driver and start streaming, polling the driver on a background thread."""
+        driver = self.device.driver
+        driver.clear_data_buffers(self.device)
+        self._add_buffers()
+        self.sample_interval = driver.run_streaming(self.device, self.requested_sample_interval, self.buffer_samples,
+                                                    post_trigger_samples=self.buffer_samples)
+        self._thread = threading.Thread(target=self._poll)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def _add_buffers(self):
+        """give the driver free buffer sets, until it has queued of them to fill.
+        returns: the number of buffer sets added."""
+        added = 0
+        while True:
+            try:
+                self._free.append(self._released.get_nowait())
+            except queue.Empty:
+                break
+        while len(self._registered) < self.queued and self._free:
+            pool_index = self._free.popleft()
+            self.device.driver.set_data_buffers(self.device, {channel: self.pool[pool_index, i]
+                                                              for i, channel in enumerate(self.channels)})
+            self._registered.append(pool_index)
+            added += 1
+        return added
+
+    def _poll(self):
+        try:
+            while not self._stopping and not self._finished():
+                waiting = self.device.driver.get_streaming_latest_values_info(self.device, self._data_infos,
+                                                                              self._trigger_info)
+                self._update()
+                if self._trigger_info.autoStop:
+                    break
+                added = self._add_buffers()
+                # if the driver is waiting for buffers and we gave it some, poll again straight away. If the consumer
+                # holds them all, wait for it like any other poll.
+                if not (waiting and added):
+                    time.sleep(self.poll_interval)
+            if self._filled and not self._finished():
+                self._deliver()
+        except PicoError as e:
+            self.error = e
+        finally:
+            self.buffers.put(None)
+
+    def _update(self):
+        """account for the samples the driver reported in the data infos."""
+        info = self._data_infos[0]
+        if info.noOfSamples > 0:
+            if info.bufferIndex != self._buffer_index:
+                # the driver has moved on to the next buffer set.
+                if self._filled:
+                    self._deliver()
+                self._buffer_index = info.bufferIndex
+            self._filled = info.startIndex + info.noOfSamples
+            self._captured += info.noOfSamples
+            self._overflow |= [bool(channel_info.overflow) for channel_info in self._data_infos]
+            if self._trigger_info.triggered and self._trigger_index is None:
+                self._trigger_index = int(self._trigger_info.triggerAt)
+            if self._filled >= self.buffer_samples:
+                self._deliver()
+
+    def _deliver(self):
+        pool_index = self._registered.popleft()
+        start = self._captured - self._filled
+        self.buffers.put(StreamBuffer(self._delivered, start, self.pool[pool_index, :, :self._filled],
+                                      self._overflow.copy(), self._trigger_index, pool_index))
+        self._delivered += 1
+        self._buffer_index += 1
+        self._filled = 0
+        self._overflow[:] = False
+        self._trigger_index = None
+
+    def _finished(self):
+        return self.max_buffers is not None and self._delivered >= self.max_buffers
+
+    def release(self, buffer):
+        """return a buffer to the pool, to be filled again. Don't use its data afterwards."""
+        self._released.put(buffer.pool_index)
+
+    def get(self, timeout=None):
+        """Returns: the next StreamBuffer, or None if the stream has finished.
+        raises: the error which stopped the stream, if any; queue.Empty if timeout (in seconds) passes first."""
+        buffer = self.buffers.get(timeout=timeout)
+        if buffer is None:
+            # leave the end marker for any other consumers.
+            self.buffers.put(None)
+            if self.error is not None:
+                raise self.error
+        return buffer
+
+    def __iter__(self):
+        while True:
+            buffer = self.get()
+            if buffer is None:
+                return
+            yield buffer
+
+    @property
+    def samples_captured(self):
+        """the number of samples (per channel) the driver has written into the pool."""
+        return self._captured
+
+    def stop(self):
+        """stop the device streaming. Any partly filled buffer is delivered before the end of the stream."""
+        if self._thread is None:
+            return
+        self._stopping = True
+        self._thread.join()
+        self._thread = None
+        self.device.driver.stop(self.device)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
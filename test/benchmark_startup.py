@@ -0,0 +1,38 @@
+#
+# Copyright (C) 2024 Pico Technology Ltd. See LICENSE file for terms.
+#
+"""
+Measures how long it takes to import each driver module, and (where the driver is installed) to bind all of its C
+functions up front. Each import is timed in a fresh interpreter so that modules aren't shared between drivers.
+
+Usage: python -m test.benchmark_startup [driver ...]
+"""
+
+from __future__ import print_function
+
+import subprocess
+import sys
+
+DRIVERS = ["ps2000", "ps2000a", "ps3000", "ps3000a", "ps4000", "ps4000a", "ps5000a", "ps6000", "ps6000a", "psospa"]
+
+_SNIPPET = """
+import time
+start = time.time()
+import picosdk.%(driver)s as module
+imported = time.time()
+try:
+    module.%(driver)s.bind_symbols()
+    bound = "%%.1f ms" %% ((time.time() - imported) * 1000)
+except Exception as e:
+    bound = type(e).__name__
+print("%%-10s import %%7.1f ms   bind_symbols %%s" %% ("%(driver)s", (imported - start) * 1000, bound))
+"""
+
+
+def main(drivers):
+    for driver in drivers:
+        subprocess.call([sys.executable, "-c", _SNIPPET % {'driver': driver}])
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:] or DRIVERS)
@@ -0,0 +1,70 @@
+#
+# Copyright (C) 2024 Pico Technology Ltd. See LICENSE file for terms.
+#
+"""
+Measures the highest rate at which a StreamingReady callback can be sustained, for picosdk.streaming.StreamingRingSink
+and (for comparison) the element-wise copy which the streaming examples do. The callbacks are called through ctypes,
+as the driver would call them, with a consumer releasing the samples after every batch.
+
+Usage: python -m test.benchmark_streaming [seconds per measurement]
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+import numpy
+from picosdk.ps3000a import ps3000a
+from picosdk.streaming import StreamingRingSink
+
+BATCH_SIZES = [100, 1000, 10000, 100000]
+CHANNELS = [['A'], ['A', 'B', 'C', 'D']]
+
+
+def sink_rate(channels, batch_size, duration):
+    sink = StreamingRingSink(ps3000a, channels, batch_size, 16 * batch_size)
+    callback = sink.callback
+    calls = 0
+    start = time.time()
+    while time.time() - start < duration:
+        for _ in range(100):
+            callback(1, batch_size, 0, 0, 0, 0, 0, None)
+            sink.release(sink.available)
+        calls += 100
+    return calls / (time.time() - start)
+
+
+def element_wise_rate(channels, batch_size, duration):
+    driver_buffers = {channel: numpy.zeros(batch_size, numpy.int16) for channel in channels}
+    complete = {channel: numpy.zeros(16 * batch_size, numpy.int16) for channel in channels}
+    state = {'next': 0}
+
+    def streaming_callback(handle, no_of_samples, start_index, overflow, trigger_at, triggered, auto_stop, parameter):
+        destination = state['next'] % (15 * batch_size)
+        for channel in channels:
+            for i in range(no_of_samples):
+                complete[channel][destination + i] = driver_buffers[channel][start_index + i]
+        state['next'] += no_of_samples
+
+    callback = ps3000a.StreamingReadyType(streaming_callback)
+    calls = 0
+    start = time.time()
+    while time.time() - start < duration:
+        callback(1, batch_size, 0, 0, 0, 0, 0, None)
+        calls += 1
+    return calls / (time.time() - start)
+
+
+def main(duration):
+    print("%-9s %-8s %28s %28s" % ("channels", "batch", "StreamingRingSink", "element-wise copy"))
+    for channels in CHANNELS:
+        for batch_size in BATCH_SIZES:
+            rates = [sink_rate(channels, batch_size, duration)]
+            if batch_size <= 1000:
+                rates.append(element_wise_rate(channels, batch_size, duration))
+            print("%-9s %-8s" % (len(channels), batch_size) + "".join(
+                " %10.0f calls/s %7.1f MS/s" % (rate, rate * batch_size * 1e-6) for rate in rates))
+
+
+if __name__ == '__main__':
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 1.)
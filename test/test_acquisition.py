@@ -0,0 +1,137 @@
+#
+# Copyright (C) 2024 Pico Technology Ltd. See LICENSE file for terms.
+#
+"""
+Unit tests for picosdk.acquisition.AsyncBlockAcquisition, using a fake driver which calls back from timer threads.
+"""
+
+from __future__ import print_function
+
+from ctypes import CFUNCTYPE, c_int16, c_int32, c_uint32, c_uint64, c_void_p
+import threading
+import time
+import unittest
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+from picosdk.device import Device
+from picosdk.acquisition import AsyncBlockAcquisition, AcquiredBlock
+from picosdk.errors import FeatureNotSupportedError, InvalidCaptureParameters
+from test.test_capture_session import FakeBlockDriver
+
+
+class FakeAsyncDriver(FakeBlockDriver):
+    """Captures each block in capture_time and transfers it in transfer_time, filling the buffers with the block's
+    number."""
+    DataReadyType = CFUNCTYPE(None, c_int16, c_uint32, c_uint64, c_int16, c_void_p)
+
+    def __init__(self, capture_time=0.02, transfer_time=0.02, status=0):
+        super(FakeAsyncDriver, self).__init__(capture_time=capture_time, signals=True)
+        self.transfer_time = transfer_time
+        self.status = status
+        self.segments = {}
+        self.contents = {}
+        self.captured = 0
+        self.overlapped_transfers = 0
+        self.capturing = False
+
+    def memory_segments(self, device, number_segments):
+        self.calls['memory_segments'] += 1
+        return c_int32(1000)
+
+    def clear_data_buffers(self, device):
+        self.calls['clear_data_buffers'] += 1
+
+    def set_data_buffers(self, device, buffers, segment_index=0):
+        self.segments[segment_index] = buffers
+
+    def can_get_values_async(self):
+        return True
+
+    def run_block(self, device, pre_trigger_samples, post_trigger_samples, timebase_id, oversample=1, segment_index=0,
+                  ready_event=None):
+        self.calls['run_block'] += 1
+        self.capturing = True
+
+        def captured():
+            self.contents[segment_index] = self.captured
+            self.captured += 1
+            self.capturing = False
+            ready_event.set()
+        threading.Timer(self.capture_time, captured).start()
+        return self.capture_time
+
+    def get_values_async(self, device, num_samples, segment_index, data_ready):
+        self.calls['get_values_async'] += 1
+        if self.capturing:
+            self.overlapped_transfers += 1
+
+        def transferred():
+            for array in self.segments[segment_index].values():
+                array[:] = self.contents[segment_index]
+            data_ready(1, self.status, num_samples, 0b10 if self.contents[segment_index] == 1 else 0, None)
+        threading.Timer(self.transfer_time, transferred).start()
+
+
+class AsyncBlockAcquisitionTest(unittest.TestCase):
+    def setUp(self):
+        self.driver = FakeAsyncDriver()
+        self.device = Device(self.driver, 1)
+
+    def test_transfers_overlap_captures(self):
+        start = time.time()
+        blocks = []
+        with AsyncBlockAcquisition(self.device, ['A', 'B'], 0, 100, 3, ring_size=3, max_blocks=10) as acquisition:
+            for block in acquisition:
+                self.assertIsInstance(block, AcquiredBlock)
+                blocks.append((block.index, int(block.buffers['A'][0]), block.overflow))
+                acquisition.release(block)
+        elapsed = time.time() - start
+        self.assertEqual([index for index, _, _ in blocks], list(range(10)))
+        self.assertEqual([value for _, value, _ in blocks], list(range(10)))
+        self.assertEqual(blocks[1][2], {'B': True})
+        # one after the other, 10 captures and 10 transfers would take 0.4s.
+        self.assertLess(elapsed, 0.33)
+        self.assertGreater(self.driver.overlapped_transfers, 5)
+        self.assertEqual(self.driver.calls['clear_data_buffers'], 1)
+
+    def test_unreleased_blocks_hold_up_capture(self):
+        with AsyncBlockAcquisition(self.device, ['A'], 0, 100, 3, ring_size=2) as acquisition:
+            first = acquisition.get(timeout=1)
+            second = acquisition.get(timeout=1)
+            with self.assertRaises(queue.Empty):
+                acquisition.get(timeout=0.1)
+            self.assertEqual(self.driver.calls['run_block'], 2)
+            acquisition.release(first)
+            third = acquisition.get(timeout=1)
+            self.assertEqual((third.index, third.segment), (2, first.segment))
+            acquisition.release(second)
+            acquisition.release(third)
+
+    def test_errors_end_iteration(self):
+        self.driver.status = 7
+        acquisition = AsyncBlockAcquisition(self.device, ['A'], 0, 100, 3, max_blocks=3).start()
+        with self.assertRaises(InvalidCaptureParameters):
+            list(acquisition)
+        acquisition.stop()
+
+    def test_unexpected_errors_end_iteration(self):
+        acquisition = AsyncBlockAcquisition(self.device, ['A'], 0, 100, 3, max_blocks=3)
+
+        def deliver(no_of_samples, overflow_flags):
+            raise KeyError('A')
+        acquisition._deliver = deliver
+        acquisition.start()
+        with self.assertRaises(KeyError):
+            list(acquisition)
+        self.assertIsInstance(acquisition.error, KeyError)
+        acquisition.stop()
+
+    def test_requires_async_readout(self):
+        with self.assertRaises(FeatureNotSupportedError):
+            AsyncBlockAcquisition(Device(FakeBlockDriver(signals=True), 1), ['A'], 0, 100, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
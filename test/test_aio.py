@@ -0,0 +1,152 @@
+#
+# Copyright (C) 2024 Pico Technology Ltd. See LICENSE file for terms.
+#
+"""
+Unit tests for the asyncio capture API in picosdk.aio, using a fake driver.
+"""
+
+from __future__ import print_function
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import time
+import unittest
+from picosdk.device import Device, ChannelConfig, TimebaseOptions, ChunkedRapidBlockSession
+from picosdk import aio
+from picosdk.errors import InvalidCaptureParameters
+from test.test_capture_session import FakeBlockDriver
+from test.test_rapid_block import FakeRapidDriver
+from test.test_streaming import FakeStreamingDriver
+
+
+class CaptureAsyncTest(unittest.TestCase):
+    options = TimebaseOptions(max_time_interval=1e-6, no_of_samples=100)
+    channels = [ChannelConfig('A', True, 'DC', 1.0)]
+
+    def test_capture_does_not_block_the_loop(self):
+        async def main():
+            devices = [Device(FakeBlockDriver(capture_time=0.1, signals=signals), 1) for signals in (True, False)]
+            ticks = []
+
+            async def ticker():
+                while len(ticks) < 100:
+                    ticks.append(time.time())
+                    await asyncio.sleep(0.01)
+
+            tick_task = asyncio.ensure_future(ticker())
+            start = time.time()
+            results = await asyncio.gather(*[device.capture_block_async(self.options, self.channels)
+                                             for device in devices])
+            elapsed = time.time() - start
+            tick_task.cancel()
+            return results, elapsed, len(ticks)
+
+        results, elapsed, ticks = asyncio.run(main())
+        # both devices capture at once, and the loop keeps running while they do.
+        self.assertLess(elapsed, 0.18)
+        self.assertGreaterEqual(ticks, 5)
+        for times, voltages, overflow in results:
+            self.assertEqual(len(times), 100)
+            self.assertAlmostEqual(float(voltages['A'][0]), 16383 / 32767., places=5)
+
+    def test_iter_captures(self):
+        driver = FakeBlockDriver(signals=True)
+        session = Device(driver, 1).capture_session(self.options, self.channels)
+
+        async def main():
+            return [overflow async for _, _, overflow in aio.iter_captures(session, count=3)]
+
+        self.assertEqual(asyncio.run(main()), [{}, {}, {}])
+        self.assertEqual(driver.calls['run_block'], 3)
+        self.assertEqual(session.stats().captures, 3)
+
+    def test_rapid_block(self):
+        driver = FakeRapidDriver(capture_time=0.05, signals=True)
+        device = Device(driver, 1)
+
+        async def main():
+            return await device.capture_rapid_block_async(4, self.options, self.channels)
+
+        result = asyncio.run(main())
+        self.assertEqual(result.data.shape, (1, 4, 100))
+        self.assertEqual(int(result.data[0, 3, 0]), 30)
+        self.assertEqual(driver.calls['get_values_bulk'], 1)
+
+    def test_rapid_block_chunks(self):
+        driver = FakeRapidDriver(signals=True)
+        session = ChunkedRapidBlockSession(Device(driver, 1), 5, self.options, self.channels, chunk_segments=2)
+
+        async def main():
+            return [list(chunk.segments) async for chunk in session.capture_async()]
+
+        self.assertEqual(asyncio.run(main()), [[0, 1], [2, 3], [4]])
+        self.assertEqual(driver.calls['stop'], 1)
+
+    def test_iter_stream(self):
+        device = Device(FakeStreamingDriver(total=2500), 1)
+        device.set_channels(*self.channels)
+
+        async def main():
+            with device.stream(1e-6, chunk_samples=1000, poll_interval=0) as stream:
+                return [chunk.start async for chunk in aio.iter_stream(stream)]
+
+        self.assertEqual(asyncio.run(main()), [0, 1000, 2000])
+
+    def test_iter_stream_only_stops_on_the_executor(self):
+        driver = FakeStreamingDriver(batch=100, total=5000)
+        device = Device(driver, 1)
+        device.set_channels(*self.channels)
+        submitted = []
+
+        class RecordingExecutor(ThreadPoolExecutor):
+            def submit(self, function, *args, **kwargs):
+                submitted.append(function)
+                return super(RecordingExecutor, self).submit(function, *args, **kwargs)
+
+        async def main():
+            asyncio.get_event_loop().set_default_executor(RecordingExecutor())
+            with device.stream(1e-6, chunk_samples=1000, poll_interval=0.002) as stream:
+                starts = [chunk.start async for chunk in aio.iter_stream(stream)]
+                return starts, stream
+
+        starts, stream = asyncio.run(main())
+        self.assertEqual(starts, [0, 1000, 2000, 3000, 4000])
+        # waiting for the chunks doesn't use the executor: only stopping the stream at the end does.
+        self.assertEqual(submitted, [stream.stop])
+        self.assertIsNone(stream._listener)
+        self.assertEqual(driver.calls['stop'], 1)
+
+    def test_iter_stream_raises_the_error_which_stopped_it(self):
+        driver = FakeStreamingDriver(batch=500)
+        get_streaming_latest_values = driver.get_streaming_latest_values
+
+        def fail_after_two_polls(device, streaming_ready):
+            if driver.calls['get_streaming_latest_values'] == 2:
+                raise InvalidCaptureParameters("lost the device")
+            return get_streaming_latest_values(device, streaming_ready)
+        driver.get_streaming_latest_values = fail_after_two_polls
+        device = Device(driver, 1)
+        device.set_channels(*self.channels)
+        starts = []
+
+        async def main():
+            with device.stream(1e-6, chunk_samples=1000, poll_interval=0) as stream:
+                async for chunk in aio.iter_stream(stream):
+                    starts.append(chunk.start)
+
+        with self.assertRaises(InvalidCaptureParameters):
+            asyncio.run(main())
+        self.assertEqual(starts, [0])
+
+    def test_loop_event(self):
+        async def main():
+            event = aio.LoopEvent(asyncio.get_event_loop())
+            self.assertFalse(await event.wait(0.01))
+            asyncio.get_event_loop().call_later(0.01, event.set)
+            return await event.wait(1.)
+
+        self.assertTrue(asyncio.run(main()))
+
+
+if __name__ == '__main__':
+    unittest.main()
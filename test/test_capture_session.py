@@ -0,0 +1,256 @@
+#
+# Copyright (C) 2024 Pico Technology Ltd. See LICENSE file for terms.
+#
+"""
+Unit tests for block captures with picosdk.device.CaptureSession, using a fake driver.
+"""
+
+from __future__ import print_function
+
+from ctypes import CFUNCTYPE, c_int16, c_int32, c_uint32, c_void_p
+import collections
+import threading
+import time
+import unittest
+import numpy
+from picosdk.library import Library, TimebaseInfo
+from picosdk.device import Device, ChannelConfig, TimebaseOptions, CaptureSession, CaptureStats
+from picosdk.errors import FeatureNotSupportedError
+from picosdk.functions import adc2mVArray, conversionTables
+
+
+class FakeBlockDriver(Library):
+    """Fills each registered buffer with its channel number, counting the calls made to each driver function."""
+    def __init__(self, capture_time=0., signals=False):
+        super(FakeBlockDriver, self).__init__("fake")
+        self.PICO_CHANNEL = {'A': 0, 'B': 1}
+        self.calls = collections.Counter()
+        self.registered = {}
+        self.overflow = {}
+        self.capture_time = capture_time
+        self.signals = signals
+        self.ready_at = 0.
+
+    def set_channel(self, device, channel_name='A', enabled=True, coupling='DC', range_peak=float('inf'),
+                    analog_offset=None):
+        self.calls['set_channel'] += 1
+        return range_peak
+
+    def memory_segments(self, device, number_segments):
+        self.calls['memory_segments'] += 1
+        return c_int32(10000)
+
+    def get_timebase(self, device, timebase_id, no_of_samples, oversample=1, segment_index=0):
+        self.calls['get_timebase'] += 1
+        return TimebaseInfo(timebase_id, (timebase_id + 1) * 1e-6, None, 10000, 0)
+
+    def set_null_trigger(self, device):
+        self.calls['set_null_trigger'] += 1
+
+    def maximum_value(self, device):
+        self.calls['maximum_value'] += 1
+        return 32767
+
+    def set_data_buffers(self, device, buffers, segment_index=0):
+        self.calls['set_data_buffers'] += 1
+        self.registered = buffers
+
+    def can_signal_block_ready(self):
+        return self.signals
+
+    def run_block(self, device, pre_trigger_samples, post_trigger_samples, timebase_id, oversample=1, segment_index=0,
+                  ready_event=None):
+        self.calls['run_block'] += 1
+        self.ready_at = time.time() + self.capture_time
+        if ready_event is not None and self.signals:
+            threading.Timer(self.capture_time, ready_event.set).start()
+        # like a real device, the estimate doesn't include waiting for a trigger.
+        return 0.
+
+    def is_ready(self, device):
+        self.calls['is_ready'] += 1
+        return time.time() >= self.ready_at
+
+    def get_values_into(self, device, buffers, num_samples, segment_index=0):
+        self.calls['get_values_into'] += 1
+        for channel, array in self.registered.items():
+            array[:num_samples] = 16383 * (self.PICO_CHANNEL[channel] + 1)
+        return dict(self.overflow)
+
+    def stop(self, device):
+        self.calls['stop'] += 1
+
+
+class FakeOverlappedDriver(FakeBlockDriver):
+    """Reads the data when the block is run, if get_values_overlapped was called first."""
+    def __init__(self, **kwargs):
+        super(FakeOverlappedDriver, self).__init__(**kwargs)
+        self.pending = None
+        self.overflow_flags = 0
+
+    def can_get_values_overlapped(self):
+        return True
+
+    def get_values_overlapped(self, device, num_samples, from_segment=0, to_segment=None, overflow=None):
+        self.calls['get_values_overlapped'] += 1
+        self.pending = (num_samples, overflow)
+        return overflow, c_uint32(0)
+
+    def stop_using_get_values_overlapped(self, device):
+        self.calls['stop_using_get_values_overlapped'] += 1
+
+    def run_block(self, device, pre_trigger_samples, post_trigger_samples, timebase_id, oversample=1, segment_index=0,
+                  ready_event=None):
+        if self.pending is not None:
+            num_samples, overflow = self.pending
+            for channel, array in self.registered.items():
+                array[:num_samples] = 16383 * (self.PICO_CHANNEL[channel] + 1)
+            overflow[0] = self.overflow_flags
+            self.pending = None
+        return super(FakeOverlappedDriver, self).run_block(device, pre_trigger_samples, post_trigger_samples,
+                                                           timebase_id, oversample, segment_index, ready_event)
+
+
+class CaptureSessionTest(unittest.TestCase):
+    def setUp(self):
+        self.driver = FakeBlockDriver()
+        self.device = Device(self.driver, 1)
+        self.channels = [ChannelConfig('A', True, 'DC', 2.0), ChannelConfig('B', True, 'DC', 1.0)]
+        self.options = TimebaseOptions(max_time_interval=1e-6, no_of_samples=100)
+
+    def test_configures_once(self):
+        session = self.device.capture_session(self.options, self.channels)
+        self.assertIsInstance(session, CaptureSession)
+        configured = dict(self.driver.calls)
+        for _ in range(5):
+            times, voltages, overflow = session.capture()
+        for name in ('set_channel', 'memory_segments', 'get_timebase', 'set_null_trigger', 'maximum_value',
+                     'set_data_buffers'):
+            self.assertEqual(self.driver.calls[name], configured[name], name)
+        for name in ('run_block', 'get_values_into', 'stop'):
+            self.assertEqual(self.driver.calls[name], 5, name)
+        self.assertEqual(len(times), 100)
+        numpy.testing.assert_allclose(voltages['A'], 16383 * 2.0 / 32767)
+        numpy.testing.assert_allclose(voltages['B'], 2 * 16383 * 1.0 / 32767)
+
+    def test_conversion_tables_are_cached(self):
+        conversionTables.clear()
+        session = self.device.capture_session(self.options, self.channels)
+        for _ in range(3):
+            times, voltages, overflow = session.capture()
+        # one table for each channel's range, built by the first capture.
+        self.assertEqual(conversionTables.cacheInfo()[:2], (4, 2))
+        numpy.testing.assert_array_equal(voltages['A'], adc2mVArray(session.raw_data['A'], 2.0, 32767, rangeType="V",
+                                                                     dtype=numpy.float32))
+
+    def test_buffers_are_reused(self):
+        session = self.device.capture_session(self.options, self.channels)
+        _, first, _ = session.capture(raw=True)
+        _, second, _ = session.capture(raw=True)
+        self.assertIs(first['A'], second['A'])
+        self.assertIs(first['A'], self.driver.registered['A'])
+        self.assertEqual(first['A'].dtype, numpy.int16)
+
+    def test_capture_block_matches_session(self):
+        self.driver.overflow = {'B': True}
+        times, voltages, overflow = self.device.capture_block(self.options, self.channels)
+        self.assertEqual(overflow, {'B': True})
+        self.assertEqual(sorted(voltages), ['A', 'B'])
+        self.assertEqual(voltages['A'].dtype, numpy.float32)
+
+    def test_stats(self):
+        session = self.device.capture_session(self.options, self.channels)
+        self.assertEqual(session.stats(), CaptureStats(0, 0., 0., None))
+        for _ in range(3):
+            session.capture()
+        stats = session.stats()
+        self.assertEqual(stats.captures, 3)
+        self.assertGreaterEqual(stats.total_time, stats.wait_time)
+        self.assertGreaterEqual(stats.overhead_per_capture, 0)
+        self.assertAlmostEqual(stats.waveforms_per_second, 3 / stats.total_time)
+
+
+class OverlappedTest(unittest.TestCase):
+    def setUp(self):
+        self.driver = FakeOverlappedDriver()
+        self.device = Device(self.driver, 1)
+        self.options = TimebaseOptions(max_time_interval=1e-6, no_of_samples=100)
+        self.channels = [ChannelConfig('A', True, 'DC', 1.0), ChannelConfig('B', True, 'DC', 1.0)]
+
+    def test_reads_without_get_values(self):
+        session = self.device.capture_session(self.options, self.channels, overlapped=True)
+        self.driver.overflow_flags = 0b10
+        for _ in range(3):
+            times, data, overflow = session.capture(raw=True)
+        self.assertEqual(self.driver.calls['get_values_overlapped'], 3)
+        self.assertEqual(self.driver.calls['get_values_into'], 0)
+        self.assertEqual(self.driver.calls['stop_using_get_values_overlapped'], 3)
+        numpy.testing.assert_array_equal(data['B'], 2 * 16383)
+        self.assertEqual(overflow, {'B': True})
+        self.assertEqual(session.stats().captures, 3)
+
+    def test_requires_driver_support(self):
+        with self.assertRaises(FeatureNotSupportedError):
+            Device(FakeBlockDriver(), 1).capture_session(self.options, self.channels, overlapped=True)
+
+
+class BlockReadyTest(unittest.TestCase):
+    def test_library_callback_sets_event(self):
+        driver = Library("fake")
+        driver.BlockReadyType = CFUNCTYPE(None, c_int16, c_uint32, c_void_p)
+        event = threading.Event()
+        callback = driver._block_ready_callback(1, event)
+        self.assertIs(driver._block_ready_callback(1, event), callback)
+        callback(1, 0, None)
+        self.assertTrue(event.is_set())
+
+    def capture(self, driver):
+        device = Device(driver, 1)
+        session = device.capture_session(TimebaseOptions(max_time_interval=1e-6, no_of_samples=100),
+                                         [ChannelConfig('A', True, 'DC', 1.0)])
+        start = time.time()
+        session.capture()
+        return time.time() - start
+
+    def test_callback_wakes_without_polling(self):
+        driver = FakeBlockDriver(capture_time=0.1, signals=True)
+        elapsed = self.capture(driver)
+        self.assertEqual(driver.calls['is_ready'], 0)
+        self.assertLess(elapsed, 0.15)
+
+    def test_polling_backs_off(self):
+        driver = FakeBlockDriver(capture_time=0.1)
+        elapsed = self.capture(driver)
+        self.assertGreaterEqual(elapsed, 0.1)
+        self.assertLess(elapsed, 0.15)
+        # rather than hundreds of polls at a fixed short interval.
+        self.assertLess(driver.calls['is_ready'], 20)
+
+
+class OverflowTest(unittest.TestCase):
+    def test_overflow_bits_map_to_channels(self):
+        driver = Library("fake")
+        driver.PICO_CHANNEL = {'A': 0, 'B': 1, 'C': 2}
+        driver.PICO_RATIO_MODE = {'NONE': 0}
+        driver.PICO_STATUS = {'PICO_OK': 0}
+
+        class Function(object):
+            def __init__(self, argtypes, call=None):
+                self.argtypes = argtypes
+                self.call = call
+
+            def __call__(self, *args):
+                return self.call(*args)
+
+        def get_values(handle, start, samples, ratio, mode, segment, overflow):
+            # overflow is byref(c_int16): set bits for channels B and C.
+            overflow._obj.value = 0b110
+            return 0
+        driver._get_timebase = Function([c_int16, c_uint32])
+        driver._get_values = Function([None] * 7, get_values)
+        overflow = driver.get_values_into(Device(driver, 1), {'A': None, 'B': None, 'C': None}, 10)
+        self.assertEqual(overflow, {'B': True, 'C': True})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+#
+# Copyright (C) 2024 Pico Technology Ltd. See LICENSE file for terms.
+#
+"""
+Unit tests for picosdk.capture_store, writing stores into a temporary directory.
+"""
+
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy
+from picosdk.device import Device, ChannelConfig, TimebaseOptions, ChunkedRapidBlockSession
+from picosdk.capture_store import CaptureStoreWriter, CaptureStore
+from picosdk.errors import ArgumentOutOfRangeError
+from test.test_rapid_block import FakeRapidDriver
+
+
+class CaptureStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'store')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, segments=100, chunk=30, **kwargs):
+        with CaptureStoreWriter(self.path, ['A', 'B'], 8, channel_ranges={'A': 1.0, 'B': 5.0}, sample_interval=1e-9,
+                                max_adc=32512, **kwargs) as writer:
+            for start in range(0, segments, chunk):
+                indices = numpy.arange(start, min(start + chunk, segments))
+                data = numpy.empty((2, len(indices), 8), numpy.int16)
+                data[0] = indices[:, None]
+                data[1] = -indices[:, None]
+                overflow = numpy.zeros((2, len(indices)), bool)
+                overflow[1] = indices % 10 == 3
+                writer.append(data, indices * 0.5, overflow, trigger_offsets=indices * 1e-12)
+            self.assertEqual(writer.segments, segments)
+
+    def test_round_trip(self):
+        self.write()
+        store = CaptureStore(self.path)
+        self.assertEqual((len(store), store.channels, store.max_adc), (100, ('A', 'B'), 32512))
+        self.assertEqual(store.channel_ranges, {'A': 1.0, 'B': 5.0})
+        self.assertIsInstance(store['A'], numpy.memmap)
+        self.assertEqual(store['B'].shape, (100, 8))
+        numpy.testing.assert_array_equal(store['A'][:, 0], numpy.arange(100))
+        numpy.testing.assert_array_equal(store['B'][42], -42)
+        numpy.testing.assert_array_equal(store.times, numpy.arange(100) * 0.5)
+        self.assertEqual(store.overflow[13].tolist(), [False, True])
+        self.assertEqual(int(store.overflow[:, 1].sum()), 10)
+        self.assertAlmostEqual(store.index['trigger_offset'][7], 7e-12)
+
+    def test_time_range_lookup(self):
+        self.write()
+        store = CaptureStore(self.path)
+        self.assertEqual(store.segments_between(10., 12.), slice(20, 24))
+        self.assertEqual(store.segments_between(10.1, 10.2), slice(21, 21))
+        self.assertEqual(store.segments_between(-1., 1000.), slice(0, 100))
+        views = store.between(10., 12.)
+        numpy.testing.assert_array_equal(views['A'][:, 0], [20, 21, 22, 23])
+        # slices of the store are views of its memory maps.
+        self.assertTrue(numpy.shares_memory(views['A'], store['A']))
+
+    def test_times_are_searched_in_place(self):
+        self.write()
+        times = CaptureStore(self.path).times
+        self.assertIsInstance(times, numpy.memmap)
+        self.assertTrue(times.flags['C_CONTIGUOUS'] and times.flags['ALIGNED'])
+
+    def test_reserved_files_are_trimmed(self):
+        self.write(segments=10, reserve_segments=10000)
+        self.assertEqual(len(CaptureStore(self.path)), 10)
+        self.assertLess(os.path.getsize(os.path.join(self.path, 'channel_A.npy')), 10000)
+
+    def test_flush_shows_segments_so_far(self):
+        writer = CaptureStoreWriter(self.path, ['A'], 4)
+        writer.append(numpy.ones((1, 3, 4), numpy.int16), [0., 1., 2.])
+        writer.flush()
+        self.assertEqual(len(CaptureStore(self.path)), 3)
+        writer.close()
+
+    def test_segments_must_be_in_time_order(self):
+        with CaptureStoreWriter(self.path, ['A'], 4) as writer:
+            writer.append(numpy.ones((1, 2, 4), numpy.int16), [1., 2.])
+            with self.assertRaises(ArgumentOutOfRangeError):
+                writer.append(numpy.ones((1, 2, 4), numpy.int16), [1.5, 3.])
+            with self.assertRaises(ArgumentOutOfRangeError):
+                writer.append(numpy.ones((2, 2, 4), numpy.int16), [3., 4.])
+
+    def test_store_chunked_session(self):
+        device = Device(FakeRapidDriver(), 1)
+        session = ChunkedRapidBlockSession(device, 10, TimebaseOptions(max_time_interval=1e-6, no_of_samples=20),
+                                           [ChannelConfig('A', True, 'DC', 1.0)], chunk_segments=4)
+        trigger_times = numpy.arange(10) * 1e-3
+        with CaptureStoreWriter.for_session(self.path, session) as writer:
+            for chunk in session.capture():
+                writer.append_chunk(chunk, trigger_times[chunk.segments.start:chunk.segments.stop])
+        store = CaptureStore(self.path)
+        self.assertEqual(store['A'].shape, (10, 20))
+        self.assertEqual(store.metadata['no_of_samples'], 20)
+        numpy.testing.assert_array_equal(store.times, trigger_times)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,9 +7,14 @@ Unit tests for the wrapper functions for discovering devices
 
 from __future__ import print_function
 
+import collections
+import time
+import unittest
 from test.test_helpers import DriverTest, drivers_with_device_connected
 from picosdk.device import Device
-from picosdk.errors import DeviceNotFoundError
+from picosdk.library import Library, UnitInfo
+from picosdk.errors import DeviceNotFoundError, ArgumentOutOfRangeError, DeviceOpenTimeoutError, \
+    CannotFindPicoSDKError
 import picosdk.discover as dut
 
 
@@ -70,3 +75,232 @@ class OpenCloseTest(DriverTest):
             for device in devices:
                 device.close()
         self.assertTrue(threw)
+
+
+class SearchOrderTest(DriverTest):
+    def test_families_are_searched_in_driver_order(self):
+        timings = []
+        devices = []
+        try:
+            devices = dut.find_all_units(families=['ps2000', 'ps2000a'], timings=timings)
+        except DeviceNotFoundError:
+            pass
+        finally:
+            for device in devices:
+                device.close()
+        self.assertEqual([timing.driver for timing in timings], ['ps2000a', 'ps2000'])
+        for timing in timings:
+            self.assertIsInstance(timing, dut.DriverTiming)
+            self.assertGreaterEqual(timing.load_time, 0)
+
+    def test_unknown_family(self):
+        with self.assertRaises(ArgumentOutOfRangeError):
+            dut.find_unit(families=['ps9999'])
+
+
+class FakeDriver(Library):
+    """Opens devices after a delay (in seconds) given per serial. Serials with no delay are not found.
+    Unless it enumerates, opening without a serial opens the first device which isn't open."""
+    def __init__(self, delays, asynchronous, enumerates=True):
+        super(FakeDriver, self).__init__("fake")
+        self.delays = delays
+        self.asynchronous = asynchronous
+        self.enumerates = enumerates
+        self.opening = None
+        self.handles = {}
+        self.open_serials = set()
+        self.opens = collections.Counter()
+        self.closed = []
+
+    def _handle(self, serial):
+        return self.handles.setdefault(serial, len(self.handles) + 1)
+
+    def can_open_unit_async(self):
+        return self.asynchronous
+
+    def can_enumerate_units(self):
+        return self.enumerates
+
+    def open_unit(self, serial=None, resolution=None):
+        if serial is None and not self.enumerates:
+            closed = [found for found in sorted(self.delays) if found not in self.open_serials]
+            serial = closed[0] if closed else None
+        if self.delays.get(serial) is None:
+            raise DeviceNotFoundError(serial)
+        time.sleep(self.delays[serial])
+        self.open_serials.add(serial)
+        self.opens[serial] += 1
+        return Device(self, self._handle(serial))
+
+    def open_unit_async(self, serial=None, resolution=None):
+        if self.opening is not None:
+            return False
+        self.opening = (serial, time.time())
+        return True
+
+    def open_unit_progress(self):
+        serial, start = self.opening
+        if self.delays.get(serial) is None:
+            self.opening = None
+            raise DeviceNotFoundError(serial)
+        if time.time() - start < self.delays[serial]:
+            return 50, None
+        self.opening = None
+        return 100, Device(self, self._handle(serial))
+
+    def list_units(self, max_age=None):
+        if not self.enumerates:
+            raise AssertionError("listing would open the units")
+        return [UnitInfo(self, None, serial) for serial in sorted(self.delays)]
+
+    def get_unit_info(self, device, *args):
+        serial = [serial for serial, handle in self.handles.items() if handle == device.handle][0]
+        return UnitInfo(self, None, serial)
+
+    def close_unit(self, device):
+        self.closed.append(device.handle)
+        self.open_serials.difference_update(serial for serial, handle in self.handles.items()
+                                            if handle == device.handle)
+
+
+class OpenUnitsTest(unittest.TestCase):
+    def test_opens_concurrently_across_drivers(self):
+        async_driver = FakeDriver({b"A1": 0.1, b"A2": 0.1}, asynchronous=True)
+        thread_drivers = [FakeDriver({b"T1": 0.2}, asynchronous=False), FakeDriver({b"T2": 0.2}, asynchronous=False)]
+        units = [(async_driver, b"A1"), (async_driver, b"A2"), (thread_drivers[0], b"T1"), (thread_drivers[1], b"T2")]
+        start = time.time()
+        results = list(dut.open_units(units))
+        elapsed = time.time() - start
+        self.assertEqual(sorted(result.serial for result in results), [b"A1", b"A2", b"T1", b"T2"])
+        for result in results:
+            self.assertIsInstance(result, dut.OpenResult)
+            self.assertIsNone(result.error)
+            self.assertIsInstance(result.device, Device)
+        # the async opens on one driver take turns, but run alongside the threaded drivers.
+        self.assertLess(elapsed, 0.35)
+
+    def test_errors_are_reported_per_device(self):
+        async_driver = FakeDriver({b"A1": 0.0}, asynchronous=True)
+        thread_driver = FakeDriver({}, asynchronous=False)
+        results = dict((result.serial, result) for result in dut.open_units(
+            [(async_driver, b"missing"), (async_driver, b"A1"), (thread_driver, b"T1")]))
+        self.assertIsInstance(results[b"missing"].error, DeviceNotFoundError)
+        self.assertIsInstance(results[b"T1"].error, DeviceNotFoundError)
+        self.assertIsNotNone(results[b"A1"].device)
+
+    def test_timed_out_devices_are_closed(self):
+        # an open which finishes within twice the timeout is still polled, so that it can be closed.
+        async_driver = FakeDriver({b"A1": 0.15}, asynchronous=True)
+        thread_driver = FakeDriver({b"T1": 0.15}, asynchronous=False)
+        results = list(dut.open_units([(async_driver, b"A1"), (thread_driver, b"T1")], timeout=0.1))
+        for result in results:
+            self.assertIsNone(result.device)
+            self.assertIsInstance(result.error, DeviceOpenTimeoutError)
+        self.assertEqual(async_driver.closed, [1])
+        time.sleep(0.3)
+        self.assertEqual(thread_driver.closed, [1])
+
+    def test_stopping_early_closes_the_devices_still_opening(self):
+        async_driver = FakeDriver({b"A1": 0.05, b"A2": 0.1}, asynchronous=True)
+        thread_driver = FakeDriver({b"T1": 0.1, b"T2": 0.1}, asynchronous=False)
+        results = dut.open_units([(async_driver, b"A1"), (async_driver, b"A2"), (thread_driver, b"T1"),
+                                  (thread_driver, b"T2")])
+        first = next(results)
+        self.assertEqual(first.serial, b"A1")
+        results.close()
+        time.sleep(0.3)
+        # A2 never starts opening, and T2 never starts either.
+        self.assertEqual(async_driver.closed, [])
+        self.assertEqual(thread_driver.closed, [thread_driver.handles[b"T1"]])
+        self.assertNotIn(b"T2", thread_driver.handles)
+
+    def test_stopping_early_closes_async_opens_in_progress(self):
+        async_driver = FakeDriver({b"A1": 0.1}, asynchronous=True)
+        thread_driver = FakeDriver({b"T1": 0.0}, asynchronous=False)
+        results = dut.open_units([(async_driver, b"A1"), (thread_driver, b"T1")])
+        self.assertEqual(next(results).serial, b"T1")
+        results.close()
+        time.sleep(0.3)
+        self.assertEqual(async_driver.closed, [async_driver.handles[b"A1"]])
+
+
+class IterAllUnitsTest(unittest.TestCase):
+    def setUp(self):
+        self.fakes = {
+            'ps2000a': FakeDriver({b"A1": 0.1, b"A2": 0.1}, asynchronous=True),
+            'ps2000': FakeDriver({b"L1": 0.1, b"L2": 0.1}, asynchronous=False, enumerates=False),
+            'ps5000a': FakeDriver({b"B1": 0.1}, asynchronous=True),
+        }
+        self.load_driver = dut.load_driver
+
+        def load_driver(name):
+            if name not in self.fakes:
+                raise CannotFindPicoSDKError(name)
+            return self.fakes[name]
+        dut.load_driver = load_driver
+
+    def tearDown(self):
+        dut.load_driver = self.load_driver
+
+    def test_opens_every_unit_on_every_driver(self):
+        start = time.time()
+        devices = dut.find_all_units()
+        elapsed = time.time() - start
+        self.assertEqual(len(devices), 5)
+        # each driver opens its own units in turn, but the drivers all open at once.
+        self.assertLess(elapsed, 0.3)
+
+    def test_serial_allow_list(self):
+        devices = list(dut.iter_all_units(serials=["A2", b"L1"]))
+        self.assertEqual(sorted((device.driver.name, device.handle) for device in devices), [("fake", 1), ("fake", 1)])
+        self.assertEqual(set(device.driver for device in devices), {self.fakes['ps2000a'], self.fakes['ps2000']})
+
+    def test_units_on_drivers_which_cannot_enumerate_are_opened_once(self):
+        timings = []
+        devices = dut.find_all_units(timings=timings)
+        self.assertEqual(self.fakes['ps2000'].opens, {b"L1": 1, b"L2": 1})
+        self.assertEqual(self.fakes['ps2000'].closed, [])
+        self.assertEqual([(timing.driver, timing.units_found) for timing in timings if timing.search_time is not None],
+                         [('ps2000a', 2), ('ps5000a', 1), ('ps2000', 2)])
+        for device in devices:
+            device.close()
+
+    def test_unwanted_units_are_closed(self):
+        devices = list(dut.iter_all_units(serials=[b"L2"], families=['ps2000']))
+        self.assertEqual([device.handle for device in devices], [2])
+        self.assertEqual(self.fakes['ps2000'].closed, [1])
+        self.assertEqual(self.fakes['ps2000'].opens, {b"L1": 1, b"L2": 1})
+
+    def test_stopping_early_closes_the_other_units(self):
+        units = dut.iter_all_units(families=['ps2000'])
+        first = next(units)
+        units.close()
+        # the other unit is closed as soon as it opens.
+        time.sleep(0.3)
+        self.assertEqual(self.fakes['ps2000'].open_serials, {b"L1"})
+        self.assertEqual(self.fakes['ps2000'].closed, [2])
+        first.close()
+
+    def test_drivers_are_loaded_when_used(self):
+        loaded = []
+        load_driver = dut.load_driver
+
+        def record(name):
+            loaded.append(name)
+            return load_driver(name)
+        dut.load_driver = record
+        drivers = dut._LazyDrivers(['ps2000a', 'ps5000a'])
+        self.assertEqual(len(drivers), 2)
+        self.assertEqual(loaded, [])
+        self.assertEqual([driver.list_units()[0].serial for driver in drivers], [b"A1", b"B1"])
+        self.assertEqual(list(drivers), [self.fakes['ps2000a'], self.fakes['ps5000a']])
+        self.assertEqual(drivers[-1:], [self.fakes['ps5000a']])
+        self.assertEqual(loaded, ['ps2000a', 'ps5000a'])
+        self.assertEqual(len(dut.drivers), len(dut.driver_names))
+
+    def test_failures(self):
+        self.fakes['ps5000a'].delays[b"B2"] = None
+        failures = []
+        devices = dut.find_all_units(families=['ps5000a'], failures=failures)
+        self.assertEqual(len(devices), 1)
+        self.assertEqual([failure.serial for failure in failures], [b"B2"])
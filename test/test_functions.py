@@ -0,0 +1,164 @@
+#
+# Copyright (C) 2024 Pico Technology Ltd. See LICENSE file for terms.
+#
+"""
+Unit tests for the conversion helpers in picosdk.functions
+"""
+
+from __future__ import print_function
+
+from ctypes import c_int16, c_int32
+import unittest
+import numpy as np
+from picosdk.functions import adc2mV, adc2mVpl1000, adc2mVV2, adc2mVArray, adcBufferView, decodeDigitalPorts, \
+    digitalEdges, splitMSOData, splitMSODataFast, ConversionTableCache, CacheInfo, adc2mVLookup, \
+    triggerTimesFromInfo, interTriggerIntervals, deadTimes
+from picosdk.library import TRIGGER_INFO_DTYPE
+
+
+class AdcConversionTest(unittest.TestCase):
+    def setUp(self):
+        self.samples = [-32767, -16384, -1, 0, 1, 12345, 32767]
+        self.buffer = (c_int16 * len(self.samples))(*self.samples)
+        self.max_adc = c_int16(32767)
+
+    def test_buffer_view_does_not_copy(self):
+        view = adcBufferView(self.buffer)
+        view[0] = 42
+        self.assertEqual(self.buffer[0], 42)
+
+    def test_adc2mV_matches_scalar_formula(self):
+        # range enum 5 is 500 mV.
+        expected = [(x * 500) / 32767 for x in self.samples]
+        np.testing.assert_allclose(adc2mV(self.buffer, 5, self.max_adc), expected)
+
+    def test_wrappers_return_lists(self):
+        for millivolts in (adc2mV(self.buffer, 5, self.max_adc), adc2mVpl1000(self.buffer, 2500, c_int16(4095)),
+                           adc2mVV2(self.buffer, 5000000000, c_int32(32512))):
+            self.assertIsInstance(millivolts, list)
+            self.assertEqual(len(millivolts + [0.0]), len(self.samples) + 1)
+
+    def test_adc2mVpl1000_uses_range_in_millivolts(self):
+        expected = [(x * 2500) / 4095 for x in self.samples]
+        np.testing.assert_allclose(adc2mVpl1000(self.buffer, 2500, c_int16(4095)), expected)
+
+    def test_adc2mVV2_uses_range_in_nanovolts(self):
+        range_max = 5000000000  # 5 V
+        expected = [(x * (range_max / 1000000)) / 32512 for x in self.samples]
+        np.testing.assert_allclose(adc2mVV2(self.buffer, range_max, c_int32(32512)), expected)
+
+    def test_out_array_is_filled_in_place(self):
+        out = np.zeros(len(self.samples), dtype=np.float32)
+        result = adc2mVArray(self.buffer, 5, self.max_adc, out=out)
+        self.assertIs(result, out)
+        np.testing.assert_allclose(out, [(x * 500) / 32767 for x in self.samples], rtol=1e-6)
+
+    def test_dtype_selection(self):
+        self.assertEqual(adc2mVArray(self.buffer, 5, 32767, dtype=np.float32).dtype, np.float32)
+        self.assertEqual(adc2mVArray(self.buffer, 5, 32767).dtype, np.float64)
+
+    def test_unknown_range_type(self):
+        with self.assertRaises(ValueError):
+            adc2mVArray(self.buffer, 5, self.max_adc, rangeType="volts")
+
+
+class DigitalPortDecodingTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(1234)
+        self.port0 = rng.randint(0, 256, size=1000).astype(np.int16)
+        self.port1 = rng.randint(0, 256, size=1000).astype(np.int16)
+
+    def test_single_port_bit_planes(self):
+        planes = decodeDigitalPorts(self.port0)
+        self.assertEqual(planes.shape, (16, 1000))
+        for channel in range(8):
+            expected = [(int(x) >> channel) & 1 for x in self.port0]
+            np.testing.assert_array_equal(planes[channel], expected)
+        self.assertFalse(planes[8:].any())
+
+    def test_both_ports(self):
+        planes = decodeDigitalPorts(self.port0, self.port1, dtype=bool)
+        self.assertEqual(planes.dtype, bool)
+        np.testing.assert_array_equal(planes[11], [(int(x) >> 3) & 1 for x in self.port1])
+        np.testing.assert_array_equal(planes[3], [(int(x) >> 3) & 1 for x in self.port0])
+
+    def test_channel_selection(self):
+        planes = decodeDigitalPorts(self.port0, self.port1, channels=[15, 0])
+        self.assertEqual(planes.shape, (2, 1000))
+        np.testing.assert_array_equal(planes[0], decodeDigitalPorts(self.port0, self.port1)[15])
+
+    def test_packed_matches_unpackbits(self):
+        packed = decodeDigitalPorts(self.port0, packed=True)
+        self.assertEqual(packed.shape, (16, 125))
+        np.testing.assert_array_equal(np.unpackbits(packed, axis=1, count=1000), decodeDigitalPorts(self.port0))
+
+    def test_edges(self):
+        line = np.array([0, 0, 1, 1, 0, 1, 0, 0], dtype=np.uint8)
+        np.testing.assert_array_equal(digitalEdges(line, "rising"), [2, 5])
+        np.testing.assert_array_equal(digitalEdges(line, "falling"), [4, 6])
+        np.testing.assert_array_equal(digitalEdges(line), [2, 4, 5, 6])
+        self.assertEqual(len(digitalEdges(decodeDigitalPorts(self.port0))), 16)
+
+    def test_split_mso_data_compatibility(self):
+        buffer = (c_int16 * 4)(0x01, 0x80, 0xFF, 0x00)
+        d0_to_d7 = splitMSOData(c_int32(4), buffer)
+        self.assertEqual(d0_to_d7[0].shape, (4, 1))
+        self.assertEqual(list(d0_to_d7[0][:, 0]), [b'1', b'0', b'1', b'0'])
+        d7_to_d0 = splitMSODataFast(c_int32(4), buffer)
+        self.assertEqual(list(d7_to_d0[0]), [b'0', b'1', b'1', b'0'])
+        self.assertEqual(list(d7_to_d0[7]), [b'1', b'0', b'1', b'0'])
+
+    def test_list_input(self):
+        d0_to_d7 = splitMSOData(c_int32(3), [1, 2, 3])
+        self.assertEqual(d0_to_d7[0].shape, (3, 1))
+        self.assertEqual(list(d0_to_d7[1][:, 0]), [b'0', b'1', b'1'])
+        self.assertEqual(len(splitMSODataFast(c_int32(3), [1, 2, 3])[0]), 3)
+        np.testing.assert_array_equal(decodeDigitalPorts([-1, 0x8001], channels=[0, 1, 15]), [[1, 1], [1, 0], [1, 1]])
+
+
+class ConversionTableCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = ConversionTableCache(maxsize=2)
+        self.buffer = np.array([-32767, -100, 0, 100, 32767], dtype=np.int16)
+
+    def test_lookup_matches_direct_conversion(self):
+        result = self.cache.convert(self.buffer, "ps5000a", 7, 32512)
+        self.assertEqual(result.dtype, np.float32)
+        np.testing.assert_allclose(result, adc2mVArray(self.buffer, 7, 32512), rtol=1e-6)
+
+    def test_offset_and_attenuation(self):
+        result = self.cache.convert(self.buffer, "ps4000a", 2.0, 32767, analogOffset=0.5, probeAttenuation=10,
+                                    rangeType="V")
+        np.testing.assert_allclose(result, (self.buffer * 2.0 / 32767 - 0.5) * 10, rtol=1e-6)
+
+    def test_hits_misses_and_eviction(self):
+        self.cache.convert(self.buffer, "ps5000a", 7, 32512)
+        self.cache.convert(self.buffer, "ps5000a", 7, 32512)
+        self.assertEqual(self.cache.cacheInfo(), CacheInfo(hits=1, misses=1, maxsize=2, currsize=1))
+
+        self.cache.convert(self.buffer, "ps5000a", 8, 32512)
+        # touch range 7, so range 8 is the least recently used when range 9 arrives.
+        self.cache.convert(self.buffer, "ps5000a", 7, 32512)
+        self.cache.convert(self.buffer, "ps5000a", 9, 32512)
+        self.assertEqual(self.cache.cacheInfo().currsize, 2)
+        self.cache.convert(self.buffer, "ps5000a", 7, c_int16(32512))
+        self.assertEqual(self.cache.cacheInfo().misses, 3)
+
+    def test_out_array(self):
+        out = np.empty(self.buffer.shape, dtype=np.float32)
+        self.assertIs(adc2mVLookup(self.buffer, "ps2000a", 5, 32767, out=out), out)
+
+
+class TriggerTimingTest(unittest.TestCase):
+    def test_trigger_times_from_info(self):
+        info = np.zeros(3, TRIGGER_INFO_DTYPE)
+        info['timeStampCounter'] = [0, 1000, 2500]
+        info['triggerTime'] = [0., 200., 0.5]
+        info['timeUnits'] = [2, 1, 3]
+        np.testing.assert_allclose(triggerTimesFromInfo(info, 1e-9), [0., 1e-6 + 200e-12, 2.5e-6 + 0.5e-6])
+
+    def test_intervals_and_dead_times(self):
+        times = np.array([0., 1e-6, 2.5e-6, 3e-6])
+        np.testing.assert_allclose(interTriggerIntervals(times), [1e-6, 1.5e-6, 0.5e-6])
+        np.testing.assert_allclose(deadTimes(times, 0.4e-6), [0.6e-6, 1.1e-6, 0.1e-6])
+        self.assertEqual(len(interTriggerIntervals([1.])), 0)
@@ -0,0 +1,102 @@
+#
+# Copyright (C) 2024 Pico Technology Ltd. See LICENSE file for terms.
+#
+"""
+Unit tests for the symbol registration in picosdk.library
+"""
+
+from __future__ import print_function
+
+from ctypes import CFUNCTYPE, POINTER, c_char_p, c_int16, c_size_t, c_uint32, c_void_p, cast, memmove
+import unittest
+from picosdk.library import Library, _underscore_name
+from picosdk.errors import CannotFindPicoSDKError
+from picosdk.PicoDeviceEnums import picoEnum
+from picosdk.PicoDeviceStructs import picoStruct
+
+
+class LazySymbolTest(unittest.TestCase):
+    def test_underscore_name(self):
+        self.assertEqual(_underscore_name("_OpenUnit"), "_open_unit")
+        self.assertEqual(_underscore_name("_GetValuesBulk"), "_get_values_bulk")
+        self.assertEqual(_underscore_name("_SetSigGenBuiltInV2"), "_set_sig_gen_built_in_v2")
+
+    def test_make_symbol_does_not_load_library(self):
+        library = Library("no_such_picosdk_library")
+        library.make_symbol("_OpenUnit", "noSuchLibraryOpenUnit", c_size_t, [c_char_p])
+        self.assertFalse(library.is_loaded)
+        with self.assertRaises(CannotFindPicoSDKError):
+            library._open_unit
+
+    def test_symbol_bound_on_first_use_under_all_names(self):
+        library = Library("c")
+        library.make_symbol("_StringLength", "strlen", c_size_t, [c_char_p], "doc")
+        self.assertFalse(library.is_loaded)
+        self.assertEqual(library._string_length(b"pico"), 4)
+        self.assertTrue(library.is_loaded)
+        self.assertIs(library._StringLength, library.strlen)
+        self.assertIs(library._string_length, library.strlen)
+        self.assertEqual(library.strlen.__doc__, "doc")
+
+    def test_unknown_symbols(self):
+        library = Library("c")
+        library.make_symbol("_NotExported", "noSuchFunctionInLibc", c_size_t, [])
+        self.assertFalse(hasattr(library, "_not_registered"))
+        self.assertFalse(hasattr(library, "_not_exported"))
+        with self.assertRaises(AttributeError):
+            library.bind_symbols()
+
+
+class FakeEnumeratingLibrary(Library):
+    def __init__(self, serials):
+        super(FakeEnumeratingLibrary, self).__init__("fake")
+        self.calls = 0
+        self.serials = serials
+
+        def enumerate_units(count, serials, serial_length):
+            self.calls += 1
+            if not self.serials:
+                return self.PICO_STATUS['PICO_NOT_FOUND']
+            text = b",".join(self.serials)
+            cast(count, POINTER(c_int16))[0] = len(self.serials)
+            memmove(serials, text, len(text))
+            cast(serial_length, POINTER(c_int16))[0] = len(text)
+            return self.PICO_STATUS['PICO_OK']
+
+        # keep a reference to the callback, so that it isn't garbage collected.
+        self._enumerate_units = CFUNCTYPE(c_uint32, c_void_p, c_void_p, c_void_p)(enumerate_units)
+
+
+class ListUnitsTest(unittest.TestCase):
+    def test_enumerated_units_are_not_opened(self):
+        library = FakeEnumeratingLibrary([b"AB123/0001", b"CD456/0002"])
+        self.assertTrue(library.can_enumerate_units())
+        units = library.list_units()
+        self.assertEqual([unit.serial for unit in units], [b"AB123/0001", b"CD456/0002"])
+        self.assertEqual([unit.variant for unit in units], [None, None])
+        self.assertIs(units[0].driver, library)
+
+    def test_no_units(self):
+        self.assertEqual(FakeEnumeratingLibrary([]).list_units(), [])
+
+    def test_results_are_cached(self):
+        library = FakeEnumeratingLibrary([b"AB123/0001"])
+        library.list_units()
+        library.serials = []
+        self.assertEqual(len(library.list_units(max_age=60)), 1)
+        self.assertEqual(library.calls, 1)
+        self.assertEqual(library.list_units(max_age=0), [])
+        self.assertEqual(library.calls, 2)
+
+
+class HeaderNamespaceTest(unittest.TestCase):
+    def test_shared_headers_do_not_load_a_driver(self):
+        self.assertNotIsInstance(picoEnum, Library)
+        self.assertNotIsInstance(picoStruct, Library)
+        self.assertEqual(picoEnum.PICO_CHANNEL["PICO_CHANNEL_B"], 1)
+        self.assertEqual(picoEnum.PICO_STATUS["PICO_OK"], 0)
+        self.assertEqual(picoStruct.PICO_STREAMING_DATA_INFO.__name__, "PICO_STREAMING_DATA_INFO")
+
+
+if __name__ == '__main__':
+    unittest.main()
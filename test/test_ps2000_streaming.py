@@ -0,0 +1,120 @@
+#
+# Copyright (C) 2024 Pico Technology Ltd. See LICENSE file for terms.
+#
+"""
+Unit tests for ps2000 fast streaming with picosdk.ps2000.StreamingCollector, with fake C functions behind the
+ps2000 wrappers.
+"""
+
+from __future__ import print_function
+
+from ctypes import POINTER, c_int16
+import unittest
+import numpy
+from picosdk.ps2000 import ps2000, Ps2000lib, StreamingCollector, StreamingChunk
+from picosdk.device import Device, ChannelConfig
+from picosdk.errors import InvalidCaptureParameters
+from test.test_rapid_block import Function
+
+
+class FakePs2000(Ps2000lib):
+    """Each poll streams batch values, where value n of channel c has max (n + 1000 * c) % 30000, and min its
+    negative."""
+    def __init__(self, batch=300, total=None, overflow_at=None, trigger_at=None):
+        super(FakePs2000, self).__init__()
+        self.PICO_CHANNEL = ps2000.PICO_CHANNEL
+        self.GetOverviewBuffersType = ps2000.GetOverviewBuffersType
+        self.batch = batch
+        self.total = total
+        self.overflow_at = overflow_at
+        self.trigger_at = trigger_at
+        self.streamed = 0
+        self.calls = []
+        self.overview_buffers = [numpy.zeros(batch, numpy.int16) for _ in range(4)]
+        self._run_streaming_ns = Function([None] * 7, self.run_streaming_ns_call)
+        self._get_streaming_last_values = Function([None] * 2, self.get_streaming_last_values_call)
+        self._stop = Function([c_int16], lambda handle: 1)
+        self._stop.restype = c_int16
+
+    def set_channel(self, device, channel_name='A', enabled=True, coupling='DC', range_peak=float('inf'),
+                    analog_offset=None):
+        return range_peak
+
+    def run_streaming_ns_call(self, handle, interval, time_units, max_samples, auto_stop, aggregate, overview_size):
+        self.calls.append((interval.value, time_units.value, max_samples.value, auto_stop.value))
+        return 1
+
+    def get_streaming_last_values_call(self, handle, callback):
+        count = self.batch
+        if self.total is not None:
+            count = min(count, self.total - self.streamed)
+            if count == 0:
+                return 0
+        values = numpy.arange(self.streamed, self.streamed + count)
+        for channel in range(2):
+            self.overview_buffers[2 * channel][:count] = (values + 1000 * channel) % 30000
+            self.overview_buffers[2 * channel + 1][:count] = -((values + 1000 * channel) % 30000)
+        pointers = (POINTER(c_int16) * 4)(*[buffer.ctypes.data_as(POINTER(c_int16))
+                                            for buffer in self.overview_buffers])
+        overflow = 0b10 if self.overflow_at is not None and self.streamed <= self.overflow_at < self.streamed + count \
+            else 0
+        triggered = self.trigger_at is not None and self.streamed <= self.trigger_at < self.streamed + count
+        trigger_at = self.trigger_at - self.streamed if triggered else 0
+        self.streamed += count
+        callback(pointers, overflow, trigger_at, int(triggered), int(self.total is not None and
+                                                                      self.streamed >= self.total), count)
+        return 1
+
+
+class StreamingCollectorTest(unittest.TestCase):
+    def setUp(self):
+        self.driver = FakePs2000()
+        self.device = Device(self.driver, 1)
+
+    def collect(self, channels, **kwargs):
+        self.device.set_channels(*[ChannelConfig(channel, True, 'DC', 1.0) for channel in channels])
+        with StreamingCollector(self.device, 1e-6, chunk_samples=1000, poll_interval=0, **kwargs) as collector:
+            return collector.channels, [(chunk.start, chunk.max.copy(), chunk.min.copy(), chunk.overflow.tolist(),
+                                         chunk.trigger_index) for chunk in collector]
+
+    def test_chunks(self):
+        channels, chunks = self.collect(['B', 'A'], max_samples=2500)
+        self.assertEqual(channels, ('A', 'B'))
+        self.assertEqual([start for start, _, _, _, _ in chunks], [0, 1000, 2000])
+        for start, maximum, minimum, _, _ in chunks:
+            expected = numpy.arange(start, start + maximum.shape[1])
+            numpy.testing.assert_array_equal(maximum[0], expected)
+            numpy.testing.assert_array_equal(maximum[1], expected + 1000)
+            numpy.testing.assert_array_equal(minimum, -maximum)
+        self.assertEqual(chunks[-1][1].shape, (2, 500))
+        # the interval is in ns, and the driver stops itself after max_samples.
+        self.assertEqual(self.driver.calls, [(1000, 2, 2500, 1)])
+
+    def test_overflow_and_trigger(self):
+        self.driver.overflow_at = 1200
+        self.driver.trigger_at = 2345
+        _, chunks = self.collect(['A', 'B'], max_samples=3000)
+        self.assertEqual([(overflow, trigger_index) for _, _, _, overflow, trigger_index in chunks],
+                         [([False, False], None), ([False, True], None), ([False, False], 345)])
+
+    def test_device_stopping_ends_iteration(self):
+        self.driver.total = 1500
+        _, chunks = self.collect(['A'])
+        self.assertEqual([maximum.shape for _, maximum, _, _, _ in chunks], [(1, 1000), (1, 500)])
+
+    def test_chunks_are_views(self):
+        self.device.set_channels(ChannelConfig('A', True, 'DC', 1.0))
+        with StreamingCollector(self.device, 1e-6, chunk_samples=1000, max_samples=5000, poll_interval=0) as collector:
+            chunk = next(collector)
+            self.assertIsInstance(chunk, StreamingChunk)
+            self.assertIs(chunk.max.base, collector._max)
+
+    def test_run_streaming_failure(self):
+        self.driver._run_streaming_ns = Function([None] * 7, lambda *args: 0)
+        self.device.set_channels(ChannelConfig('A', True, 'DC', 1.0))
+        with self.assertRaises(InvalidCaptureParameters):
+            StreamingCollector(self.device, 1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
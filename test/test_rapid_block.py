@@ -0,0 +1,392 @@
+#
+# Copyright (C) 2024 Pico Technology Ltd. See LICENSE file for terms.
+#
+"""
+Unit tests for rapid block captures with picosdk.device.RapidBlockSession, using a fake driver.
+"""
+
+from __future__ import print_function
+
+from ctypes import CFUNCTYPE, c_double, c_int16, c_int32, c_int64, c_uint16, c_uint32, c_uint64, c_void_p, sizeof
+import unittest
+import numpy
+from picosdk.library import Library, TRIGGER_INFO_DTYPE
+from picosdk.PicoDeviceStructs import picoStruct
+from picosdk.ps6000a import ps6000a
+from picosdk.device import Device, ChannelConfig, TimebaseOptions, RapidBlockSession, RapidBlockData, \
+    ChunkedRapidBlockSession, RapidBlockChunk
+from picosdk.errors import DeviceCannotSegmentMemoryError, FeatureNotSupportedError, ArgumentOutOfRangeError
+from test.test_capture_session import FakeBlockDriver
+
+
+class FakeRapidDriver(FakeBlockDriver):
+    """Fills each segment's buffers with (segment number * 10 + channel number), and can flag overflows per segment."""
+    def __init__(self, **kwargs):
+        super(FakeRapidDriver, self).__init__(**kwargs)
+        self.segments = {}
+        self.captures = None
+        self.overflow_flags = {}
+
+    def memory_segments(self, device, number_segments):
+        self.calls['memory_segments'] += 1
+        return c_int32(100000 // number_segments)
+
+    def set_no_of_captures(self, device, number_captures):
+        self.calls['set_no_of_captures'] += 1
+        self.captures = number_captures
+
+    def set_data_buffers(self, device, buffers, segment_index=0):
+        self.calls['set_data_buffers'] += 1
+        self.segments[segment_index] = buffers
+
+    def get_values_bulk(self, device, num_samples, from_segment, to_segment, overflow=None):
+        self.calls['get_values_bulk'] += 1
+        for segment_index in range(from_segment, to_segment + 1):
+            for channel, array in self.segments[segment_index].items():
+                array[:num_samples] = segment_index * 10 + self.PICO_CHANNEL[channel]
+            overflow[segment_index - from_segment] = self.overflow_flags.get(segment_index, 0)
+        return overflow
+
+    def get_trigger_time_offsets_bulk(self, device, from_segment, to_segment, times=None, time_units=None):
+        self.calls['get_trigger_time_offsets_bulk'] += 1
+        # each segment's offset is its segment number, in picoseconds.
+        times[:] = numpy.arange(from_segment, to_segment + 1)
+        time_units[:] = 1
+        return times, time_units
+
+
+class RapidBlockSessionTest(unittest.TestCase):
+    def setUp(self):
+        self.driver = FakeRapidDriver()
+        self.device = Device(self.driver, 1)
+        self.channels = [ChannelConfig('B', True, 'DC', 1.0), ChannelConfig('A', True, 'DC', 2.0)]
+        self.options = TimebaseOptions(max_time_interval=1e-6, no_of_samples=50)
+
+    def test_one_contiguous_array(self):
+        result = self.device.capture_rapid_block(8, self.options, self.channels)
+        self.assertIsInstance(result, RapidBlockData)
+        self.assertEqual(result.channels, ('A', 'B'))
+        self.assertEqual(result.data.shape, (2, 8, 50))
+        self.assertEqual(result.data.dtype, numpy.int16)
+        self.assertTrue(result.data.flags['C_CONTIGUOUS'])
+        self.assertEqual(len(result.times), 50)
+        self.assertEqual(self.driver.captures, 8)
+        for segment_index in range(8):
+            numpy.testing.assert_array_equal(result.data[0, segment_index], segment_index * 10)
+            numpy.testing.assert_array_equal(result.data[1, segment_index], segment_index * 10 + 1)
+            # the driver was given views into the one array, not copies.
+            self.assertIs(self.driver.segments[segment_index]['B'].base, result.data)
+
+    def test_overflow_per_segment(self):
+        self.driver.overflow_flags = {2: 0b01, 5: 0b10, 7: 0b11}
+        result = self.device.capture_rapid_block(8, self.options, self.channels)
+        self.assertEqual(result.overflow.shape, (2, 8))
+        self.assertEqual(result.overflow.dtype, numpy.bool_)
+        self.assertEqual(list(numpy.nonzero(result.overflow[0])[0]), [2, 7])
+        self.assertEqual(list(numpy.nonzero(result.overflow[1])[0]), [5, 7])
+
+    def test_repeated_captures_configure_once(self):
+        session = self.device.rapid_block_session(4, self.options, self.channels)
+        self.assertIsInstance(session, RapidBlockSession)
+        configured = dict(self.driver.calls)
+        self.assertEqual(configured['set_data_buffers'], 4)
+        for _ in range(3):
+            result = session.capture()
+        for name in ('set_channel', 'memory_segments', 'set_no_of_captures', 'set_data_buffers'):
+            self.assertEqual(self.driver.calls[name], configured[name], name)
+        for name in ('run_block', 'get_values_bulk', 'stop'):
+            self.assertEqual(self.driver.calls[name], 3, name)
+        self.assertIs(result.data, session.raw_data)
+
+    def test_volts(self):
+        result = self.device.capture_rapid_block(3, self.options, self.channels, raw=False)
+        self.assertEqual(result.data.dtype, numpy.float32)
+        self.assertEqual(result.data.shape, (2, 3, 50))
+        numpy.testing.assert_allclose(result.data[1, 2], 21 * 1.0 / 32767, rtol=1e-6)
+
+    def test_requires_segmented_memory(self):
+        def cannot_segment(device, number_segments):
+            raise DeviceCannotSegmentMemoryError()
+        self.driver.memory_segments = cannot_segment
+        with self.assertRaises(DeviceCannotSegmentMemoryError):
+            self.device.capture_rapid_block(4, self.options, self.channels)
+
+
+class ChunkedRapidBlockTest(unittest.TestCase):
+    def setUp(self):
+        self.driver = FakeRapidDriver()
+        self.device = Device(self.driver, 1)
+        self.channels = [ChannelConfig('A', True, 'DC', 1.0), ChannelConfig('B', True, 'DC', 1.0)]
+        self.options = TimebaseOptions(max_time_interval=1e-6, no_of_samples=20)
+
+    def test_chunks_cover_all_segments(self):
+        self.driver.overflow_flags = {9: 0b10}
+        chunks = []
+        for chunk in self.device.capture_rapid_block_chunks(10, self.options, self.channels, chunk_segments=4):
+            self.assertIsInstance(chunk, RapidBlockChunk)
+            chunks.append((list(chunk.segments), chunk.data.copy(), chunk.overflow.copy(),
+                           chunk.trigger_offsets.copy()))
+        self.assertEqual([segments for segments, _, _, _ in chunks], [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]])
+        segments, data, overflow, trigger_offsets = chunks[2]
+        self.assertEqual(data.shape, (2, 2, 20))
+        numpy.testing.assert_array_equal(data[1, 1], 91)
+        self.assertEqual(overflow.tolist(), [[False, False], [False, True]])
+        numpy.testing.assert_allclose(trigger_offsets, [8e-12, 9e-12])
+        self.assertEqual(self.driver.calls['get_values_bulk'], 3)
+        self.assertEqual(self.driver.calls['stop'], 1)
+
+    def test_buffer_pool_is_bounded(self):
+        session = ChunkedRapidBlockSession(self.device, 1000, self.options, self.channels, chunk_segments=10,
+                                           pool_size=3)
+        buffers = set()
+        for chunk in session.capture():
+            buffers.add(chunk.data.__array_interface__['data'][0])
+        self.assertEqual(len(buffers), 3)
+        self.assertEqual(sum(data.nbytes for data in session._data_pool), 3 * 2 * 10 * 20 * 2)
+
+    def test_stops_when_iteration_ends_early(self):
+        chunks = self.device.capture_rapid_block_chunks(10, self.options, self.channels, chunk_segments=2)
+        next(chunks)
+        chunks.close()
+        self.assertEqual(self.driver.calls['get_values_bulk'], 1)
+        self.assertEqual(self.driver.calls['stop'], 1)
+
+    def test_buffers_only_registered_again_when_the_window_changes(self):
+        session = ChunkedRapidBlockSession(self.device, 8, self.options, self.channels, chunk_segments=4)
+        for _ in range(3):
+            list(session.capture())
+        # two chunks fit the pool of two buffers, so the segments were registered once.
+        self.assertEqual(self.driver.calls['set_data_buffers'], 8)
+        self.assertEqual(session.stats().captures, 3)
+
+    def test_without_trigger_offsets(self):
+        def not_supported(*args):
+            raise FeatureNotSupportedError()
+        self.driver.get_trigger_time_offsets_bulk = not_supported
+        chunks = list(self.device.capture_rapid_block_chunks(4, self.options, self.channels, chunk_segments=2))
+        self.assertEqual([chunk.trigger_offsets for chunk in chunks], [None, None])
+
+
+class FakeOverlappedRapidDriver(FakeRapidDriver):
+    def can_get_values_overlapped(self):
+        return True
+
+    def get_values_overlapped(self, device, num_samples, from_segment=0, to_segment=None, overflow=None):
+        self.calls['get_values_overlapped'] += 1
+        self.pending = (num_samples, from_segment, to_segment, overflow)
+        return overflow, c_uint32(0)
+
+    def stop_using_get_values_overlapped(self, device):
+        pass
+
+    def run_block(self, device, pre_trigger_samples, post_trigger_samples, timebase_id, oversample=1, segment_index=0,
+                  ready_event=None):
+        self.get_values_bulk(device, *self.pending)
+        self.calls['get_values_bulk'] -= 1
+        return super(FakeOverlappedRapidDriver, self).run_block(device, pre_trigger_samples, post_trigger_samples,
+                                                                timebase_id, oversample, segment_index, ready_event)
+
+
+class OverlappedRapidBlockTest(unittest.TestCase):
+    def test_segments_read_during_capture(self):
+        driver = FakeOverlappedRapidDriver()
+        driver.overflow_flags = {3: 0b1}
+        session = Device(driver, 1).rapid_block_session(5, TimebaseOptions(max_time_interval=1e-6, no_of_samples=10),
+                                                        [ChannelConfig('A', True, 'DC', 1.0)], overlapped=True)
+        result = session.capture()
+        self.assertEqual(driver.calls['get_values_overlapped'], 1)
+        self.assertEqual(driver.calls['get_values_bulk'], 0)
+        self.assertEqual(driver.pending[1:3], (0, 4))
+        numpy.testing.assert_array_equal(result.data[0, 4], 40)
+        self.assertEqual(list(numpy.nonzero(result.overflow[0])[0]), [3])
+        stats = session.stats()
+        self.assertAlmostEqual(stats.waveforms_per_second, 5 / stats.total_time)
+
+
+class Function(object):
+    def __init__(self, argtypes, call=None):
+        self.argtypes = argtypes
+        self.call = call
+
+    def __call__(self, *args):
+        return self.call(*args)
+
+
+class LibraryBulkTest(unittest.TestCase):
+    def setUp(self):
+        self.driver = Library("fake")
+        self.driver.PICO_CHANNEL = {'A': 0, 'B': 1}
+        self.driver.PICO_RATIO_MODE = {'NONE': 0}
+        self.driver.PICO_STATUS = {'PICO_OK': 0}
+        self.driver._get_timebase = Function([c_int16, c_uint32])
+        self.driver._get_values = Function([None] * 7)
+        self.device = Device(self.driver, 1)
+        self.calls = []
+
+    def record(self, *args):
+        self.calls.append(args)
+        return 0
+
+    def test_set_data_buffer_with_segment(self):
+        self.driver._set_data_buffer = Function([c_int16, c_int32, c_void_p, c_int32, c_uint32, c_int32], self.record)
+        array = numpy.zeros(10, numpy.int16)
+        self.driver.set_data_buffers(self.device, {'B': array}, 3)
+        _, channel, pointer, length, segment, _ = self.calls[0]
+        self.assertEqual((channel.value, pointer, length.value, segment.value), (1, array.ctypes.data, 10, 3))
+
+    def test_set_data_buffer_bulk(self):
+        # ps4000: set_data_buffer has no segment index.
+        self.driver._set_data_buffer = Function([c_int16, c_int32, c_void_p, c_int32])
+        self.driver._set_data_buffer_bulk = Function([c_int16, c_int32, c_void_p, c_int32, c_uint16], self.record)
+        self.driver.set_data_buffers(self.device, {'A': numpy.zeros(10, numpy.int16)}, 2)
+        self.assertEqual(len(self.calls[0]), 5)
+        self.assertEqual(self.calls[0][4].value, 2)
+
+    def test_get_values_bulk(self):
+        def get_values_bulk(handle, samples, from_segment, to_segment, ratio, mode, overflow):
+            self.calls.append((from_segment.value, to_segment.value))
+            flags = (c_int16 * 3).from_address(overflow)
+            flags[1] = 0b10
+            return 0
+        self.driver._get_values_bulk = Function([None] * 7, get_values_bulk)
+        overflow = self.driver.get_values_bulk(self.device, 10, 4, 6)
+        self.assertEqual(self.calls, [(4, 6)])
+        self.assertEqual(list(overflow), [0, 2, 0])
+
+    def test_trigger_time_offsets_prefer_64_bit(self):
+        self.driver._get_values_trigger_time_offset_bulk = Function([c_int16, c_void_p, c_void_p, c_void_p, c_uint32,
+                                                                     c_uint32])
+        self.driver._get_values_trigger_time_offset_bulk64 = Function([c_int16, c_void_p, c_void_p, c_uint32, c_uint32],
+                                                                      self.record)
+        times, time_units = self.driver.get_trigger_time_offsets_bulk(self.device, 2, 5)
+        self.assertEqual((times.dtype, len(times), time_units.dtype), (numpy.int64, 4, numpy.int32))
+        self.assertEqual((self.calls[0][3].value, self.calls[0][4].value), (2, 5))
+
+    def test_trigger_time_offsets_in_seconds(self):
+        def get_offsets(handle, times, time_units, from_segment, to_segment):
+            numpy.ctypeslib.as_array((c_int64 * 3).from_address(times))[:] = [5, 7, 9]
+            numpy.ctypeslib.as_array((c_int32 * 3).from_address(time_units))[:] = [0, 1, 2]
+            return 0
+        self.driver._get_values_trigger_time_offset_bulk64 = Function([c_int16, c_void_p, c_void_p, c_uint32, c_uint32],
+                                                                      get_offsets)
+        out = numpy.zeros(3)
+        offsets = self.driver.get_trigger_time_offsets_seconds(self.device, 0, 2, out=out)
+        self.assertIs(offsets.base, out)
+        numpy.testing.assert_allclose(out, [5e-15, 7e-12, 9e-9])
+
+    def test_trigger_time_offset_buffers_are_checked(self):
+        self.driver._get_values_trigger_time_offset_bulk64 = Function([c_int16, c_void_p, c_void_p, c_uint32, c_uint32],
+                                                                      self.record)
+        for times, time_units in ((numpy.zeros(2, numpy.int64), None),
+                                  (numpy.zeros(3, numpy.int32), None),
+                                  (numpy.zeros(6, numpy.int64)[::2], None),
+                                  (None, numpy.zeros(3, numpy.int64))):
+            with self.assertRaises(ArgumentOutOfRangeError):
+                self.driver.get_trigger_time_offsets_bulk(self.device, 0, 2, times, time_units)
+        with self.assertRaises(ArgumentOutOfRangeError):
+            self.driver.get_trigger_time_offsets_seconds(self.device, 0, 2, out=numpy.zeros(3, numpy.float32))
+        self.assertEqual(self.calls, [])
+
+    def test_get_trigger_info(self):
+        def get_trigger_info(handle, info, first_segment, segment_count):
+            records = (picoStruct.PICO_TRIGGER_INFO * segment_count.value).from_address(info)
+            for i, record in enumerate(records):
+                record.segmentIndex = first_segment.value + i
+                record.timeStampCounter = 1000 * i
+                record.triggerTime = 0.25
+                record.timeUnits = 2
+            return 0
+        self.assertFalse(self.driver.can_get_trigger_info())
+        self.driver._get_trigger_info = Function([c_int16, c_void_p, c_uint64, c_uint64], get_trigger_info)
+        self.assertTrue(self.driver.can_get_trigger_info())
+        self.assertEqual(TRIGGER_INFO_DTYPE.itemsize, sizeof(picoStruct.PICO_TRIGGER_INFO))
+        info = self.driver.get_trigger_info_records(self.device, 10, 4)
+        self.assertEqual(info['segmentIndex'].tolist(), [10, 11, 12, 13])
+        self.assertEqual(info['timeStampCounter'].tolist(), [0, 1000, 2000, 3000])
+        numpy.testing.assert_array_equal(info['triggerTime'], 0.25)
+        self.assertEqual(info['timeUnits'].tolist(), [2] * 4)
+
+    def test_trigger_info_buffer_is_checked(self):
+        self.driver._get_trigger_info = Function([c_int16, c_void_p, c_uint64, c_uint64], self.record)
+        for info in (numpy.zeros(3, TRIGGER_INFO_DTYPE), numpy.zeros(4, numpy.float64),
+                     numpy.zeros(8, TRIGGER_INFO_DTYPE)[::2]):
+            with self.assertRaises(ArgumentOutOfRangeError):
+                self.driver.get_trigger_info_records(self.device, 0, 4, info)
+        self.assertEqual(self.calls, [])
+        self.driver.get_trigger_info_records(self.device, 0, 4, numpy.zeros(5, TRIGGER_INFO_DTYPE))
+        self.assertEqual(len(self.calls), 1)
+
+    def test_get_trigger_info_not_supported(self):
+        with self.assertRaises(FeatureNotSupportedError):
+            self.driver.get_trigger_info_records(self.device, 0, 4)
+
+    def test_trigger_info_records_after_binding_the_c_function(self):
+        # ps6000a registers GetTriggerInfo twice, once as _getTriggerInfo, whose alias is get_trigger_info.
+        def get_trigger_info(handle, info, first_segment, segment_count):
+            records = (picoStruct.PICO_TRIGGER_INFO * segment_count).from_address(info)
+            for i, record in enumerate(records):
+                record.segmentIndex = first_segment + i
+            return 0
+
+        class FakeClib(object):
+            ps6000aGetTriggerInfo = CFUNCTYPE(c_uint32, c_int16, c_void_p, c_uint64, c_uint64)(get_trigger_info)
+
+        driver = Library("ps6000a")
+        driver._symbols = dict(ps6000a._symbols)
+        driver.PICO_STATUS = ps6000a.PICO_STATUS
+        driver._loaded_clib = FakeClib()
+        # as the ps6000a examples do.
+        self.assertIs(driver._getTriggerInfo, FakeClib.ps6000aGetTriggerInfo)
+        self.assertIs(driver.ps6000aGetTriggerInfo, FakeClib.ps6000aGetTriggerInfo)
+        self.assertTrue(driver.can_get_trigger_info())
+        info = driver.get_trigger_info_records(Device(driver, 1), 5, 3)
+        self.assertEqual(info['segmentIndex'].tolist(), [5, 6, 7])
+
+    def test_get_values_overlapped_bulk(self):
+        self.driver._get_values_overlapped = Function([None] * 7)
+        self.driver._get_values_overlapped_bulk = Function([c_int16, c_uint32, c_void_p, c_uint32, c_int32, c_uint32,
+                                                            c_int32, c_void_p], self.record)
+        overflow, samples = self.driver.get_values_overlapped(self.device, 100, 0, 9)
+        self.assertEqual(len(overflow), 10)
+        self.assertEqual(samples.value, 100)
+        self.assertEqual((self.calls[0][5].value, self.calls[0][6].value), (0, 9))
+
+    def run_block_with(self, argtypes, time_indisposed_type):
+        # a real C function pointer, so that ctypes checks the argument types as it would for the driver.
+        def run_block(handle, pre_samples, post_samples, timebase_id, time_indisposed, segment_index, ready, parameter):
+            time_indisposed_type.from_address(time_indisposed).value = 5
+            self.calls.append((pre_samples, post_samples, timebase_id, segment_index))
+            return 0
+        self.driver.BlockReadyType = CFUNCTYPE(None, c_int16, c_uint32, c_void_p)
+        function = CFUNCTYPE(c_uint32, *argtypes)(run_block)
+        function.argtypes = argtypes
+        self.driver._run_block = function
+        self.assertTrue(self.driver.can_signal_block_ready())
+        time_indisposed = self.driver._python_run_block(1, 10, 20, 3, 1, 2)
+        self.assertEqual(self.calls, [(10, 20, 3, 2)])
+        self.assertAlmostEqual(time_indisposed, 0.005)
+
+    def test_run_block_32_bit_without_oversample(self):
+        # ps4000a and ps5000a.
+        self.run_block_with([c_int16, c_int32, c_int32, c_uint32, c_void_p, c_uint32, c_void_p, c_void_p], c_int32)
+
+    def test_run_block_64_bit(self):
+        # ps6000a and psospa.
+        self.run_block_with([c_int16, c_uint64, c_uint64, c_uint32, c_void_p, c_uint64, c_void_p, c_void_p], c_double)
+
+    def test_unknown_run_block_cannot_signal(self):
+        self.driver.BlockReadyType = CFUNCTYPE(None, c_int16, c_uint32, c_void_p)
+        self.driver._run_block = Function([None] * 8)
+        self.assertFalse(self.driver.can_signal_block_ready())
+        with self.assertRaises(NotImplementedError):
+            self.driver._python_run_block(1, 10, 20, 3, 1, 0)
+
+    def test_set_no_of_captures_uses_driver_width(self):
+        self.driver._set_no_of_captures = Function([c_int16, c_uint64], self.record)
+        self.driver.set_no_of_captures(self.device, 2 ** 33)
+        self.assertIsInstance(self.calls[0][1], c_uint64)
+        self.assertEqual(self.calls[0][1].value, 2 ** 33)
+
+
+if __name__ == '__main__':
+    unittest.main()
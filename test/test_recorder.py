@@ -0,0 +1,98 @@
+#
+# Copyright (C) 2024 Pico Technology Ltd. See LICENSE file for terms.
+#
+"""
+Unit tests for picosdk.recorder.StreamRecorder, recording from fake streams into a temporary directory.
+"""
+
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import numpy
+from picosdk.device import Device, ChannelConfig
+from picosdk.recorder import StreamRecorder, NpyAppender, load_recording, metadata_path
+from picosdk.streaming import PooledStream
+from picosdk.errors import ArgumentOutOfRangeError
+from test.test_streaming import FakeStreamingDriver, FakeDataInfoDriver, expected
+
+
+class StreamRecorderTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'capture.npy')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_write_blocks(self):
+        blocks = [numpy.arange(i * 100, (i + 1) * 100, dtype=numpy.int16).reshape(2, 50) for i in range(5)]
+        released = []
+        with StreamRecorder(self.path, ['A', 'B'], channel_ranges={'A': 1.0, 'B': 2.0}, sample_interval=1e-6,
+                            max_adc=32767, metadata={'note': 'test'}) as recorder:
+            for i, block in enumerate(blocks):
+                recorder.write(block, lambda i=i: released.append(i))
+        data, metadata = load_recording(self.path)
+        self.assertIsInstance(data, numpy.memmap)
+        self.assertEqual((data.shape, data.dtype), ((250, 2), numpy.int16))
+        numpy.testing.assert_array_equal(data, numpy.concatenate(blocks, axis=1).T)
+        self.assertEqual(released, list(range(5)))
+        self.assertEqual(metadata, {'channels': ['A', 'B'], 'channel_ranges': {'A': 1.0, 'B': 2.0},
+                                    'sample_interval': 1e-6, 'max_adc': 32767, 'note': 'test'})
+
+    def test_preallocated_file_is_trimmed(self):
+        with StreamRecorder(self.path, ['A'], max_samples=100000) as recorder:
+            self.assertGreaterEqual(os.path.getsize(self.path), 200000)
+            recorder.write(numpy.ones((1, 10), numpy.int16))
+        data, _ = load_recording(self.path)
+        self.assertEqual(data.shape, (10, 1))
+        self.assertEqual(os.path.getsize(self.path), NpyAppender.HEADER_SIZE + 20)
+
+    def test_full_queue_holds_up_writes(self):
+        recorder = StreamRecorder(self.path, ['A'], queue_size=1)
+        released = threading.Event()
+        # the writer is held up by the first block, and the second fills the queue.
+        recorder.write(numpy.zeros((1, 1), numpy.int16), released.wait)
+        recorder.write(numpy.zeros((1, 1), numpy.int16))
+        blocked = threading.Thread(target=recorder.write, args=(numpy.zeros((1, 1), numpy.int16),))
+        blocked.start()
+        blocked.join(0.1)
+        self.assertTrue(blocked.is_alive())
+        released.set()
+        blocked.join(1)
+        recorder.close()
+        self.assertEqual(recorder.samples_written, 3)
+
+    def test_wrong_number_of_channels(self):
+        with StreamRecorder(self.path, ['A', 'B']) as recorder:
+            with self.assertRaises(ArgumentOutOfRangeError):
+                recorder.write(numpy.zeros((1, 10), numpy.int16))
+
+    def test_record_stream(self):
+        device = Device(FakeStreamingDriver(), 1)
+        device.set_channels(ChannelConfig('A', True, 'DC', 1.0), ChannelConfig('B', True, 'DC', 2.0))
+        with device.stream(1e-6, chunk_samples=1000, ring_chunks=4, max_samples=20000, poll_interval=0) as stream:
+            with StreamRecorder.for_stream(self.path, stream) as recorder:
+                recorder.record(stream)
+        data, metadata = load_recording(self.path)
+        numpy.testing.assert_array_equal(data[:, 0], expected(0, 20000))
+        numpy.testing.assert_array_equal(data[:, 1], expected(0, 20000, channel=1))
+        self.assertEqual((metadata['channel_ranges'], metadata['max_adc']), ({'A': 1.0, 'B': 2.0}, 32767))
+
+    def test_record_pooled_stream_without_copies(self):
+        device = Device(FakeDataInfoDriver(), 1)
+        device.set_channels(ChannelConfig('A', True, 'DC', 1.0))
+        stream = PooledStream(device, ['A'], 1e-8, buffer_samples=1000, pool_size=3, max_buffers=20, poll_interval=0)
+        with stream, StreamRecorder.for_stream(self.path, stream, queue_size=2) as recorder:
+            recorder.record(stream)
+        data, metadata = load_recording(self.path)
+        numpy.testing.assert_array_equal(data[:, 0], expected(0, 20000))
+        self.assertEqual(metadata['sample_interval'], 1e-8)
+        self.assertTrue(os.path.exists(metadata_path(self.path)))
+
+
+if __name__ == '__main__':
+    unittest.main()
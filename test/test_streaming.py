@@ -0,0 +1,487 @@
+#
+# Copyright (C) 2024 Pico Technology Ltd. See LICENSE file for terms.
+#
+"""
+Unit tests for picosdk.streaming.Stream, using a fake driver which streams a counting signal.
+"""
+
+from __future__ import print_function
+
+from ctypes import CFUNCTYPE, c_int16, c_int32, c_uint32, c_uint64, c_void_p
+import collections
+import threading
+import time
+import unittest
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+import numpy
+from picosdk.library import Library
+from picosdk.PicoDeviceStructs import picoStruct
+from picosdk.ps6000a import ps6000a
+from picosdk.device import Device, ChannelConfig
+from picosdk.streaming import Stream, StreamChunk, PooledStream, StreamBuffer, StreamingRingSink
+from picosdk.errors import FeatureNotSupportedError, ArgumentOutOfRangeError
+from test.test_capture_session import FakeBlockDriver
+from test.test_rapid_block import Function
+
+
+class FakeStreamingDriver(FakeBlockDriver):
+    """Each poll 'captures' batch samples into the registered buffers (wrapping around them), where sample n of channel
+    c is (n + 1000 * c) % 30000."""
+    StreamingReadyType = CFUNCTYPE(None, c_int16, c_int32, c_uint32, c_int16, c_uint32, c_int16, c_int16, c_void_p)
+
+    def __init__(self, batch=300, total=None, overflow_at=None, trigger_at=None):
+        super(FakeStreamingDriver, self).__init__()
+        self.batch = batch
+        self.total = total
+        self.overflow_at = overflow_at
+        self.trigger_at = trigger_at
+        self.captured = 0
+        self.buffer_size = None
+        self.polled = threading.Event()
+
+    def can_stream(self):
+        return True
+
+    def run_streaming(self, device, sample_interval, buffer_size, pre_trigger_samples=0, post_trigger_samples=0,
+                      auto_stop=False):
+        self.calls['run_streaming'] += 1
+        self.buffer_size = buffer_size
+        return sample_interval
+
+    def get_streaming_latest_values(self, device, streaming_ready):
+        self.calls['get_streaming_latest_values'] += 1
+        start_index = self.captured % self.buffer_size
+        count = min(self.batch, self.buffer_size - start_index)
+        if self.total is not None:
+            count = min(count, self.total - self.captured)
+        samples = numpy.arange(self.captured, self.captured + count)
+        for channel, array in self.registered.items():
+            array[start_index:start_index + count] = (samples + 1000 * self.PICO_CHANNEL[channel]) % 30000
+        overflow = 0
+        if self.overflow_at is not None and self.captured <= self.overflow_at < self.captured + count:
+            overflow = 0b10
+        triggered = self.trigger_at is not None and self.captured <= self.trigger_at < self.captured + count
+        trigger_at = self.trigger_at - self.captured if triggered else 0
+        self.captured += count
+        auto_stop = self.total is not None and self.captured >= self.total
+        streaming_ready(1, count, start_index, overflow, trigger_at, int(triggered), int(auto_stop), None)
+        self.polled.set()
+        return True
+
+
+def expected(start, count, channel=0):
+    return (numpy.arange(start, start + count) + 1000 * channel) % 30000
+
+
+class StreamTest(unittest.TestCase):
+    def setUp(self):
+        self.driver = FakeStreamingDriver()
+        self.device = Device(self.driver, 1)
+        self.device.set_channels(ChannelConfig('A', True, 'DC', 1.0), ChannelConfig('B', True, 'DC', 1.0))
+
+    def test_fixed_size_chunks(self):
+        with self.device.stream(1e-6, chunk_samples=1000, ring_chunks=4, max_samples=5500, poll_interval=0) as stream:
+            self.assertEqual(stream.channels, ('A', 'B'))
+            chunks = [(chunk.start, chunk.data.copy()) for chunk in stream]
+        self.assertEqual([start for start, _ in chunks], [0, 1000, 2000, 3000, 4000, 5000])
+        self.assertEqual([data.shape for _, data in chunks], [(2, 1000)] * 5 + [(2, 500)])
+        for start, data in chunks:
+            numpy.testing.assert_array_equal(data[0], expected(start, data.shape[1]))
+            numpy.testing.assert_array_equal(data[1], expected(start, data.shape[1], channel=1))
+        self.assertEqual(self.driver.calls['run_streaming'], 1)
+        self.assertEqual(self.driver.calls['stop'], 1)
+
+    def test_chunks_are_views_into_one_ring(self):
+        stream = Stream(self.device, 1e-6, chunk_samples=1000, ring_chunks=4, max_samples=20000, poll_interval=0)
+        ring = stream._sink.ring
+        for chunk in stream:
+            self.assertIsInstance(chunk, StreamChunk)
+            self.assertIs(chunk.data.base, ring)
+        self.assertIs(stream._sink.ring, ring)
+
+    def test_drops_samples_when_consumer_falls_behind(self):
+        stream = Stream(self.device, 1e-6, chunk_samples=1000, ring_chunks=4, drop=True, poll_interval=0)
+        first = next(stream)
+        # wait until the ring has filled up behind the chunk we hold.
+        while stream.samples_dropped == 0:
+            self.driver.polled.clear()
+            self.driver.polled.wait(1)
+        dropped = stream.samples_dropped
+        chunks = [first] + [next(stream) for _ in range(4)]
+        stream.stop()
+        self.assertEqual([chunk.start for chunk in chunks[:4]], [0, 1000, 2000, 3000])
+        # the samples after the ring filled up were dropped, then the stream carries on from where it got to.
+        self.assertGreaterEqual(chunks[4].start, 4000 + dropped)
+        self.assertGreater(chunks[4].dropped, 0)
+        numpy.testing.assert_array_equal(chunks[4].data[0], expected(chunks[4].start, 1000))
+        self.assertEqual(stream.samples_captured - stream.samples_dropped, stream._written)
+
+    def test_waits_for_consumer_without_drop(self):
+        stream = Stream(self.device, 1e-6, chunk_samples=1000, ring_chunks=4, poll_interval=0)
+        first = next(stream)
+        time.sleep(0.1)
+        # the stream stops taking samples from the driver once the ring can't fit another driver buffer.
+        self.assertLessEqual(stream.samples_captured, 4000)
+        captured = stream.samples_captured
+        time.sleep(0.05)
+        self.assertEqual(stream.samples_captured, captured)
+        numpy.testing.assert_array_equal(first.data[1], expected(0, 1000, channel=1))
+        starts = [first.start]
+        for _ in range(7):
+            chunk = next(stream)
+            starts.append(chunk.start)
+            self.assertEqual(chunk.dropped, 0)
+            numpy.testing.assert_array_equal(chunk.data[1], expected(chunk.start, 1000, channel=1))
+        stream.stop()
+        self.assertEqual(stream.samples_dropped, 0)
+        self.assertEqual(starts, list(range(0, 8000, 1000)))
+
+    def test_overflow_and_trigger(self):
+        self.driver.overflow_at = 1500
+        self.driver.trigger_at = 2345
+        with self.device.stream(1e-6, chunk_samples=1000, max_samples=3000, poll_interval=0) as stream:
+            chunks = [(chunk.overflow.tolist(), chunk.trigger_index) for chunk in stream]
+        self.assertEqual(chunks, [([False, False], None), ([False, True], None), ([False, False], 345)])
+
+    def test_device_auto_stop_ends_iteration(self):
+        self.driver.total = 2500
+        with self.device.stream(1e-6, chunk_samples=1000, poll_interval=0) as stream:
+            self.assertEqual([chunk.data.shape[1] for chunk in stream], [1000, 1000, 500])
+            self.assertIsNone(next(stream, None))
+
+    def test_ring_must_fit_driver_buffer(self):
+        with self.assertRaises(ArgumentOutOfRangeError):
+            Stream(self.device, 1e-6, chunk_samples=1000, ring_chunks=2, driver_buffer_size=5000)
+
+    def test_requires_streaming(self):
+        device = Device(FakeBlockDriver(), 1)
+        device.set_channels(ChannelConfig('A', True, 'DC', 1.0))
+        with self.assertRaises(FeatureNotSupportedError):
+            device.stream(1e-6)
+
+
+class StreamingRingSinkTest(unittest.TestCase):
+    def setUp(self):
+        self.driver = FakeStreamingDriver()
+        self.device = Device(self.driver, 1)
+
+    def sink(self, buffer_size=600, capacity=1000):
+        sink = StreamingRingSink(self.driver, ['B', 'A'], buffer_size, capacity)
+        self.driver.set_data_buffers(self.device, sink.buffers)
+        self.driver.run_streaming(self.device, 1e-6, buffer_size)
+        return sink
+
+    def test_reads_wrap_around_the_ring(self):
+        sink = self.sink()
+        read = []
+        for _ in range(20):
+            self.driver.get_streaming_latest_values(self.device, sink.callback)
+            while sink.available:
+                index, data = sink.read(max_samples=450)
+                self.assertIs(data.base, sink.ring)
+                read.append((index, data.copy()))
+                sink.release(data.shape[1])
+        self.assertEqual(sink.channels, ('A', 'B'))
+        self.assertEqual(sink.dropped, 0)
+        data = numpy.concatenate([data for _, data in read], axis=1)
+        numpy.testing.assert_array_equal(data[0], expected(0, 6000))
+        numpy.testing.assert_array_equal(data[1], expected(0, 6000, channel=1))
+        self.assertEqual([index for index, _ in read][:3], [0, 300, 600])
+
+    def test_drops_batches_which_do_not_fit(self):
+        sink = self.sink()
+        for _ in range(5):
+            self.driver.get_streaming_latest_values(self.device, sink.callback)
+        self.assertEqual((sink.write_index, sink.dropped), (900, 600))
+        sink.release(900)
+        self.driver.get_streaming_latest_values(self.device, sink.callback)
+        index, data = sink.read()
+        self.assertEqual((index, data.shape), (900, (2, 100)))
+        numpy.testing.assert_array_equal(data[0], expected(1500, 100))
+
+    def test_flags(self):
+        self.driver.overflow_at = 400
+        self.driver.trigger_at = 650
+        self.driver.total = 900
+        sink = self.sink()
+        while not sink.auto_stopped:
+            self.driver.get_streaming_latest_values(self.device, sink.callback)
+        self.assertEqual((sink.overflowed('A'), sink.overflowed('B')), (False, True))
+        self.assertEqual(sink.trigger_index, 650)
+
+    def test_consumer_on_another_thread(self):
+        self.driver.total = 200000
+        sink = self.sink(buffer_size=3000, capacity=5000)
+
+        def produce():
+            while not sink.auto_stopped:
+                # like a driver which waits for its own buffer to be emptied, rather than dropping samples.
+                if sink.capacity - sink.available >= self.driver.batch:
+                    self.driver.get_streaming_latest_values(self.device, sink.callback)
+        producer = threading.Thread(target=produce)
+        producer.start()
+        read = 0
+        while read < self.driver.total:
+            index, data = sink.read()
+            self.assertEqual(index, read)
+            numpy.testing.assert_array_equal(data[1], expected(index, data.shape[1], channel=1))
+            sink.release(data.shape[1])
+            read += data.shape[1]
+        producer.join()
+        self.assertEqual(sink.dropped, 0)
+
+
+class FakeDataInfoDriver(FakeBlockDriver):
+    """Like ps6000a: each poll writes up to batch samples of the counting signal into the oldest buffers added with
+    set_data_buffers, and reports them in the data infos."""
+    def __init__(self, batch=300, total=None, overflow_at=None, trigger_at=None, buffer_fill=None):
+        super(FakeDataInfoDriver, self).__init__()
+        self.batch = batch
+        # optionally, move on to the next buffer after this many samples, rather than when a buffer is full.
+        self.buffer_fill = buffer_fill
+        self.total = total
+        self.overflow_at = overflow_at
+        self.trigger_at = trigger_at
+        self.added = []
+        self.position = 0
+        self.captured = 0
+        self.buffer_index = 0
+
+    def can_stream_data_info(self):
+        return True
+
+    def clear_data_buffers(self, device):
+        self.calls['clear_data_buffers'] += 1
+        self.added = []
+
+    def set_data_buffers(self, device, buffers, segment_index=0):
+        self.calls['set_data_buffers'] += 1
+        self.added.append(buffers)
+
+    def run_streaming(self, device, sample_interval, buffer_size, pre_trigger_samples=0, post_trigger_samples=0,
+                      auto_stop=False):
+        self.calls['run_streaming'] += 1
+        return sample_interval
+
+    def get_streaming_latest_values_info(self, device, data_infos, trigger_info):
+        self.calls['get_streaming_latest_values_info'] += 1
+        for info in data_infos:
+            info.noOfSamples = 0
+            info.overflow = 0
+        trigger_info.triggered = 0
+        if not self.added:
+            return True
+        buffers = self.added[0]
+        size = len(next(iter(buffers.values())))
+        if self.buffer_fill is not None:
+            size = min(size, self.buffer_fill)
+        count = min(self.batch, size - self.position)
+        if self.total is not None:
+            count = min(count, self.total - self.captured)
+        samples = numpy.arange(self.captured, self.captured + count)
+        for info in data_infos:
+            channel = [name for name, value in self.PICO_CHANNEL.items() if value == info.channel][0]
+            buffers[channel][self.position:self.position + count] = (samples + 1000 * info.channel) % 30000
+            info.noOfSamples = count
+            info.startIndex = self.position
+            info.bufferIndex = self.buffer_index
+            info.overflow = int(info.channel == 1 and self.overflow_at is not None and
+                                self.captured <= self.overflow_at < self.captured + count)
+        if self.trigger_at is not None and self.captured <= self.trigger_at < self.captured + count:
+            trigger_info.triggered = 1
+            trigger_info.triggerAt = self.position + self.trigger_at - self.captured
+        self.captured += count
+        self.position += count
+        trigger_info.autoStop = int(self.total is not None and self.captured >= self.total)
+        if self.position == size:
+            self.added.pop(0)
+            self.buffer_index += 1
+            self.position = 0
+        return not self.added
+
+
+class PooledStreamTest(unittest.TestCase):
+    def setUp(self):
+        self.driver = FakeDataInfoDriver()
+        self.device = Device(self.driver, 1)
+
+    def test_buffers_rotate_through_the_pool(self):
+        buffers = []
+        with PooledStream(self.device, ['B', 'A'], 1e-8, buffer_samples=1000, pool_size=3, max_buffers=10,
+                          poll_interval=0) as stream:
+            self.assertEqual(stream.channels, ('A', 'B'))
+            for buffer in stream:
+                self.assertIsInstance(buffer, StreamBuffer)
+                self.assertIs(buffer.data.base, stream.pool)
+                numpy.testing.assert_array_equal(buffer.data[0], expected(buffer.start, 1000))
+                numpy.testing.assert_array_equal(buffer.data[1], expected(buffer.start, 1000, channel=1))
+                buffers.append((buffer.index, buffer.start, buffer.pool_index))
+                stream.release(buffer)
+        self.assertEqual([index for index, _, _ in buffers], list(range(10)))
+        self.assertEqual([start for _, start, _ in buffers], list(range(0, 10000, 1000)))
+        self.assertEqual(set(pool_index for _, _, pool_index in buffers), {0, 1, 2})
+        self.assertEqual(self.driver.calls['clear_data_buffers'], 1)
+        self.assertEqual(self.driver.calls['stop'], 1)
+
+    def test_unreleased_buffers_hold_up_the_stream(self):
+        with PooledStream(self.device, ['A'], 1e-8, buffer_samples=1000, pool_size=2, queued=1,
+                          poll_interval=0) as stream:
+            first = stream.get(timeout=1)
+            second = stream.get(timeout=1)
+            with self.assertRaises(queue.Empty):
+                stream.get(timeout=0.1)
+            stream.release(first)
+            third = stream.get(timeout=1)
+            self.assertEqual((third.start, third.pool_index), (2000, first.pool_index))
+            numpy.testing.assert_array_equal(third.data[0], expected(2000, 1000))
+            stream.release(second)
+            stream.release(third)
+
+    def test_held_buffers_do_not_spin_the_poll_thread(self):
+        with PooledStream(self.device, ['A'], 1e-8, buffer_samples=1000, pool_size=2, queued=2,
+                          poll_interval=0.01) as stream:
+            held = [stream.get(timeout=1), stream.get(timeout=1)]
+            polls = self.driver.calls['get_streaming_latest_values_info']
+            time.sleep(0.2)
+            # the driver is waiting for buffers, but there are none to give it until these are released.
+            self.assertLess(self.driver.calls['get_streaming_latest_values_info'] - polls, 40)
+            for buffer in held:
+                stream.release(buffer)
+
+    def test_driver_moving_to_the_next_buffer(self):
+        self.driver.buffer_fill = 600
+        with PooledStream(self.device, ['A'], 1e-8, buffer_samples=1000, max_buffers=3, poll_interval=0) as stream:
+            buffers = []
+            for buffer in stream:
+                buffers.append((buffer.start, buffer.data.shape[1]))
+                numpy.testing.assert_array_equal(buffer.data[0], expected(buffer.start, 600))
+                stream.release(buffer)
+        self.assertEqual(buffers, [(0, 600), (600, 600), (1200, 600)])
+
+    def test_overflow_trigger_and_auto_stop(self):
+        self.driver.overflow_at = 1500
+        self.driver.trigger_at = 2345
+        self.driver.total = 2500
+        with PooledStream(self.device, ['A', 'B'], 1e-8, buffer_samples=1000, poll_interval=0) as stream:
+            buffers = [(buffer.overflow.tolist(), buffer.trigger_index, buffer.data.shape[1]) for buffer in stream]
+        self.assertEqual(buffers, [([False, False], None, 1000), ([False, True], None, 1000),
+                                   ([False, False], 345, 500)])
+
+    def test_requires_data_info_streaming(self):
+        with self.assertRaises(FeatureNotSupportedError):
+            PooledStream(Device(FakeStreamingDriver(), 1), ['A'], 1e-8)
+
+
+class FakePs6000aClib(object):
+    """Stands in for the ps6000a shared library, with the ctypes signatures registered in picosdk.ps6000a: streams the
+    counting signal into the buffers added with ps6000aSetDataBuffer, a buffer set at a time."""
+    def __init__(self, batch=300):
+        self.batch = batch
+        self.added = []
+        self.position = 0
+        self.captured = 0
+        self.buffer_index = 0
+        self.calls = collections.Counter()
+        functions = {'ps6000aSetDataBuffer': self.set_data_buffer,
+                     'ps6000aRunStreaming': self.run_streaming,
+                     'ps6000aGetStreamingLatestValues': self.get_streaming_latest_values}
+        for symbol in ps6000a._symbols.values():
+            function = functions.get(symbol.c_name, self.not_called(symbol.c_name))
+            setattr(self, symbol.c_name, CFUNCTYPE(symbol.return_type, *symbol.argument_types)(function))
+
+    def not_called(self, c_name):
+        def record(*args):
+            self.calls[c_name] += 1
+            return 0
+        return record
+
+    def set_data_buffer(self, handle, channel, buffer, samples, data_type, segment, mode, action):
+        PICO_CLEAR_ALL = 1
+        if action == PICO_CLEAR_ALL:
+            self.added = []
+        elif self.added and channel not in self.added[-1]:
+            self.added[-1][channel] = (buffer, samples)
+        else:
+            self.added.append({channel: (buffer, samples)})
+        return 0
+
+    def run_streaming(self, handle, interval, time_units, pre, post, auto_stop, ratio, mode):
+        return 0
+
+    def get_streaming_latest_values(self, handle, data_infos, count, trigger_info):
+        infos = (picoStruct.PICO_STREAMING_DATA_INFO * count).from_address(data_infos)
+        picoStruct.PICO_STREAMING_DATA_TRIGGER_INFO.from_address(trigger_info).triggered = 0
+        if not self.added:
+            return ps6000a.PICO_STATUS['PICO_WAITING_FOR_DATA_BUFFERS']
+        buffers = self.added[0]
+        size = next(iter(buffers.values()))[1]
+        count = min(self.batch, size - self.position)
+        for info in infos:
+            address, _ = buffers[info.channel]
+            array = numpy.ctypeslib.as_array((c_int16 * size).from_address(address))
+            array[self.position:self.position + count] = expected(self.captured, count, channel=info.channel)
+            info.noOfSamples = count
+            info.startIndex = self.position
+            info.bufferIndex = self.buffer_index
+            info.overflow = 0
+        self.captured += count
+        self.position += count
+        if self.position == size:
+            self.added.pop(0)
+            self.buffer_index += 1
+            self.position = 0
+        return 0
+
+
+class Ps6000aPooledStreamTest(unittest.TestCase):
+    def test_pooled_stream_with_the_ps6000a_symbols(self):
+        driver = Library("ps6000a")
+        driver.__dict__.update({name: value for name, value in vars(ps6000a).items() if name.isupper()})
+        driver._symbols = dict(ps6000a._symbols)
+        driver._loaded_clib = clib = FakePs6000aClib()
+        device = Device(driver, 1)
+        with device.pooled_stream(['B', 'A'], 1e-8, buffer_samples=1000, pool_size=3, max_buffers=5,
+                                  poll_interval=0) as stream:
+            starts = []
+            for buffer in stream:
+                starts.append(buffer.start)
+                numpy.testing.assert_array_equal(buffer.data[0], expected(buffer.start, 1000))
+                numpy.testing.assert_array_equal(buffer.data[1], expected(buffer.start, 1000, channel=1))
+                stream.release(buffer)
+        self.assertEqual(starts, [0, 1000, 2000, 3000, 4000])
+        self.assertEqual(clib.calls['ps6000aStop'], 1)
+
+
+class LibraryDataInfoTest(unittest.TestCase):
+    def setUp(self):
+        self.driver = Library("fake")
+        self.driver.PICO_STATUS = {'PICO_OK': 0, 'PICO_BUSY': 0x27, 'PICO_WAITING_FOR_DATA_BUFFERS': 0x197}
+        self.driver.StreamingReadyType = FakeStreamingDriver.StreamingReadyType
+        self.device = Device(self.driver, 1)
+        self.calls = []
+
+    def test_ps6000a_run_streaming(self):
+        def run_streaming(handle, interval, time_units, pre, post, auto_stop, ratio, mode):
+            self.calls.append((interval._obj.value, time_units.value, post.value))
+            interval._obj.value = 12.5
+            return 0
+        self.driver._run_streaming = Function([c_int16, c_void_p, c_uint32, c_uint64, c_uint64, c_int16, c_uint64,
+                                               c_uint32], run_streaming)
+        self.driver._get_streaming_latest_values = Function([c_int16, c_void_p, c_uint64, c_void_p])
+        self.assertFalse(self.driver.can_stream())
+        self.assertTrue(self.driver.can_stream_data_info())
+        interval = self.driver.run_streaming(self.device, 1e-8, 1000, post_trigger_samples=1000)
+        self.assertEqual(self.calls, [(10., 2, 1000)])
+        self.assertAlmostEqual(interval, 12.5e-9)
+
+    def test_waiting_for_data_buffers(self):
+        self.driver._get_streaming_latest_values = Function([c_int16, c_void_p, c_uint64, c_void_p],
+                                                            lambda handle, infos, count, trigger: 0x197)
+        self.assertTrue(self.driver.get_streaming_latest_values_info(self.device, (c_int16 * 1)(), c_int16()))
+
+
+if __name__ == '__main__':
+    unittest.main()
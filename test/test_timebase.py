@@ -9,9 +9,13 @@ from __future__ import print_function
 
 from test.test_helpers import DriverTest, drivers_with_device_connected
 import unittest
-from picosdk.library import TimebaseInfo
+from picosdk.library import Library, TimebaseInfo, TimebaseFormula
 from picosdk.errors import InvalidTimebaseError, NoValidTimebaseForOptionsError
-from picosdk.device import Device, TimebaseOptions
+from picosdk.device import Device, TimebaseOptions, ChannelConfig
+from picosdk.functions import CacheInfo
+from picosdk.ps5000a import ps5000a
+from test.test_rapid_block import Function
+from ctypes import CFUNCTYPE, c_double, c_float, c_int16, c_int32, c_uint32, c_uint64, c_void_p
 import math
 
 
@@ -157,3 +161,154 @@ class TimebaseValidationTest(unittest.TestCase):
                                 segment_id=0)
 
         self.assertFalse(Device._validate_timebase(request, response))
+
+
+class FakeTimebaseDriver(Library):
+    """Answers get_timebase from a TimebaseFormula, counting the calls made."""
+    def __init__(self, formula, first_id=0, last_id=2**32 - 1, max_samples=10**6):
+        super(FakeTimebaseDriver, self).__init__("fake")
+        self.formula = formula
+        self.TIMEBASE_FORMULA = formula
+        self.first_id = first_id
+        self.last_id = last_id
+        self.max_samples = max_samples
+        self.calls = 0
+
+    def get_timebase(self, device, timebase_id, no_of_samples, oversample=1, segment_index=0):
+        self.calls += 1
+        if not self.first_id <= timebase_id <= self.last_id:
+            raise InvalidTimebaseError()
+        return TimebaseInfo(timebase_id, self.formula.time_interval(timebase_id), None, self.max_samples, 0)
+
+    def set_channel(self, device, channel_name='A', enabled=True, coupling='DC', range_peak=float('inf'),
+                    analog_offset=None):
+        return range_peak
+
+    def memory_segments(self, device, number_segments):
+        return c_int32(self.max_samples // number_segments)
+
+    def set_resolution(self, device, resolution):
+        pass
+
+
+class TimebaseSearchTest(unittest.TestCase):
+    ps4000a_formula = TimebaseFormula(0, 80e6, 80e6, -1)
+    ps6000a_formula = TimebaseFormula(5, 5e9, 156.25e6, 4)
+
+    def linear_search(self, driver, options):
+        """the smallest valid timebase, found by brute force."""
+        for timebase_id in range(driver.first_id, driver.last_id + 1):
+            info = driver.get_timebase(None, timebase_id, 0)
+            if Device._validate_timebase(options, info):
+                return info
+
+    def test_formula_round_trip(self):
+        for formula in (self.ps4000a_formula, self.ps6000a_formula):
+            for timebase_id in range(20):
+                self.assertEqual(formula.timebase_id(formula.time_interval(timebase_id)), timebase_id)
+
+    def test_matches_linear_search(self):
+        for formula in (self.ps4000a_formula, self.ps6000a_formula, None):
+            for first_id in (0, 3):
+                for min_collection_time in (1e-6, 1.234e-3, 0.05):
+                    options = TimebaseOptions(max_time_interval=1e-3, min_collection_time=min_collection_time)
+                    driver = FakeTimebaseDriver(formula or self.ps4000a_formula, first_id=first_id, last_id=10**5,
+                                                max_samples=10**4)
+                    expected = self.linear_search(driver, options)
+                    driver.TIMEBASE_FORMULA = formula
+                    driver.calls = 0
+                    self.assertEqual(Device(driver, 1).find_timebase(options), expected)
+                    self.assertLess(driver.calls, 4 + first_id + 2 * math.log(10**5, 2))
+
+    def test_slow_timebases_take_few_calls(self):
+        driver = FakeTimebaseDriver(self.ps4000a_formula, max_samples=1000)
+        info = Device(driver, 1).find_timebase(TimebaseOptions(min_collection_time=10.0))
+        # 10s over 1000 samples needs a 10ms interval: timebase 799999.
+        self.assertEqual(info.timebase_id, 799999)
+        self.assertLessEqual(driver.calls, 3)
+
+    def test_too_slow_for_the_device(self):
+        driver = FakeTimebaseDriver(self.ps6000a_formula, last_id=1000)
+        with self.assertRaises(NoValidTimebaseForOptionsError):
+            Device(driver, 1).find_timebase(TimebaseOptions(min_collection_time=100.0))
+        self.assertLess(driver.calls, 30)
+
+    def test_interval_too_short_for_the_device(self):
+        driver = FakeTimebaseDriver(self.ps6000a_formula, first_id=2)
+        with self.assertRaises(NoValidTimebaseForOptionsError):
+            Device(driver, 1).find_timebase(TimebaseOptions(max_time_interval=1e-10))
+        self.assertEqual(driver.calls, 3)
+
+
+class TimebaseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.driver = FakeTimebaseDriver(TimebaseFormula(0, 80e6, 80e6, -1), max_samples=1000)
+        self.device = Device(self.driver, 1)
+        self.device.set_channel(ChannelConfig('A', True, 'DC', 1.0))
+        self.options = TimebaseOptions(min_collection_time=0.01)
+
+    def test_repeated_searches_make_no_driver_calls(self):
+        first = self.device.find_timebase(self.options)
+        calls = self.driver.calls
+        for _ in range(10):
+            self.assertEqual(self.device.find_timebase(self.options), first)
+        self.assertEqual(self.driver.calls, calls)
+        self.assertEqual(self.device.timebase_cache_info(), CacheInfo(10, 1, None, 1))
+
+    def test_configuration_changes_miss(self):
+        self.device.find_timebase(self.options)
+        self.device.set_channel(ChannelConfig('B', True, 'DC', 1.0))
+        self.device.find_timebase(self.options)
+        self.device.memory_segments(4)
+        self.device.find_timebase(self.options)
+        self.device.set_resolution(1)
+        self.device.find_timebase(self.options)
+        self.assertEqual(self.device.timebase_cache_info().misses, 4)
+        # the same channels again, and the same range on A, is still cached.
+        self.device.set_channel(ChannelConfig('A', True, 'DC', 1.0))
+        self.device.find_timebase(self.options)
+        self.assertEqual(self.device.timebase_cache_info().hits, 1)
+
+    def test_clear(self):
+        self.device.find_timebase(self.options)
+        self.device.clear_timebase_cache()
+        self.assertEqual(self.device.timebase_cache_info(), CacheInfo(0, 0, None, 0))
+
+
+class GetTimebaseFormsTest(unittest.TestCase):
+    def driver_with(self, name, argtypes, interval_type, max_samples_type):
+        # a real C function pointer, so that ctypes checks the argument types as it would for the driver.
+        def get_timebase(handle, timebase_id, no_of_samples, time_interval, max_samples, segment_index):
+            interval_type.from_address(time_interval).value = 12.5 * (timebase_id + 1)
+            max_samples_type.from_address(max_samples).value = 2**33 if max_samples_type is c_uint64 else 1000
+            return 0
+        driver = Library("fake")
+        driver.PICO_STATUS = {'PICO_OK': 0}
+        driver._get_timebase = Function(argtypes)
+        function = CFUNCTYPE(c_uint32, *argtypes)(get_timebase)
+        function.argtypes = argtypes
+        setattr(driver, name, function)
+        return driver
+
+    def test_ps4000a_get_timebase2(self):
+        driver = self.driver_with('_get_timebase2', [c_int16, c_uint32, c_int32, c_void_p, c_void_p, c_uint32],
+                                  c_float, c_int32)
+        info = driver.get_timebase(Device(driver, 1), 3, 100)
+        self.assertEqual((info.timebase_id, info.max_samples), (3, 1000))
+        self.assertAlmostEqual(info.time_interval, 50e-9)
+
+    def test_ps6000a_get_timebase(self):
+        driver = self.driver_with('_get_timebase', [c_int16, c_uint32, c_uint64, c_void_p, c_void_p, c_uint64],
+                                  c_double, c_uint64)
+        info = driver.get_timebase(Device(driver, 1), 7, 100)
+        self.assertEqual(info.max_samples, 2**33)
+        self.assertAlmostEqual(info.time_interval, 100e-9)
+
+    def test_ps5000a_formula_follows_resolution(self):
+        resolutions = ps5000a.PS5000A_DEVICE_RESOLUTION
+        self.assertAlmostEqual(ps5000a.timebase_formula().time_interval(10), 64e-9)
+        self.assertAlmostEqual(ps5000a.timebase_formula(resolutions["PS5000A_DR_15BIT"]).time_interval(10), 64e-9)
+        for resolution in ("PS5000A_DR_12BIT", "PS5000A_DR_16BIT"):
+            formula = ps5000a.timebase_formula(resolutions[resolution])
+            self.assertAlmostEqual(formula.time_interval(4), 16e-9)
+            self.assertAlmostEqual(formula.time_interval(10), 112e-9)